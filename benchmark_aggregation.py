@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime
+from functools import reduce
+
+import numpy as np
+
+# I moduli dell'app Flower si importano come top-level (come fa server_app.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytorchtest"))
+
+from aggregation import AggregationKernel, StreamingAggregator  # noqa: E402
+
+# Il pool di buffer occupa almeno questo multiplo dell'ultimo livello di cache
+POOL_CACHE_FACTOR = 2
+# Ultimo livello di cache se /sys non è leggibile (MB)
+DEFAULT_LLC_MB = 32
+
+
+def print_separator(char="=", length=80):
+    print(char * length)
+
+
+def print_header(message):
+    print_separator("=")
+    print(f"🚀 {message}")
+    print_separator("=")
+
+
+def parse_list(values, cast=int):
+    """Parsing di liste separate da virgola (accetta anche 1e6)"""
+    return [cast(float(x.strip())) for x in values.split(",")]
+
+
+def reference_aggregate(results):
+    """Aggregazione di FedAvg (flwr.server.strategy.aggregate.aggregate)"""
+    num_examples_total = sum(num_examples for (_, num_examples) in results)
+    weighted_weights = [
+        [layer * num_examples for layer in weights] for weights, num_examples in results
+    ]
+    return [
+        reduce(np.add, layer_updates) / num_examples_total
+        for layer_updates in zip(*weighted_weights)
+    ]
+
+
+def last_level_cache_bytes():
+    """Dimensione dell'ultimo livello di cache della CPU da /sys (None se non disponibile)"""
+    best_level, best_size = 0, None
+    for index in glob.glob("/sys/devices/system/cpu/cpu0/cache/index*"):
+        try:
+            with open(os.path.join(index, "level")) as f:
+                level = int(f.read())
+            with open(os.path.join(index, "size")) as f:
+                size = f.read().strip()
+        except (OSError, ValueError):
+            continue
+        units = {"K": 2**10, "M": 2**20, "G": 2**30}
+        size_bytes = int(size[:-1]) * units[size[-1]] if size[-1] in units else int(size)
+        if level >= best_level:
+            best_level, best_size = level, size_bytes
+    return best_size
+
+
+def split_layers(num_params, num_layers):
+    """Forme di num_layers layer di dimensione quasi uguale per un totale di num_params"""
+    size, extra = divmod(num_params, num_layers)
+    return [(size + (1 if i < extra else 0),) for i in range(num_layers)]
+
+
+def net_layer_shapes():
+    """Forme dei layer del modello reale (task.Net); None se torch non è installato"""
+    try:
+        from task import Net, get_weights
+    except ImportError as e:
+        print(f"⚠️  task.Net non disponibile ({e}): salto il caso multi-layer reale")
+        return None
+    return [layer.shape for layer in get_weights(Net())]
+
+
+def parse_models(params_list, layers):
+    """
+    Modelli da misurare come (nome, forme dei layer)
+
+    Un intero L divide ogni valore di --params in L layer; "net" aggiunge il
+    modello reale con le forme di task.Net (overhead per layer di FedAvg).
+    """
+    models = []
+    tokens = [token.strip() for token in layers.split(",") if token.strip()]
+    for num_params in params_list:
+        for token in tokens:
+            if token != "net":
+                num_layers = int(token)
+                models.append((f"{num_layers} layer", split_layers(num_params, num_layers)))
+    if "net" in tokens:
+        shapes = net_layer_shapes()
+        if shapes is not None:
+            models.append((f"task.Net ({len(shapes)} layer)", shapes))
+    return models
+
+
+def pool_size_for(model_bytes, min_pool, llc_bytes):
+    """Buffer del pool: almeno min_pool e abbastanza da superare l'ultimo livello di cache"""
+    return max(min_pool, math.ceil(POOL_CACHE_FACTOR * llc_bytes / model_bytes))
+
+
+def make_pool(shapes, pool_size, seed=0):
+    """
+    Buffer sintetici dei client
+
+    Con 1000 client e 100M parametri servirebbero 400 GB: si genera un pool di
+    pool_size buffer distinti e i client li riusano a rotazione. Il costo della
+    riduzione non cambia perché ogni client viene comunque letto per intero.
+    Il pool supera l'ultimo livello di cache, quindi i buffer non restano in
+    cache tra una misura e l'altra (come i risultati che arrivano dalla rete).
+    """
+    rng = np.random.default_rng(seed)
+    return [[rng.standard_normal(shape, dtype=np.float32) for shape in shapes] for _ in range(pool_size)]
+
+
+class ClientResults:
+    """
+    Risultati dei client presi dal pool a rotazione
+
+    Ogni chiamata parte dal buffer successivo all'ultimo usato: una misura
+    legge buffer non toccati da quando sono usciti dalla cache.
+    """
+
+    def __init__(self, pool, num_clients):
+        self.pool = pool
+        self.num_clients = num_clients
+        self.offset = 0
+
+    def __call__(self):
+        pool_size = len(self.pool)
+        results = [
+            (self.pool[(self.offset + i) % pool_size], 1 + i % 50) for i in range(self.num_clients)
+        ]
+        self.offset = (self.offset + self.num_clients) % pool_size
+        return results
+
+
+def time_call(fn, repeat, make_input):
+    """Tempo minimo su repeat esecuzioni; l'input di ogni esecuzione è preparato fuori dal tempo"""
+    best = float("inf")
+    for _ in range(repeat):
+        inputs = make_input()
+        start = time.perf_counter()
+        fn(inputs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del kernel di aggregazione con molti client")
+    parser.add_argument('--clients', default='10,100,1000', help='Numeri di client (es: 10,100,1000)')
+    parser.add_argument('--params', default='1e5,1e6,1e7,1e8', help='Parametri del modello (es: 1e6,1e8)')
+    parser.add_argument('--threads', default=str(os.cpu_count() or 1), help='Thread del kernel (es: 1,4,8)')
+    parser.add_argument('--layers', default='1,net',
+                        help='Layer per modello: un intero divide --params in L layer, "net" usa task.Net (es: 1,16,net)')
+    parser.add_argument('--pool', type=int, default=4,
+                        help='Buffer sintetici distinti minimi (il pool supera comunque l\'ultimo livello di cache)')
+    parser.add_argument('--llc-mb', type=float, default=None,
+                        help='Ultimo livello di cache in MB (default: letto da /sys)')
+    parser.add_argument('--repeat', type=int, default=3, help='Ripetizioni per misura (si tiene il minimo)')
+    parser.add_argument('--reference-max-gb', type=float, default=2.0,
+                        help='Esegue il riferimento FedAvg solo se i temporanei stanno in questa memoria')
+    parser.add_argument('--round-seconds', type=float, default=None,
+                        help='Durata di un round (round_seconds nella tabella rounds di pytorchtest/experiments.db) '
+                             'per stimare il peso dell\'aggregazione')
+    parser.add_argument('--output', default=None, help='File JSON in cui salvare i risultati')
+    args = parser.parse_args()
+
+    clients_list = parse_list(args.clients)
+    params_list = parse_list(args.params)
+    threads_list = parse_list(args.threads)
+    models = parse_models(params_list, args.layers)
+    llc_bytes = args.llc_mb * 2**20 if args.llc_mb else last_level_cache_bytes() or DEFAULT_LLC_MB * 2**20
+
+    print_header("BENCHMARK AGGREGAZIONE")
+    print(f"👥 Client: {clients_list}")
+    print(f"🧠 Parametri: {params_list}, layer: {args.layers}")
+    print(f"🧵 Thread: {threads_list}")
+    print(f"🗄️  Ultimo livello di cache: {llc_bytes / 2**20:.0f} MB")
+
+    results = []
+    for model_name, shapes in models:
+        num_params = sum(int(np.prod(shape)) for shape in shapes)
+        model_bytes = num_params * 4
+        pool_size = pool_size_for(model_bytes, args.pool, llc_bytes)
+        pool_gb = pool_size * model_bytes / 1e9
+        print_separator("-", 60)
+        print(f"📦 Modello da {num_params:,} parametri, {model_name} (pool {pool_size} buffer, {pool_gb:.2f} GB)")
+        pool = make_pool(shapes, pool_size)
+
+        for num_clients in clients_list:
+            client_results = ClientResults(pool, num_clients)
+            bytes_read = num_clients * model_bytes
+
+            reference_seconds = None
+            if bytes_read / 1e9 <= args.reference_max_gb:
+                reference_seconds = time_call(reference_aggregate, args.repeat, client_results)
+
+            for num_threads in threads_list:
+                kernel = AggregationKernel(num_threads=num_threads)
+                batch_seconds = time_call(kernel.weighted_sum, args.repeat, client_results)
+
+                def stream(fit_results):
+                    aggregator = StreamingAggregator(kernel=kernel)
+                    for ndarrays, num_examples in fit_results:
+                        aggregator.add(ndarrays, num_examples)
+                    aggregator.result()
+
+                stream_seconds = time_call(stream, args.repeat, client_results)
+                kernel.close()
+
+                row = {
+                    "clients": num_clients,
+                    "params": num_params,
+                    "layers": len(shapes),
+                    "model": model_name,
+                    "pool_buffers": pool_size,
+                    "threads": num_threads,
+                    "kernel_seconds": round(batch_seconds, 4),
+                    "streaming_seconds": round(stream_seconds, 4),
+                    "reference_seconds": round(reference_seconds, 4) if reference_seconds else None,
+                    "kernel_gb_per_s": round(bytes_read / batch_seconds / 1e9, 2),
+                }
+                if args.round_seconds:
+                    row["round_fraction"] = round(batch_seconds / args.round_seconds, 4)
+                results.append(row)
+
+                speedup = f"{reference_seconds / batch_seconds:.1f}x" if reference_seconds else "n/a"
+                print(
+                    f"   N={num_clients:<5} T={num_threads:<3} kernel {batch_seconds:8.3f}s "
+                    f"({row['kernel_gb_per_s']:6.2f} GB/s), streaming {stream_seconds:8.3f}s, "
+                    f"speedup vs FedAvg: {speedup}"
+                )
+                if args.round_seconds and batch_seconds > 0.1 * args.round_seconds:
+                    print(f"   ⚠️  L'aggregazione supera il 10% del round ({row['round_fraction']:.1%})")
+
+        del pool
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"timestamp": datetime.now().isoformat(), "results": results}, f, indent=4)
+        print(f"💾 Risultati salvati in {args.output}")
+
+    print_header("BENCHMARK COMPLETATO")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import time
+
+import numpy as np
+
+# I moduli dell'app Flower si importano come top-level (come fa server_app.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytorchtest"))
+
+from edge import EdgeAggregator, serve_member  # noqa: E402
+
+
+def print_separator(char="=", length=80):
+    print(char * length)
+
+
+def print_header(message):
+    print_separator("=")
+    print(f"🚀 {message}")
+    print_separator("=")
+
+
+def synthetic_fit_fn(leaf_id, num_params):
+    """Aggiornamento deterministico per foglia e round, senza training reale"""
+    state = {"round": 0}
+
+    def fit_fn(ndarrays, config):
+        state["round"] += 1
+        rng = np.random.default_rng(1000 * leaf_id + state["round"])
+        update = ndarrays[0] + rng.standard_normal(num_params, dtype=np.float32)
+        return [update], 100 + 10 * leaf_id, {}
+
+    return fit_fn
+
+
+def leaf_process(address, leaf_id, num_params):
+    serve_member(address, synthetic_fit_fn(leaf_id, num_params))
+
+
+def edge_process(root_address, group_size, port_queue):
+    """Edge: root vede un solo membro, che a sua volta aggrega group_size foglie"""
+    edge = EdgeAggregator(host="127.0.0.1", port=0, group_size=group_size).start()
+    port_queue.put(edge.port)
+    try:
+        serve_member(root_address, lambda ndarrays, config: edge.fit_round(ndarrays, config))
+    finally:
+        edge.close()
+
+
+def run_topology(num_leaves, num_edges, num_params, rounds):
+    """
+    Esegue rounds round sulla topologia e misura il traffico in ingresso alla root
+
+    Returns:
+        tuple: (byte ricevuti dalla root, modello finale, secondi)
+    """
+    root_members = num_edges if num_edges else num_leaves
+    root = EdgeAggregator(host="127.0.0.1", port=0, group_size=root_members).start()
+    root_address = f"127.0.0.1:{root.port}"
+    processes = []
+
+    if num_edges:
+        port_queue = mp.Queue()
+        groups = np.array_split(np.arange(num_leaves), num_edges)
+        for group in groups:
+            process = mp.Process(target=edge_process, args=(root_address, len(group), port_queue))
+            process.start()
+            processes.append(process)
+            edge_address = f"127.0.0.1:{port_queue.get()}"
+            for leaf_id in group:
+                process = mp.Process(target=leaf_process, args=(edge_address, int(leaf_id), num_params))
+                process.start()
+                processes.append(process)
+    else:
+        for leaf_id in range(num_leaves):
+            process = mp.Process(target=leaf_process, args=(root_address, leaf_id, num_params))
+            process.start()
+            processes.append(process)
+
+    model = [np.zeros(num_params, dtype=np.float32)]
+    start_time = time.time()
+    for _ in range(rounds):
+        partial_sum, total_examples, _ = root.fit_round(model)
+        model = [layer / total_examples for layer in partial_sum]
+    elapsed = time.time() - start_time
+
+    root.close()
+    for process in processes:
+        process.join(timeout=30)
+    return root.bytes_received, model, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Traffico in ingresso alla root: topologia piatta vs edge")
+    parser.add_argument('--leaves', type=int, default=8, help='Numero di supernode foglia')
+    parser.add_argument('--edges', type=int, default=2, help='Numero di aggregatori edge')
+    parser.add_argument('--params', type=float, default=1e6, help='Parametri del modello')
+    parser.add_argument('--rounds', type=int, default=3, help='Round da eseguire')
+    args = parser.parse_args()
+    num_params = int(args.params)
+
+    print_header("BENCHMARK AGGREGAZIONE GERARCHICA")
+    print(f"🍃 Foglie: {args.leaves}, 🛰️  Edge: {args.edges}, 🧠 Parametri: {num_params:,}, 🔄 Round: {args.rounds}")
+
+    flat_bytes, flat_model, flat_seconds = run_topology(args.leaves, 0, num_params, args.rounds)
+    edge_bytes, edge_model, edge_seconds = run_topology(args.leaves, args.edges, num_params, args.rounds)
+
+    max_diff = float(np.abs(flat_model[0] - edge_model[0]).max())
+    print_separator("-", 60)
+    print(f"📥 Ingresso root piatta:     {flat_bytes / 1e6:10.2f} MB ({flat_seconds:.2f}s)")
+    print(f"📥 Ingresso root gerarchica: {edge_bytes / 1e6:10.2f} MB ({edge_seconds:.2f}s)")
+    print(f"📉 Riduzione: {flat_bytes / edge_bytes:.1f}x")
+    print(f"🎯 Differenza massima tra i modelli finali: {max_diff:.2e}")
+
+    if edge_bytes >= flat_bytes or max_diff > 1e-3:
+        print("❌ La topologia gerarchica non riduce il traffico o non aggrega correttamente")
+        sys.exit(1)
+    print_header("BENCHMARK COMPLETATO")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+# I moduli dell'app Flower si importano come top-level (come fa server_app.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytorchtest"))
+
+from dataset_cache import (  # noqa: E402
+    DATASET,
+    DatasetChecksumError,
+    build_cache,
+    load_cached_dataset,
+    resolve_snapshot,
+    verify_snapshot,
+)
+
+
+def print_separator(char="=", length=80):
+    print(char * length)
+
+
+def print_header(message):
+    print_separator("=")
+    print(f"🚀 {message}")
+    print_separator("=")
+
+
+def build(args):
+    """Scarica il dataset (serve la rete) e ne crea lo snapshot"""
+    start = time.time()
+    snapshot = build_cache(args.cache_dir, args.dataset)
+    manifest = verify_snapshot(snapshot)
+    size = sum(entry["size"] for entry in manifest["files"].values())
+    print(f"✅ Snapshot {os.path.basename(snapshot)[:12]}… creato in {time.time() - start:.1f}s")
+    print(f"   📦 {len(manifest['files'])} file, {size / 1e6:.1f} MB → {snapshot}")
+    print(f"   ➡️  Copiare {args.cache_dir} sui nodi e impostare dataset-cache = \"{args.cache_dir}\"")
+    return 0
+
+
+def verify(args):
+    """Verifica checksum e caricamento dello snapshot con la rete disattivata"""
+    # Le librerie Hugging Face non provano a contattare l'Hub
+    os.environ["HF_DATASETS_OFFLINE"] = "1"
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    start = time.time()
+    try:
+        snapshot = resolve_snapshot(args.cache_dir, args.dataset)
+        verify_snapshot(snapshot)
+        print(f"✅ Checksum validi ({time.time() - start:.1f}s): {snapshot}")
+        dataset = load_cached_dataset(args.cache_dir, args.dataset, verify=False)
+    except (FileNotFoundError, DatasetChecksumError) as e:
+        print(f"❌ {e}")
+        return 1
+    for split, data in dataset.items():
+        print(f"   📊 {split}: {len(data)} campioni")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache locale del dataset per nodi senza rete")
+    parser.add_argument('command', choices=['build', 'verify'],
+                        help='build: scarica e crea lo snapshot; verify: controlla checksum e caricamento offline')
+    parser.add_argument('--cache-dir', default='dataset_cache', help='Directory della cache')
+    parser.add_argument('--dataset', default=DATASET, help='Dataset Hugging Face')
+    args = parser.parse_args()
+
+    print_header(f"CACHE DATASET: {args.command} {args.dataset}")
+    return build(args) if args.command == "build" else verify(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""pytorchtest: aggregazione dei pesi dei client su buffer piatti."""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Elementi per chunk: 256K float32 = 1 MB, resta in cache L2 durante la riduzione
+DEFAULT_CHUNK_SIZE = 1 << 18
+
+# Metrica con cui un aggregatore edge segnala che i pesi sono una somma parziale
+# Σ n_i·w_i (non una media) e num_examples è il totale Σ n_i del gruppo
+PARTIAL_SUM_KEY = "partial-sum"
+
+
+class FlatLayout:
+    """Forma, dtype e offset di ogni layer all'interno di un buffer piatto"""
+
+    def __init__(self, ndarrays):
+        self.shapes = [layer.shape for layer in ndarrays]
+        self.dtypes = [layer.dtype for layer in ndarrays]
+        self.sizes = [int(layer.size) for layer in ndarrays]
+        self.offsets = [int(offset) for offset in np.cumsum([0] + self.sizes)[:-1]]
+        self.total_size = int(sum(self.sizes))
+        # Accumulo almeno in float32 (anche per eventuali layer interi)
+        self.acc_dtype = np.result_type(np.float32, *self.dtypes)
+
+    def views(self, flat):
+        """Viste (senza copia) dei singoli layer dentro il buffer piatto"""
+        return [
+            flat[offset:offset + size].reshape(shape)
+            for offset, size, shape in zip(self.offsets, self.sizes, self.shapes)
+        ]
+
+    def unflatten(self, flat):
+        """Layer con il dtype originale (copia solo se il dtype cambia)"""
+        return [
+            view.astype(dtype, copy=False)
+            for view, dtype in zip(self.views(flat), self.dtypes)
+        ]
+
+
+class AggregationKernel:
+    """
+    Riduzione pesata multi-thread su buffer piatti
+
+    Il lavoro viene diviso in chunk distribuiti su un thread pool: le ufunc di
+    numpy rilasciano il GIL, quindi i chunk vengono ridotti in parallelo.
+    Moltiplicazione e somma scrivono in buffer preallocati (out=), senza
+    temporanei per client e per layer.
+    """
+
+    def __init__(self, num_threads=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.num_threads = max(1, num_threads or os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self._pool = ThreadPoolExecutor(max_workers=self.num_threads) if self.num_threads > 1 else None
+        self._local = threading.local()
+        self._output = None
+
+    def _scratch(self, size, dtype):
+        """Buffer temporaneo per thread, allocato una sola volta"""
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None or scratch.size < size or scratch.dtype != dtype:
+            scratch = np.empty(max(size, self.chunk_size), dtype=dtype)
+            self._local.scratch = scratch
+        return scratch[:size]
+
+    def _tasks(self, layout):
+        """Chunk (layer, offset, start, stop) su cui dividere la riduzione"""
+        tasks = []
+        for layer, (offset, size) in enumerate(zip(layout.offsets, layout.sizes)):
+            for start in range(0, size, self.chunk_size):
+                tasks.append((layer, offset, start, min(start + self.chunk_size, size)))
+        return tasks
+
+    def _run(self, kernel, tasks):
+        if self._pool is None or len(tasks) == 1:
+            for task in tasks:
+                kernel(*task)
+        else:
+            # list() propaga eventuali eccezioni dei worker
+            list(self._pool.map(kernel, *zip(*tasks)))
+
+    def output_buffer(self, layout):
+        """Buffer di output preallocato e riusato tra i round"""
+        if (
+            self._output is None
+            or self._output.size != layout.total_size
+            or self._output.dtype != layout.acc_dtype
+        ):
+            self._output = np.empty(layout.total_size, dtype=layout.acc_dtype)
+        return self._output
+
+    def accumulate(self, acc, layout, ndarrays, weight, first=False):
+        """
+        acc += weight · ndarrays, in place sul buffer piatto acc
+
+        Args:
+            acc: Buffer piatto di accumulo
+            layout: FlatLayout del modello
+            ndarrays: Layer di un client
+            weight: Peso del client
+            first: Se True inizializza acc invece di sommare
+        """
+        flat_layers = [np.ravel(layer) for layer in ndarrays]
+
+        def kernel(layer, offset, start, stop):
+            dst = acc[offset + start:offset + stop]
+            src = flat_layers[layer][start:stop]
+            if first:
+                np.multiply(src, weight, out=dst, casting="unsafe")
+            else:
+                scratch = self._scratch(stop - start, acc.dtype)
+                np.multiply(src, weight, out=scratch, casting="unsafe")
+                np.add(dst, scratch, out=dst)
+
+        self._run(kernel, self._tasks(layout))
+
+    def weighted_sum(self, results, out=None, partial=None):
+        """
+        Media pesata di una lista di risultati [(ndarrays, num_examples), ...]
+
+        Ogni chunk di output somma i contributi di tutti i client prima di
+        passare al successivo, così l'accumulatore resta in cache.
+
+        Args:
+            results: Lista di (ndarrays, num_examples)
+            out: Buffer piatto di output (default: buffer preallocato del kernel)
+            partial: Flag per risultato; True se ndarrays è già una somma
+                parziale Σ n_i·w_i di un aggregatore edge
+
+        Returns:
+            list: Layer aggregati (viste sul buffer di output, valide fino alla
+            prossima aggregazione)
+        """
+        layout = FlatLayout(results[0][0])
+        if out is None:
+            out = self.output_buffer(layout)
+
+        num_examples_total = sum(num_examples for _, num_examples in results)
+        if partial is None:
+            partial = [False] * len(results)
+        # Una somma parziale contiene già il fattore n_i: va solo normalizzata
+        weights = [
+            (1.0 if is_partial else num_examples) / num_examples_total
+            for (_, num_examples), is_partial in zip(results, partial)
+        ]
+        flat_results = [[np.ravel(layer) for layer in ndarrays] for ndarrays, _ in results]
+
+        def kernel(layer, offset, start, stop):
+            dst = out[offset + start:offset + stop]
+            scratch = self._scratch(stop - start, out.dtype)
+            np.multiply(flat_results[0][layer][start:stop], weights[0], out=dst, casting="unsafe")
+            for flat_layers, weight in zip(flat_results[1:], weights[1:]):
+                np.multiply(flat_layers[layer][start:stop], weight, out=scratch, casting="unsafe")
+                np.add(dst, scratch, out=dst)
+
+        self._run(kernel, self._tasks(layout))
+        return layout.unflatten(out)
+
+    def close(self):
+        """Chiude il thread pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+class StreamingAggregator:
+    """Somma pesata incrementale dei risultati di fit.
+
+    Ogni risultato viene sommato all'accumulatore appena arriva e può essere
+    rilasciato subito: l'accumulatore è O(modello) invece di O(N·modello)
+    e alla fine del round resta solo una divisione. Il buffer di accumulo
+    viene riusato tra un round e l'altro. Le risposte non ancora sommate
+    dipendono da chi le scarica: driver_loop.pull_replies ne tiene al più
+    PULL_BATCH_SIZE per pull.
+    """
+
+    def __init__(self, kernel=None):
+        self.kernel = kernel if kernel is not None else AggregationKernel(num_threads=1)
+        self.layout = None
+        self.sums = None
+        self.total_examples = 0
+        self.num_results = 0
+
+    def add(self, ndarrays, num_examples, partial=False):
+        """
+        Accumula i pesi di un client, pesati per il numero di esempi
+
+        Con partial=True ndarrays è la somma parziale di un aggregatore edge
+        e num_examples il totale del suo gruppo.
+        """
+        if num_examples <= 0:
+            return
+        first = self.num_results == 0
+        if first:
+            layout = FlatLayout(ndarrays)
+            if self.sums is None or self.sums.size != layout.total_size or self.sums.dtype != layout.acc_dtype:
+                self.sums = np.empty(layout.total_size, dtype=layout.acc_dtype)
+            self.layout = layout
+        weight = 1.0 if partial else num_examples
+        self.kernel.accumulate(self.sums, self.layout, ndarrays, weight, first=first)
+        self.total_examples += num_examples
+        self.num_results += 1
+
+    def partial_sum(self):
+        """Somma parziale Σ n_i·w_i non normalizzata, da inoltrare al livello superiore"""
+        if self.num_results == 0:
+            return None
+        return self.layout.views(self.sums)
+
+    def result(self):
+        """
+        Chiude il round e restituisce la media pesata (None se non è arrivato nulla)
+
+        La divisione avviene in place: i layer restituiti sono validi fino al
+        prossimo add() dopo reset().
+        """
+        if self.num_results == 0 or self.total_examples == 0:
+            return None
+        np.divide(self.sums, self.total_examples, out=self.sums)
+        return self.layout.unflatten(self.sums)
+
+    def reset(self):
+        """Azzera i contatori per il round successivo (il buffer resta allocato)"""
+        self.layout = None
+        self.total_examples = 0
+        self.num_results = 0
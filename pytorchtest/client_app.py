@@ -1,6 +1,7 @@
 """pytorchtest: A Flower / PyTorch app."""
 
 from multiprocessing import context
+import atexit
 import torch
 import wandb
 import os
@@ -8,114 +9,95 @@ import hashlib
 import json
 import socket
 import time
-from datetime import datetime
+from collections import OrderedDict
 
 from flwr.client import ClientApp, NumPyClient
-from flwr.common import Context
-from task import Net, get_weights, load_data, set_weights, test, train
+from flwr.common import (
+    Code,
+    ConfigsRecord,
+    Context,
+    GetPropertiesRes,
+    MessageTypeLegacy,
+    ParametersRecord,
+    RecordSet,
+    Status,
+    array_from_numpy,
+)
+from flwr.common import recordset_compat as compat
+from task import (
+    Net,
+    PhaseTimer,
+    accuracy_confidence_interval,
+    get_weights,
+    load_data,
+    set_weights,
+    subsample_loader,
+    test,
+    train,
+    warm_up,
+)
+from aggregation import StreamingAggregator
+from edge import EdgeAggregator
+from timeline import clock_sync_mod
+from warmup import WARMUP_KEY, WARMUP_STEPS_KEY
+from metrics_sink import make_metrics_sink
+from resources import ResourceSampler
 
 # wandb integration
 os.environ["WANDB_API_KEY"] = "c9ecc4c3eeac8445768b6c97a55298ddd835562d"
 os.environ["WANDB_SILENT"] = "true"
 
-# Percorsi ai file condivisi
-CURRENT_PATH = "pytorchtest/current_id.json"      
-CLIENT_PATH = "pytorchtest/client_id.json"     
-
-def load_json_safe(path, default=None):
-    """Carica un file JSON in modo sicuro, gestendo file mancanti o corrotti"""
-    if not os.path.exists(path):
-        return default if default is not None else {}
-    try:
-        with open(path, "r") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
-        return default if default is not None else {}
-
-def save_json_safe(path, data):
-    """Salva un file JSON in modo sicuro"""
-    try:
-        with open(path, "w") as f:
-            json.dump(data, f, indent=4)
-        return True
-    except IOError:
-        return False
-
-def wait_for_experiment_info(timeout=30):
+# Record del Context.state del nodo con i contatori dei round e lo stato dell'ottimizzatore
+COUNTERS_RECORD = "round-counters"
+OPTIMIZER_RECORD = "optimizer-state"
+# Metadati dell'esperimento ricevuti dal server (inviati solo nei primi config)
+EXPERIMENT_RECORD = "experiment"
+
+def experiment_info_from_config(config):
     """
-    Attende che le informazioni dell'esperimento siano disponibili
+    Metadati dell'esperimento inviati dal server nel config di fit/evaluate
     
-    Args:
-        timeout: Tempo massimo di attesa in secondi
-        
     Returns:
-        dict: Informazioni dell'esperimento o None se timeout
+        dict: Informazioni dell'esperimento o None se il config non le contiene
     """
-    start_time = time.time()
-    printed_waiting = False
-    
-    while time.time() - start_time < timeout:
-        if os.path.exists(CURRENT_PATH):
-            experiment_info = load_json_safe(CURRENT_PATH)
-            if experiment_info and "group_name" in experiment_info:
-                return experiment_info
-        
-        if not printed_waiting:
-            print("⏳ Attendo informazioni esperimento...")
-            printed_waiting = True
-        time.sleep(1)
-    
-    return None
+    if "experiment-group" not in config:
+        return None
+    return {
+        "experiment_id": int(config["experiment-id"]),
+        "group_name": str(config["experiment-group"]),
+        "client_number": int(config["client-number"]),
+        "nodes": config.get("experiment-nodes", "unknown"),
+        "rounds": config.get("experiment-rounds", "unknown"),
+        "epochs": config.get("experiment-epochs", "unknown"),
+    }
 
-def register_client_in_experiment(experiment_info):
+class RoundLog:
     """
-    Registra questo client nell'esperimento corrente
+    Log locale append-only (JSONL) dello storico dei round del client
     
-    Args:
-        experiment_info: Informazioni dell'esperimento
-        
-    Returns:
-        tuple: (group_name, client_name)
+    Sostituisce rounds_tracker.json: niente lettura né riscrittura dell'intero
+    file ad ogni round. Il file resta aperto con un buffer, quindi una riga
+    costa una scrittura in memoria; il buffer va su disco quando è pieno o
+    alla chiusura del processo.
     """
-    group_name = experiment_info["group_name"]
-    hostname = socket.gethostname()
-    
-    # Carica il registro dei client
-    client_registry = load_json_safe(CLIENT_PATH, {})
-    
-    # Inizializza il gruppo se non esiste
-    if group_name not in client_registry:
-        client_registry[group_name] = {
-            "clients": {},
-            "experiment_info": experiment_info,
-            "created_at": datetime.now().isoformat()
-        }
-    
-    group_clients = client_registry[group_name]["clients"]
-    
-    # Se il client è già registrato, restituisce il nome esistente
-    if hostname in group_clients:
-        client_name = group_clients[hostname]["client_name"]
-        print(f"🔄 Client già registrato come: {client_name}")
-        return group_name, client_name
-    
-    # Altrimenti, registra un nuovo client
-    client_number = len(group_clients) + 1
-    client_name = f"{group_name}_CLIENT_{client_number:02d}"
     
-    # Registra il client con informazioni dettagliate
-    group_clients[hostname] = {
-        "client_name": client_name,
-        "hostname": hostname,
-        "registered_at": datetime.now().isoformat(),
-        "client_number": client_number
-    }
+    def __init__(self, path):
+        self.path = path
+        self._file = None
     
-    # Salva il registro aggiornato
-    if save_json_safe(CLIENT_PATH, client_registry):
-        print(f"✅ Client registrato: {client_name} (#{client_number})")
+    def append(self, **record):
+        if self._file is None:
+            self._file = open(self.path, "a", buffering=1 << 16)
+        self._file.write(json.dumps(record) + "\n")
     
-    return group_name, client_name
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+round_log = RoundLog(f"pytorchtest/rounds_log_{socket.gethostname()}.jsonl")
+atexit.register(round_log.close)
 
 def generate_wandb_id(name):
     """Genera un ID deterministic per wandb basato sul nome"""
@@ -185,94 +167,237 @@ def setup_wandb_tracking(group_name, client_name, experiment_info):
 # Define Flower Client and client_fn
 class FlowerClient(NumPyClient):
     
-    def __init__(self, net, trainloader, valloader, local_epochs, partition_id, run, num_partitions, client_name):
+    def __init__(self, net, trainloader, valloader, local_epochs, partition_id, num_partitions, node_context,
+                 eval_samples=0, persist_optimizer_state=False, resource_interval=0.5, virtual_index=None):
         self.net = net
         self.trainloader = trainloader
         self.valloader = valloader
+        # Sottoinsieme fisso (deterministico) del validation set usato in evaluate
+        self.evalloader = subsample_loader(valloader, eval_samples)
         self.local_epochs = local_epochs
         self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
         self.net.to(self.device)
-        self.run = run
         self.partition_id = partition_id
         self.num_partitions = num_partitions
-        self.client_name = client_name
+        # Sink delle metriche creato al primo fit/evaluate con i metadati del server
+        self.metrics = None
+        self.client_name = f"partition_{partition_id}"
+        # Context del nodo (o del client virtuale) ricevuto da client_fn: la proprietà
+        # context di NumPyClient è deprecata e registra un warning ad ogni accesso
+        self.node_context = node_context
         
-        # File unico per tutti i round
-        self.rounds_file = "pytorchtest/rounds_tracker.json"
-        self.client_key = f"{client_name}_{partition_id}"
+        # Stato di Adam conservato nel Context.state tra un round e l'altro
+        self.persist_optimizer_state = persist_optimizer_state
+        # Intervallo di campionamento di CPU, memoria e I/O durante fit/evaluate (0 = disattivato)
+        self.resource_interval = resource_interval
+        # Posizione nel supernode virtuale (None = unico client del nodo)
+        self.virtual_index = virtual_index
         
-        print(f"💻 {client_name} pronto - Device: {self.device}, Samples: {len(trainloader.dataset)}")
+        # Impostati da client_fn ad ogni chiamata: latenza di avvio e riuso dalla cache
+        self.startup_seconds = 0.0
+        self.cache_hit = False
         
-        # Aggiorna wandb config con info specifiche del client
-        run.config.update({
-            "partition_id": partition_id,
-            "total_partitions": num_partitions,
-        }, allow_val_change=True)
+        print(f"💻 Partizione {partition_id} pronta - Device: {self.device}, Samples: {len(trainloader.dataset)}")
     
-    def get_and_increment_round(self, operation):
-        """Gestisce il contatore dei round tramite file unico"""
-        rounds_data = load_json_safe(self.rounds_file, {})
+    def ensure_tracking(self, config):
+        """
+        Crea il sink delle metriche al primo fit/evaluate
+        
+        I metadati dell'esperimento arrivano nel config solo finché il server
+        non ha ricevuto una risposta dal nodo: vengono conservati nel
+        Context.state, così restano disponibili anche se il client viene
+        ricostruito (client-cache = false). wandb.init viene eseguito dal
+        thread del sink, non qui.
+        """
+        records = self.node_context.state.configs_records
+        experiment_info = experiment_info_from_config(config)
+        if experiment_info is not None:
+            records[EXPERIMENT_RECORD] = ConfigsRecord(experiment_info)
+        elif EXPERIMENT_RECORD in records:
+            experiment_info = dict(records[EXPERIMENT_RECORD])
+        
+        if self.metrics is not None:
+            return
         
-        # Inizializza il client se non esiste
-        if self.client_key not in rounds_data:
-            rounds_data[self.client_key] = {"train_rounds": 0, "eval_rounds": 0}
+        if not experiment_info:
+            print("❌ Fallback naming")
+            group_name = f"FALLBACK_GROUP_{int(time.time())}"
+            client_name = self.client_name = f"{group_name}_CLIENT_{socket.gethostname()}"
+            
+            def wandb_init():
+                return wandb.init(
+                    project="CNN_Stage", 
+                    entity="damiano-cannizzaro-universit-di-torino",
+                    group=group_name, 
+                    name=client_name, 
+                    id=generate_wandb_id(client_name),
+                    reinit=False, 
+                    resume="allow"
+                )
+        else:
+            group_name = experiment_info["group_name"]
+            client_name = f"{group_name}_CLIENT_{experiment_info['client_number']:02d}"
+            if self.virtual_index is not None:
+                client_name += f"_V{self.virtual_index:02d}"
+            self.client_name = client_name
+            print(f"✅ Client registrato: {client_name} (#{experiment_info['client_number']})")
+            
+            def wandb_init():
+                return setup_wandb_tracking(group_name, client_name, experiment_info)
         
-        client_rounds = rounds_data[self.client_key]
+        run_config = self.node_context.run_config
+        self.metrics = make_metrics_sink(
+            run_config.get("metrics-backend", "noop"),
+            spool_path=f"pytorchtest/metrics_spool/{client_name}.jsonl",
+            wandb_init=wandb_init,
+            file_path=f"pytorchtest/metrics/{client_name}.jsonl",
+            queue_size=run_config.get("metrics-queue-size", 1024),
+            batch_size=run_config.get("metrics-batch-size", 32),
+            flush_interval=float(run_config.get("metrics-flush-interval", 2.0)),
+        )
+        
+        # Aggiorna wandb config con info specifiche del client
+        self.metrics.update_config({
+            "partition_id": self.partition_id,
+            "total_partitions": self.num_partitions,
+        })
+    
+    def get_and_increment_round(self, operation):
+        """
+        Contatore dei round nel Context.state del nodo
         
-        if operation == "train":
-            client_rounds["train_rounds"] += 1
-            current_round = client_rounds["train_rounds"]
-        else:  # evaluate
-            client_rounds["eval_rounds"] += 1
-            current_round = client_rounds["eval_rounds"]
+        Il Context resta al SuperNode per tutta la run: nessun file condiviso
+        da leggere e riscrivere ad ogni round.
+        """
+        state = self.node_context.state
+        if COUNTERS_RECORD not in state.configs_records:
+            state.configs_records[COUNTERS_RECORD] = ConfigsRecord({"train_rounds": 0, "eval_rounds": 0})
+        counters = state.configs_records[COUNTERS_RECORD]
         
-        save_json_safe(self.rounds_file, rounds_data)
-        return current_round
+        key = "train_rounds" if operation == "train" else "eval_rounds"
+        counters[key] += 1
+        return counters[key]
+    
+    def load_optimizer_state(self):
+        """Stato dell'ottimizzatore salvato nel Context.state (None se non va conservato)"""
+        if not self.persist_optimizer_state:
+            return None
+        record = self.node_context.state.parameters_records.get(OPTIMIZER_RECORD)
+        return {key: array.numpy() for key, array in record.items()} if record else {}
+    
+    def save_optimizer_state(self, arrays):
+        if arrays is None:
+            return
+        self.node_context.state.parameters_records[OPTIMIZER_RECORD] = ParametersRecord(
+            OrderedDict((key, array_from_numpy(array)) for key, array in arrays.items())
+        )
 
     def fit(self, parameters, config):
         """Training del modello locale"""
         current_round = self.get_and_increment_round("train")
+        start_timestamp = time.time()
+        timer = PhaseTimer()
+        sampler = ResourceSampler(self.resource_interval)
+        sampler.start()
+        fit_start = time.perf_counter()
+        with timer.phase("tracking_setup"):
+            self.ensure_tracking(config)
         
         print(f"🏋️ [{self.client_name}] Round {current_round} - Training...")
         
         #Training status
         # self.run.log({f"{self.client_name}_status": 1}, commit = False)
 
-        set_weights(self.net, parameters)
+        with timer.phase("set_weights"):
+            set_weights(self.net, parameters)
+        
+        # Valutazione fusa: il modello globale ricevuto viene valutato prima del training
+        eval_metrics = {}
+        if config.get("fused-eval", False):
+            with timer.phase("fused_evaluation"):
+                eval_loss, eval_accuracy = test(self.net, self.evalloader, self.device)
+            eval_metrics = {
+                "eval_loss": eval_loss,
+                "eval_accuracy": eval_accuracy,
+                "eval_examples": len(self.evalloader.dataset),
+            }
+            self.metrics.log({"evaluate_loss": eval_loss, "evaluate_accuracy": eval_accuracy}, commit=False)
+            print(f"🧪 Modello ricevuto - Loss: {eval_loss:.4f}, Accuracy: {eval_accuracy:.4f}")
+        
+        train_timer = PhaseTimer()
+        optimizer_state = self.load_optimizer_state()
+        train_start = time.perf_counter()
         train_loss = train(
             self.net,
             self.trainloader,
             self.local_epochs,
             self.device,
+            timer=train_timer,
+            optimizer_state=optimizer_state,
         )
+        train_seconds = time.perf_counter() - train_start
+        self.save_optimizer_state(optimizer_state)
         
-        # Log su wandb (solo metriche numeriche)
-        self.run.log({"train_loss": train_loss}, commit=False)
+        # Log delle metriche (solo numeriche), inviate in background dal sink
+        self.metrics.log({"train_loss": train_loss}, commit=False)
         
         #Idle status 
         # self.run.log({f"{self.client_name}_status": 0})
 
-        print(f"✅ Training Loss: {train_loss:.4f}")
+        with timer.phase("get_weights"):
+            weights = get_weights(self.net)
+        sampler.stop()
+        
+        # Tempi per fase: il server li confronta con il proprio round trip
+        timing_metrics = {
+            **sampler.metrics(),
+            **self.startup_metrics(),
+            **timer.metrics(),
+            **train_timer.metrics(),
+            "time_fit": round(time.perf_counter() - fit_start, 6),
+            "samples_per_second": round(train_timer.samples / max(train_seconds, 1e-9), 2),
+            # Istanti assoluti (orologio del client) per la timeline del server
+            "start_timestamp": start_timestamp,
+            "end_timestamp": time.time(),
+        }
+        print(f"✅ Training Loss: {train_loss:.4f} ({timing_metrics['samples_per_second']:.0f} campioni/s)")
+        round_log.append(
+            client=self.client_name, partition_id=self.partition_id, operation="train",
+            round=current_round, train_loss=train_loss, timestamp=timing_metrics["end_timestamp"],
+        )
         
         return (
-            get_weights(self.net),
+            weights,
             len(self.trainloader.dataset),
-            {"train_loss": train_loss},
+            {"train_loss": train_loss, **eval_metrics, **timing_metrics},
         )
 
     def evaluate(self, parameters, config):
         """Valutazione del modello"""
         current_round = self.get_and_increment_round("eval")
+        start_timestamp = time.time()
+        timer = PhaseTimer()
+        sampler = ResourceSampler(self.resource_interval)
+        sampler.start()
+        evaluate_start = time.perf_counter()
+        with timer.phase("tracking_setup"):
+            self.ensure_tracking(config)
         print(f"🧪 [{self.client_name}] Round {current_round} - Valutazione...")
         
         #Evaluation status
         # self.run.log({f"{self.client_name}_status": 2}, commit=False)
 
-        set_weights(self.net, parameters)
-        loss, accuracy = test(self.net, self.valloader, self.device)
+        with timer.phase("set_weights"):
+            set_weights(self.net, parameters)
+        test_start = time.perf_counter()
+        loss, accuracy = test(self.net, self.evalloader, self.device, timer=timer)
+        test_seconds = time.perf_counter() - test_start
+        sampler.stop()
+        num_examples = len(self.evalloader.dataset)
+        ci_low, ci_high = accuracy_confidence_interval(accuracy, num_examples)
         
-        # Log finale su wandb (solo metriche numeriche)
-        self.run.log({
+        # Log finale delle metriche (solo numeriche), inviate in background dal sink
+        self.metrics.log({
             "evaluate_loss": loss,
             "evaluate_accuracy": accuracy,
         })
@@ -280,26 +405,323 @@ class FlowerClient(NumPyClient):
         #Idle status 
         # self.run.log({f"{self.client_name}_status": 0})
 
-        print(f"✅ Loss: {loss:.4f}, Accuracy: {accuracy:.4f}")
+        print(f"✅ Loss: {loss:.4f}, Accuracy: {accuracy:.4f} (IC 95% {ci_low:.4f}-{ci_high:.4f}, {num_examples} campioni)")
         
         try:
-            return loss, len(self.valloader.dataset), {"accuracy": accuracy}
+            return loss, num_examples, {
+                "accuracy": accuracy,
+                "accuracy_ci_low": ci_low,
+                "accuracy_ci_high": ci_high,
+                **self.startup_metrics(),
+                **timer.metrics(),
+                **sampler.metrics(),
+                "time_evaluate": round(time.perf_counter() - evaluate_start, 6),
+                "samples_per_second": round(timer.samples / max(test_seconds, 1e-9), 2),
+                "start_timestamp": start_timestamp,
+                "end_timestamp": time.time(),
+            }
         finally:
+            round_log.append(
+                client=self.client_name, partition_id=self.partition_id, operation="eval",
+                round=current_round, loss=loss, accuracy=accuracy, timestamp=time.time(),
+            )
             print(f"🏁 Round {current_round} completato")
-            self.run.finish()
+    
+    def warm_up(self, steps):
+        """Passi di training fittizi (pesi ripristinati) prima del primo round"""
+        warm_up(self.net, self.trainloader, self.device, steps=steps)
+    
+    def startup_metrics(self):
+        """Latenza di client_fn per questa chiamata (costruzione completa o riuso dalla cache)"""
+        return {
+            "time_client_startup": round(self.startup_seconds, 6),
+            "client_cache_hit": int(self.cache_hit),
+        }
+    
+    def close_metrics(self):
+        """Invia le metriche in coda e chiude il sink (e la run wandb)"""
+        if self.metrics is not None:
+            self.metrics.close()
+
+class EdgeClient(NumPyClient):
+    """Supernode edge: pre-aggrega gli aggiornamenti del proprio gruppo di nodi"""
+    
+    def __init__(self, edge):
+        self.edge = edge
+    
+    def fit(self, parameters, config):
+        """Inoltra il modello al gruppo e restituisce la somma parziale Σ n_i·w_i"""
+        print(f"🛰️  Edge: fit su {self.edge.group_size} nodi...")
+        partial_sum, num_examples, metrics = self.edge.fit_round(parameters, config)
+        print(f"✅ Edge: somma parziale di {metrics['edge-clients']} nodi, {num_examples} esempi")
+        return partial_sum, num_examples, metrics
+    
+    def evaluate(self, parameters, config):
+        """Valutazione federata sul gruppo, pesata per numero di esempi"""
+        return self.edge.evaluate_round(parameters, config)
+
+
+class VirtualNodeClient(NumPyClient):
+    """
+    Supernode che serve K client logici (partizioni) da un solo processo
+    
+    I client virtuali condividono il modello (un solo Net, i pesi vengono
+    reimpostati ad ogni client) e il dataset in memoria (il FederatedDataset
+    di task.load_data è unico per processo); vengono eseguiti uno dopo l'altro
+    con il budget di thread di torch del nodo. I loro aggiornamenti vengono
+    sommati subito in uno StreamingAggregator: al server arriva la media pesata
+    del nodo con il totale degli esempi, come da un client con K partizioni.
+    
+    Le metriche separano l'overhead per client (tempo di ogni client virtuale
+    fuori dal training) da quello per nodo (ciclo sui client e aggregazione).
+    """
+    
+    # Fasi di calcolo di un client virtuale; il resto del suo tempo è overhead per client
+    COMPUTE_PHASES = ("time_data_loading", "time_forward_backward", "time_optimizer_step",
+                      "time_forward", "time_fused_evaluation")
+    
+    def __init__(self, clients, resource_interval=0.5):
+        self.clients = clients
+        self.aggregator = StreamingAggregator()
+        self.resource_interval = resource_interval
+        # Impostati da client_fn ad ogni chiamata: latenza di avvio e riuso dalla cache
+        self.startup_seconds = 0.0
+        self.cache_hit = False
+    
+    def node_metrics(self, reports, client_seconds, node_seconds, total_key):
+        """
+        Tempi del nodo: somma per fase dei client, overhead per client e per nodo
+        
+        Args:
+            reports: Metriche restituite dai client virtuali
+            client_seconds: Durata di ogni chiamata ai client virtuali
+            node_seconds: Durata totale della chiamata al nodo
+            total_key: time_fit o time_evaluate
+        """
+        phases = {}
+        for metrics in reports:
+            for name, value in metrics.items():
+                if name.startswith("time_") and name not in (total_key, "time_client_startup"):
+                    phases[name] = phases.get(name, 0.0) + float(value)
+        client_overheads = [
+            seconds - sum(float(metrics.get(name, 0.0)) for name in self.COMPUTE_PHASES)
+            for metrics, seconds in zip(reports, client_seconds)
+        ]
+        return {
+            **{name: round(value, 6) for name, value in phases.items()},
+            total_key: round(node_seconds, 6),
+            "virtual_clients": len(self.clients),
+            "time_virtual_client_mean": round(sum(client_seconds) / len(client_seconds), 6),
+            "time_virtual_client_max": round(max(client_seconds), 6),
+            "time_virtual_client_overhead": round(sum(client_overheads) / len(client_overheads), 6),
+            "time_node_overhead": round(node_seconds - sum(client_seconds), 6),
+        }
+    
+    def fit(self, parameters, config):
+        """Training dei K client virtuali; restituisce la media pesata del nodo"""
+        start_timestamp = time.time()
+        node_start = time.perf_counter()
+        sampler = ResourceSampler(self.resource_interval)
+        sampler.start()
+        print(f"🧩 Nodo virtuale: fit di {len(self.clients)} client...")
+        
+        self.aggregator.reset()
+        reports, client_seconds = [], []
+        train_samples = 0
+        for client in self.clients:
+            client_start = time.perf_counter()
+            weights, num_examples, metrics = client.fit(parameters, config)
+            client_seconds.append(time.perf_counter() - client_start)
+            # Somma prima del client successivo: i pesi restituiti sono viste sul Net condiviso
+            self.aggregator.add(weights, num_examples)
+            reports.append((num_examples, metrics))
+            train_samples += num_examples * client.local_epochs
+        weights = self.aggregator.result()
+        num_examples = self.aggregator.total_examples
+        sampler.stop()
+        node_seconds = time.perf_counter() - node_start
+        
+        metrics = {
+            "train_loss": sum(n * m["train_loss"] for n, m in reports) / num_examples,
+            **self.node_metrics([m for _, m in reports], client_seconds, node_seconds, "time_fit"),
+            **sampler.metrics(),
+            "time_client_startup": round(self.startup_seconds, 6),
+            "client_cache_hit": int(self.cache_hit),
+            "samples_per_second": round(train_samples / max(node_seconds, 1e-9), 2),
+            "start_timestamp": start_timestamp,
+            "end_timestamp": time.time(),
+        }
+        # Valutazione fusa: media pesata sui campioni valutati da tutti i client virtuali
+        evaluations = [m for _, m in reports if "eval_examples" in m]
+        if evaluations:
+            eval_examples = sum(int(m["eval_examples"]) for m in evaluations)
+            metrics["eval_examples"] = eval_examples
+            for name in ("eval_loss", "eval_accuracy"):
+                metrics[name] = sum(int(m["eval_examples"]) * m[name] for m in evaluations) / eval_examples
+        print(
+            f"✅ Nodo virtuale: {len(self.clients)} client in {node_seconds:.1f}s "
+            f"(overhead nodo {metrics['time_node_overhead']:.3f}s, "
+            f"per client {metrics['time_virtual_client_overhead']:.3f}s)"
+        )
+        return weights, num_examples, metrics
+    
+    def evaluate(self, parameters, config):
+        """Valutazione dei K client virtuali, pesata per numero di esempi"""
+        start_timestamp = time.time()
+        node_start = time.perf_counter()
+        sampler = ResourceSampler(self.resource_interval)
+        sampler.start()
+        
+        results, client_seconds = [], []
+        for client in self.clients:
+            client_start = time.perf_counter()
+            results.append(client.evaluate(parameters, config))
+            client_seconds.append(time.perf_counter() - client_start)
+        sampler.stop()
+        node_seconds = time.perf_counter() - node_start
+        
+        num_examples = sum(n for _, n, _ in results)
+        loss = sum(n * client_loss for client_loss, n, _ in results) / num_examples
+        accuracy = sum(n * m["accuracy"] for _, n, m in results) / num_examples
+        ci_low, ci_high = accuracy_confidence_interval(accuracy, num_examples)
+        print(f"✅ Nodo virtuale: Loss {loss:.4f}, Accuracy {accuracy:.4f} ({len(self.clients)} client)")
+        return loss, num_examples, {
+            "accuracy": accuracy,
+            "accuracy_ci_low": ci_low,
+            "accuracy_ci_high": ci_high,
+            **self.node_metrics([m for _, _, m in results], client_seconds, node_seconds, "time_evaluate"),
+            **sampler.metrics(),
+            "time_client_startup": round(self.startup_seconds, 6),
+            "client_cache_hit": int(self.cache_hit),
+            "samples_per_second": round(num_examples / max(node_seconds, 1e-9), 2),
+            "start_timestamp": start_timestamp,
+            "end_timestamp": time.time(),
+        }
+    
+    def warm_up(self, steps):
+        """Il modello è condiviso: basta il warm-up del primo client virtuale"""
+        self.clients[0].warm_up(steps)
+    
+    def close_metrics(self):
+        for client in self.clients:
+            client.close_metrics()
+
+
+# L'aggregatore edge deve sopravvivere tra una chiamata di client_fn e l'altra
+edge_aggregator = None
+
+
+def get_edge_aggregator(node_config):
+    """Avvia (una sola volta per processo) l'aggregatore edge del supernode"""
+    global edge_aggregator
+    if edge_aggregator is None:
+        edge_aggregator = EdgeAggregator(
+            port=node_config.get("edge-port", 9095),
+            group_size=node_config["edge-group-size"],
+            round_timeout=node_config.get("edge-round-timeout", 0),
+        ).start()
+    return edge_aggregator
+
+
+# Client già costruiti, per (run_id, node_id): modello, loader, sink delle metriche e contatori
+client_cache = {}
+
+
+def invalidate_client_cache(run_id=None):
+    """
+    Rimuove dalla cache i client di run diverse da run_id (tutti se None)
+    
+    I sink delle metriche dei client rimossi (e le run wandb) vengono chiusi
+    qui, non più ad ogni evaluate.
+    """
+    for key in [key for key in client_cache if run_id is None or key[0] != run_id]:
+        client_cache.pop(key).close_metrics()
+
+
+atexit.register(invalidate_client_cache)
+
 
 def client_fn(context: Context):
-    """Funzione principale del client - ogni chiamata è un nuovo processo"""
+    """
+    Funzione principale del client, chiamata da Flower per ogni messaggio
+    
+    Il FlowerClient viene costruito una sola volta per (run_id, node_id) e
+    riusato dalle chiamate successive dello stesso processo; una nuova run
+    invalida la cache. Con client-cache = false si ricostruisce tutto ad ogni
+    chiamata (comportamento precedente, per confrontare la latenza di avvio).
+    """
+    startup_start = time.perf_counter()
+    
+    # Supernode edge: nessun dato locale, aggrega i nodi del proprio gruppo
+    if context.node_config.get("edge-group-size", 0) > 0:
+        return EdgeClient(get_edge_aggregator(context.node_config)).to_client()
+    
+    client, cache_hit = get_flower_client(context)
+    client.startup_seconds = time.perf_counter() - startup_start
+    client.cache_hit = cache_hit
+    return client.to_client()
+
+
+def get_flower_client(context: Context):
+    """
+    FlowerClient del nodo, dalla cache o costruito ora
+    
+    Returns:
+        tuple: (FlowerClient, True se riusato dalla cache)
+    """
+    use_cache = context.run_config.get("client-cache", True)
+    key = (context.run_id, context.node_id)
+    client = client_cache.get(key) if use_cache else None
+    if client is not None:
+        return client, True
+    invalidate_client_cache(context.run_id)
+    client = build_flower_client(context)
+    if use_cache:
+        client_cache[key] = client
+    return client, False
+
+
+def warmup_mod(msg, context, call_next):
+    """
+    Mod del ClientApp: warm-up del supernode su richiesta del server
+    
+    Costruisce il client (download e partizionamento dei dati, modello) e lo
+    lascia nella cache di client_fn, poi esegue qualche passo fittizio: il
+    round 1 trova tutto pronto e misura solo il training. Sui supernode edge
+    non c'è nulla da preparare.
+    """
+    if msg.metadata.message_type != MessageTypeLegacy.GET_PROPERTIES:
+        return call_next(msg, context)
+    ins = compat.recordset_to_getpropertiesins(msg.content)
+    if not ins.config.get(WARMUP_KEY, False):
+        return call_next(msg, context)
     
+    warmup_start = time.perf_counter()
+    properties = {"time_client_build": 0.0, "time_dummy_steps": 0.0, "client_cache_hit": 0}
+    if context.node_config.get("edge-group-size", 0) == 0:
+        client, cache_hit = get_flower_client(context)
+        properties["time_client_build"] = time.perf_counter() - warmup_start
+        properties["client_cache_hit"] = int(cache_hit)
+        steps_start = time.perf_counter()
+        client.warm_up(int(ins.config.get(WARMUP_STEPS_KEY, 2)))
+        properties["time_dummy_steps"] = time.perf_counter() - steps_start
+    properties["warmup_seconds"] = time.perf_counter() - warmup_start
+    print(f"🔥 Warm-up completato in {properties['warmup_seconds']:.1f}s")
+    
+    res = GetPropertiesRes(status=Status(code=Code.OK, message=""), properties=properties)
+    return msg.create_reply(compat.getpropertiesres_to_recordset(res))
+
+
+def node_setting(context: Context, key, default):
+    """Impostazione del nodo: node_config ha la precedenza sul config della run"""
+    return context.node_config.get(key, context.run_config.get(key, default))
+
+
+def build_flower_client(context: Context):
+    """Costruisce modello e loader del client (o dei client virtuali del nodo)"""
     print("🚀 Inizializzazione client Flower...")
     print("🧠 Caricamento modello e dati...")
     
-    # Load model and data
-    net = Net()
-    partition_id = context.node_config["partition-id"]
-    num_partitions = context.node_config["num-partitions"]
-    local_epochs = context.run_config["local-epochs"]
-    
     # Leggi parametri di scaling dal config
     scaling_mode = context.run_config.get("scaling-mode", "strong")
     samples_per_client = context.run_config.get("samples-per-client", 5000)
@@ -308,45 +730,91 @@ def client_fn(context: Context):
     if scaling_mode == "weak":
         print(f"📦 Samples per client: {samples_per_client}")
     
-    # Carica dati con scaling configurato
+    virtual_clients = int(node_setting(context, "virtual-clients", 1))
+    if virtual_clients > 1:
+        return build_virtual_node_client(context, virtual_clients)
+    return build_partition_client(
+        context, Net(), context.node_config["partition-id"], context.node_config["num-partitions"]
+    )
+
+
+def build_virtual_node_client(context: Context, virtual_clients):
+    """
+    Supernode con K client virtuali: partizioni partition-id·K ... partition-id·K + K-1
+    su num-partitions·K partizioni totali
+    
+    Ogni client virtuale ha un proprio Context (contatori dei round, stato
+    dell'ottimizzatore, metadati), conservato nel processo con la cache dei client.
+    """
+    threads = int(node_setting(context, "virtual-client-threads", 0))
+    if threads > 0:
+        torch.set_num_threads(threads)
+    first_partition = context.node_config["partition-id"] * virtual_clients
+    num_partitions = context.node_config["num-partitions"] * virtual_clients
+    print(
+        f"🧩 Nodo virtuale: {virtual_clients} client (partizioni {first_partition}-"
+        f"{first_partition + virtual_clients - 1} di {num_partitions}), "
+        f"{torch.get_num_threads()} thread di torch"
+    )
+    
+    net = Net()
+    clients = []
+    for index in range(virtual_clients):
+        partition_id = first_partition + index
+        client_context = Context(
+            run_id=context.run_id,
+            node_id=context.node_id,
+            node_config={**context.node_config, "partition-id": partition_id, "num-partitions": num_partitions},
+            state=RecordSet(),
+            run_config=context.run_config,
+        )
+        client = build_partition_client(
+            context, net, partition_id, num_partitions, node_context=client_context,
+            # Le risorse vengono campionate una volta per il nodo
+            resource_interval=0.0, virtual_index=index,
+        )
+        clients.append(client)
+    return VirtualNodeClient(
+        clients, resource_interval=float(context.run_config.get("resource-sampling-interval", 0.5))
+    )
+
+
+def build_partition_client(context: Context, net, partition_id, num_partitions, node_context=None, **options):
+    """
+    FlowerClient di una partizione (il modello net può essere condiviso tra client virtuali)
+    
+    node_context è il Context in cui il client conserva il proprio stato
+    (default: quello del nodo).
+    """
+    local_epochs = context.run_config["local-epochs"]
+    eval_samples = context.run_config.get("eval-samples", 0)
+    scaling_mode = context.run_config.get("scaling-mode", "strong")
+    samples_per_client = context.run_config.get("samples-per-client", 5000)
+    
+    # Carica dati con scaling configurato (il dataset è condiviso tra le partizioni del processo)
     trainloader, valloader = load_data(
         partition_id, 
         num_partitions,
         scaling_mode=scaling_mode,
-        samples_per_client=samples_per_client
+        samples_per_client=samples_per_client,
+        # Il percorso può cambiare da nodo a nodo: node_config ha la precedenza
+        dataset_cache=node_setting(context, "dataset-cache", ""),
     )
     
     print(f"📊 Partition: {partition_id}/{num_partitions}, Epoche: {local_epochs}")
     
-    # Caricamento informazioni esperimento (timeout ridotto per evitare attese)
-    experiment_info = wait_for_experiment_info(timeout=30)
-    
-    if not experiment_info:
-        print("❌ Fallback naming")
-        group_name = f"FALLBACK_GROUP_{int(time.time())}"
-        client_name = f"{group_name}_CLIENT_{socket.gethostname()}"
-        run = wandb.init(
-            project="CNN_Stage", 
-            entity="damiano-cannizzaro-universit-di-torino",
-            group=group_name, 
-            name=client_name, 
-            id=generate_wandb_id(client_name),
-            reinit=False, 
-            resume="allow"
-        )
-    else:
-        group_name, client_name = register_client_in_experiment(experiment_info)
-        run = setup_wandb_tracking(group_name, client_name, experiment_info)
-    
-    # Creazione client
-    client = FlowerClient(
+    # Creazione client (il tracking wandb parte al primo fit/evaluate)
+    options.setdefault("resource_interval", float(context.run_config.get("resource-sampling-interval", 0.5)))
+    return FlowerClient(
         net, trainloader, valloader, local_epochs, 
-        partition_id, run, num_partitions, client_name
-    ).to_client()
-    
-    return client
+        partition_id, num_partitions, node_context or context,
+        eval_samples=eval_samples,
+        persist_optimizer_state=context.run_config.get("persist-optimizer-state", False),
+        **options,
+    )
 
 # Flower ClientApp
 app = ClientApp(
     client_fn,
+    mods=[clock_sync_mod, warmup_mod],
 )
\ No newline at end of file
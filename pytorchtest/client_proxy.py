@@ -0,0 +1,59 @@
+"""pytorchtest: ClientProxy strumentato per il timing delle risposte."""
+
+import time
+
+from flwr.common import Code
+from flwr.server.client_proxy import ClientProxy
+
+
+class TimedClientProxy(ClientProxy):
+    """
+    Avvolge il ClientProxy di Flower e registra invio e arrivo di ogni risposta
+
+    Il Server di Flower restituisce i risultati senza ordine di arrivo: gli
+    eventi registrati qui permettono alla strategia di sapere chi ha risposto
+    per primo, chi è andato in timeout e chi ha fallito. Con timeout il fit
+    usa la deadline del proxy (anche ricavata dalla strategia) al posto del
+    round_timeout del Server.
+    """
+
+    def __init__(self, proxy, events, timeout=None):
+        super().__init__(proxy.cid)
+        self.proxy = proxy
+        self.events = events
+        self.timeout = timeout
+
+    def __getattr__(self, name):
+        # Attributi specifici del proxy originale (es. node_id)
+        if name == "proxy":
+            raise AttributeError(name)
+        return getattr(self.proxy, name)
+
+    def _timed(self, call, ins, timeout, group_id):
+        sent = time.time()
+        try:
+            res = call(ins, timeout, group_id)
+        except BaseException:
+            received = time.time()
+            late = self.timeout is not None and received - sent >= self.timeout
+            self.events[self.cid] = {"sent": sent, "received": received, "status": "late" if late else "failed"}
+            raise
+        status = getattr(res, "status", None)
+        ok = status is None or status.code == Code.OK
+        self.events[self.cid] = {"sent": sent, "received": time.time(), "status": "ok" if ok else "failed"}
+        return res
+
+    def get_properties(self, ins, timeout, group_id):
+        return self._timed(self.proxy.get_properties, ins, timeout, group_id)
+
+    def get_parameters(self, ins, timeout, group_id):
+        return self.proxy.get_parameters(ins, timeout, group_id)
+
+    def fit(self, ins, timeout, group_id):
+        return self._timed(self.proxy.fit, ins, self.timeout if self.timeout is not None else timeout, group_id)
+
+    def evaluate(self, ins, timeout, group_id):
+        return self._timed(self.proxy.evaluate, ins, timeout, group_id)
+
+    def reconnect(self, ins, timeout, group_id):
+        return self.proxy.reconnect(ins, timeout, group_id)
@@ -0,0 +1,204 @@
+"""pytorchtest: cache locale del dataset, indirizzata per contenuto, per nodi senza rete."""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+DATASET = "uoft-cs/cifar10"
+MANIFEST_NAME = "MANIFEST.json"
+
+
+class DatasetChecksumError(ValueError):
+    """Snapshot del dataset corrotto o modificato: i checksum non corrispondono al manifest"""
+
+
+def dataset_slug(dataset):
+    """Nome del riferimento di un dataset (es. uoft-cs--cifar10)"""
+    return dataset.replace("/", "--")
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_files(directory):
+    """Checksum e dimensione di ogni file dello snapshot (manifest escluso)"""
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, directory).replace(os.sep, "/")
+            if relative == MANIFEST_NAME:
+                continue
+            files[relative] = {"sha256": file_sha256(path), "size": os.path.getsize(path)}
+    return files
+
+
+def manifest_digest(files):
+    """Indirizzo dello snapshot: sha256 dell'elenco ordinato dei file con i loro checksum"""
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()
+
+
+def build_cache(cache_dir, dataset=DATASET, source=None):
+    """
+    Scarica il dataset e ne salva uno snapshot in cache_dir/snapshots/<digest>
+
+    Il nome della directory è il checksum del manifest: snapshot identici
+    vengono deduplicati, un file modificato non può passare inosservato.
+    cache_dir/refs/<dataset> indica lo snapshot da usare.
+
+    Args:
+        source: DatasetDict già caricato da salvare al posto del download
+
+    Returns:
+        str: Percorso dello snapshot
+    """
+    from datasets import load_dataset
+
+    snapshots = os.path.join(cache_dir, "snapshots")
+    refs = os.path.join(cache_dir, "refs")
+    os.makedirs(snapshots, exist_ok=True)
+    os.makedirs(refs, exist_ok=True)
+
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=snapshots)
+    try:
+        (source if source is not None else load_dataset(dataset)).save_to_disk(staging)
+        files = scan_files(staging)
+        digest = manifest_digest(files)
+        with open(os.path.join(staging, MANIFEST_NAME), "w") as f:
+            json.dump({
+                "dataset": dataset,
+                "digest": digest,
+                "created_at": datetime.now().isoformat(),
+                "files": files,
+            }, f, indent=2, sort_keys=True)
+        snapshot = os.path.join(snapshots, digest)
+        if os.path.exists(snapshot):
+            shutil.rmtree(staging)
+        else:
+            os.rename(staging, snapshot)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Aggiornamento atomico del riferimento: i lettori vedono il vecchio o il nuovo snapshot
+    ref_path = os.path.join(refs, dataset_slug(dataset))
+    with open(ref_path + ".tmp", "w") as f:
+        f.write(digest + "\n")
+    os.replace(ref_path + ".tmp", ref_path)
+    return snapshot
+
+
+def resolve_snapshot(cache_dir, dataset=DATASET):
+    """Percorso dello snapshot indicato da refs/<dataset>"""
+    ref_path = os.path.join(cache_dir, "refs", dataset_slug(dataset))
+    if not os.path.exists(ref_path):
+        raise FileNotFoundError(
+            f"Nessuno snapshot di {dataset} in {cache_dir}: crearlo su un nodo con rete con "
+            f"python build_dataset_cache.py build --cache-dir {cache_dir} e copiarlo sul nodo"
+        )
+    with open(ref_path) as f:
+        digest = f.read().strip()
+    return os.path.join(cache_dir, "snapshots", digest)
+
+
+def verify_snapshot(snapshot):
+    """
+    Ricalcola i checksum dello snapshot e li confronta con il manifest
+
+    Raises:
+        DatasetChecksumError: File mancanti, aggiunti, modificati o manifest alterato
+    """
+    manifest_path = os.path.join(snapshot, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise DatasetChecksumError(f"Snapshot {snapshot} senza {MANIFEST_NAME}: ricostruire la cache")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    expected = manifest["files"]
+    digest = os.path.basename(os.path.normpath(snapshot))
+    if manifest_digest(expected) != digest:
+        raise DatasetChecksumError(f"Manifest di {snapshot} non corrisponde all'indirizzo dello snapshot")
+
+    actual = scan_files(snapshot)
+    problems = []
+    for name in sorted(set(expected) | set(actual)):
+        if name not in actual:
+            problems.append(f"{name}: mancante")
+        elif name not in expected:
+            problems.append(f"{name}: non presente nel manifest")
+        elif actual[name]["sha256"] != expected[name]["sha256"]:
+            problems.append(
+                f"{name}: sha256 {actual[name]['sha256'][:12]}…, atteso {expected[name]['sha256'][:12]}…"
+            )
+    if problems:
+        raise DatasetChecksumError(
+            f"Checksum del dataset non validi in {snapshot}:\n  " + "\n  ".join(problems)
+            + "\nRicostruire la cache con build_dataset_cache.py build"
+        )
+    return manifest
+
+
+# Snapshot già verificati in questo processo (i checksum si ricalcolano una sola volta)
+_verified = set()
+
+
+def load_cached_dataset(cache_dir, dataset=DATASET, verify=True):
+    """
+    DatasetDict dallo snapshot locale, senza accesso alla rete
+
+    Il dataset è caricato in memoria: con gli Arrow mappati dallo snapshot
+    shuffle, select e train_test_split scriverebbero i file cache-*.arrow
+    degli indici nella directory dello snapshot, che non passerebbe più la
+    verifica (e su un volume in sola lettura fallirebbe subito).
+
+    Raises:
+        FileNotFoundError: Cache non costruita
+        DatasetChecksumError: Snapshot corrotto
+    """
+    from datasets import load_from_disk
+
+    snapshot = resolve_snapshot(cache_dir, dataset)
+    if verify and snapshot not in _verified:
+        verify_snapshot(snapshot)
+        _verified.add(snapshot)
+    return load_from_disk(snapshot, keep_in_memory=True)
+
+
+class CachedFederatedDataset:
+    """
+    FederatedDataset letto dalla cache locale (load_partition / load_split)
+
+    Come FederatedDataset (shuffle=True, seed=42) tutti gli split vengono
+    mescolati prima del partizionamento: le partizioni coincidono con quelle
+    ottenute scaricando il dataset.
+    """
+
+    def __init__(self, cache_dir, partitioners, dataset=DATASET, seed=42, verify=True):
+        self.partitioners = partitioners
+        self.dataset = load_cached_dataset(cache_dir, dataset, verify=verify).shuffle(seed=seed)
+
+    def load_split(self, split):
+        return self.dataset[split]
+
+    def load_partition(self, partition_id, split="train"):
+        partitioner = self.partitioners[split]
+        if not partitioner.is_dataset_assigned():
+            partitioner.dataset = self.dataset[split]
+        return partitioner.load_partition(partition_id)
+
+
+def open_federated_dataset(partitioners, cache_dir="", dataset=DATASET):
+    """FederatedDataset dalla cache locale se cache_dir è indicata, altrimenti scaricato"""
+    if cache_dir:
+        return CachedFederatedDataset(cache_dir, partitioners, dataset=dataset)
+    from flwr_datasets import FederatedDataset
+
+    return FederatedDataset(dataset=dataset, partitioners=partitioners)
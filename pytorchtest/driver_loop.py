@@ -0,0 +1,882 @@
+"""pytorchtest: loop del ServerApp basato sulla Driver API."""
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flwr.common import (
+    DEFAULT_TTL,
+    Code,
+    EvaluateIns,
+    FitIns,
+    GetPropertiesIns,
+    MessageType,
+    MessageTypeLegacy,
+    ndarrays_to_parameters,
+    parameters_to_ndarrays,
+)
+from flwr.common import recordset_compat as compat
+
+from aggregation import PARTIAL_SUM_KEY, StreamingAggregator
+from timeline import CLOCK_SYNC_KEY
+from warmup import warmup_ins, warmup_report
+
+# Intervallo di polling verso la SuperLink quando non ci sono risposte pronte
+POLL_INTERVAL = 0.2
+# Ogni quanti secondi il loop asincrono aggiorna l'elenco dei nodi connessi
+NODE_REFRESH_INTERVAL = 10.0
+# ID chiesti alla SuperLink per ogni pull: pull_messages deserializza l'intera
+# risposta in una lista, quindi il batch limita i modelli tenuti in memoria
+PULL_BATCH_SIZE = 4
+
+
+def wait_for_nodes(driver, min_nodes, timeout=600):
+    """
+    Attende che almeno min_nodes supernode siano connessi alla SuperLink
+
+    Returns:
+        list: ID dei nodi connessi (anche se meno di min_nodes dopo il timeout)
+    """
+    start_time = time.time()
+    printed_waiting = False
+
+    while time.time() - start_time < timeout:
+        node_ids = list(driver.get_node_ids())
+        if len(node_ids) >= min_nodes:
+            return node_ids
+
+        if not printed_waiting:
+            print(f"⏳ Attendo {min_nodes} nodi (connessi: {len(node_ids)})...")
+            printed_waiting = True
+        time.sleep(1)
+
+    return list(driver.get_node_ids())
+
+
+def sample_nodes(node_ids, sample_size):
+    """Campionamento uniforme dei nodi, come il ClientManager di Flower"""
+    return random.sample(node_ids, min(sample_size, len(node_ids)))
+
+
+def push_instructions(driver, node_ids, content, message_type, server_round, ttl=None, node_contents=None):
+    """
+    Invia lo stesso contenuto a tutti i nodi indicati e restituisce gli ID dei messaggi
+
+    node_contents sostituisce il contenuto per singoli nodi (es. il primo
+    messaggio con i metadati dell'esperimento).
+    """
+    node_contents = node_contents or {}
+    messages = [
+        driver.create_message(
+            content=node_contents.get(node_id, content),
+            message_type=message_type,
+            dst_node_id=node_id,
+            group_id=str(server_round),
+            ttl=ttl,
+        )
+        for node_id in node_ids
+    ]
+    return list(driver.push_messages(messages))
+
+
+def experiment_contents(strategy, node_ids, config, build):
+    """
+    Contenuti per i nodi che non hanno ancora ricevuto i metadati dell'esperimento
+
+    Args:
+        build: Funzione config -> RecordSet (FitIns o EvaluateIns serializzati)
+    """
+    contents = {}
+    for node_id in node_ids:
+        extra = strategy.experiment_config(node_id)
+        if extra:
+            contents[node_id] = build({**config, **extra})
+    return contents
+
+
+def sync_clocks(driver, strategy, node_ids, timeout=30):
+    """
+    Stima l'offset dell'orologio dei nodi non ancora misurati con ping get_properties
+
+    Ogni ping passa dalla SuperLink (push + polling), quindi il round trip e
+    l'errore della stima (≤ round trip / 2) sono più alti che in modalità batch.
+    """
+    samples = getattr(strategy, "clock_sync_samples", 0)
+    missing = strategy.clock.missing(node_ids) if samples > 0 else []
+    if not missing:
+        return
+    content = compat.getpropertiesins_to_recordset(GetPropertiesIns(config={CLOCK_SYNC_KEY: True}))
+    for _ in range(samples):
+        t_send = time.time()
+        message_ids = push_instructions(driver, missing, content, MessageTypeLegacy.GET_PROPERTIES, 0)
+        for reply in stream_replies(driver, message_ids, timeout=timeout):
+            t_recv = time.time()
+            if reply.has_error():
+                continue
+            properties = compat.recordset_to_getpropertiesres(reply.content).properties
+            if "client_time" in properties:
+                strategy.clock.record(reply.metadata.src_node_id, t_send, float(properties["client_time"]), t_recv)
+
+
+def warm_up_nodes(driver, strategy, node_ids):
+    """
+    Warm-up dei nodi non ancora preparati (dati, modello, passi fittizi)
+
+    I nodi che non rispondono entro client_warmup_timeout restano senza
+    report: il loro primo round include ancora il caricamento.
+    """
+    missing = strategy.warmup_missing(node_ids)
+    if not missing:
+        return
+    warmup_start = time.time()
+    content = compat.getpropertiesins_to_recordset(warmup_ins(strategy.client_warmup_steps))
+    message_ids = push_instructions(driver, missing, content, MessageTypeLegacy.GET_PROPERTIES, 0)
+    reports = {node_id: None for node_id in missing}
+    for reply in stream_replies(driver, message_ids, timeout=strategy.client_warmup_timeout):
+        if not reply.has_error():
+            properties = compat.recordset_to_getpropertiesres(reply.content).properties
+            reports[reply.metadata.src_node_id] = warmup_report(properties)
+    strategy.record_warmup(reports, time.time() - warmup_start)
+
+
+def pull_replies(driver, message_ids, batch_size=None):
+    """
+    Scarica le risposte pronte a blocchi di al più batch_size messaggi
+
+    Ogni pull_messages restituisce una lista già deserializzata: il blocco
+    successivo viene chiesto solo dopo che il chiamante ha consumato il
+    precedente, così restano in memoria al più batch_size modelli.
+
+    Yields:
+        Message: Risposta di un client
+    """
+    batch_size = batch_size or PULL_BATCH_SIZE
+    message_ids = list(message_ids)
+    for start in range(0, len(message_ids), batch_size):
+        yield from driver.pull_messages(message_ids[start:start + batch_size])
+
+
+def stream_replies(driver, message_ids, timeout=None):
+    """
+    Restituisce le risposte dei client man mano che arrivano alla SuperLink
+
+    Args:
+        driver: Driver del ServerApp
+        message_ids: ID dei messaggi di cui attendere la risposta
+        timeout: Secondi massimi di attesa (None = fino all'ultima risposta)
+
+    Yields:
+        Message: Risposta di un client
+    """
+    pending = set(message_ids)
+    start_time = time.time()
+
+    while pending:
+        if timeout is not None and time.time() - start_time > timeout:
+            print(f"⚠️  Timeout: {len(pending)} risposte mancanti")
+            return
+
+        received = 0
+        for reply in pull_replies(driver, pending):
+            received += 1
+            pending.discard(reply.metadata.reply_to_message)
+            yield reply
+
+        if pending and not received:
+            time.sleep(POLL_INTERVAL)
+
+
+class FitRound:
+    """
+    Round di fit in streaming: ogni risultato viene piegato nella somma pesata appena arriva
+
+    Con over-selection vengono contattati k + m nodi e il round si chiude ai
+    primi k risultati; con una deadline si aggrega ciò che è arrivato in tempo.
+    Le risposte vengono passate a handle(), così più round (fit e valutazione)
+    possono condividere lo stesso loop di polling.
+    """
+
+    def __init__(self, driver, strategy, aggregator, parameters, server_round, node_ids):
+        self.driver = driver
+        self.strategy = strategy
+        self.aggregator = aggregator
+        self.parameters = parameters
+        self.server_round = server_round
+        self.sample_size, _ = strategy.num_fit_clients(len(node_ids))
+        self.selected = strategy.select_nodes(server_round, node_ids, self.sample_size + strategy.over_selection)
+        self.deadline = strategy.round_deadline or None
+        self.pending = set()
+        self.answered = set()
+        self.dropped_nodes = []
+        self.surplus_nodes = []
+        self.fit_metrics = []
+        self.round_trips = []
+        self.start_time = None
+        self.first_result_time = None
+        self.last_result_time = None
+
+    def dispatch(self):
+        """Invia i FitIns ai nodi selezionati"""
+        configure_start = time.time()
+        config = self.strategy.fit_config(self.server_round)
+
+        def build(config):
+            return compat.fitins_to_recordset(FitIns(self.parameters, config), keep_input=True)
+
+        content = build(config)
+        node_contents = experiment_contents(self.strategy, self.selected, config, build)
+
+        self.start_time = time.time()
+        self.aggregator.reset()
+        # Il TTL fa scartare alla SuperLink le risposte arrivate dopo la deadline
+        self.message_ids = push_instructions(
+            self.driver, self.selected, content, MessageType.TRAIN, self.server_round, ttl=self.deadline,
+            node_contents=node_contents,
+        )
+        self.pending = set(self.message_ids)
+        self.strategy.record_phase(self.server_round, configure_fit_seconds=time.time() - configure_start)
+        return self.message_ids
+
+    def handle(self, reply):
+        """Piega una risposta nella somma pesata"""
+        self.pending.discard(reply.metadata.reply_to_message)
+        self.answered.add(reply.metadata.src_node_id)
+        if reply.has_error():
+            self.dropped_nodes.append(reply.metadata.src_node_id)
+            return
+        fit_res = compat.recordset_to_fitres(reply.content, keep_input=False)
+        if fit_res.status.code != Code.OK:
+            self.dropped_nodes.append(reply.metadata.src_node_id)
+            return
+        round_trip = time.time() - self.start_time
+        self.strategy.record_latency(reply.metadata.src_node_id, round_trip)
+
+        # Il risultato viene sommato e rilasciato subito
+        self.aggregator.add(
+            parameters_to_ndarrays(fit_res.parameters),
+            fit_res.num_examples,
+            partial=bool(fit_res.metrics.get(PARTIAL_SUM_KEY, 0)),
+        )
+        self.fit_metrics.append((fit_res.num_examples, fit_res.metrics))
+        self.round_trips.append((reply.metadata.src_node_id, round_trip))
+
+        self.last_result_time = time.time()
+        if self.first_result_time is None:
+            self.first_result_time = self.last_result_time
+
+    def discard(self, reply):
+        """Risposta arrivata dopo i primi k risultati: non viene aggregata"""
+        self.pending.discard(reply.metadata.reply_to_message)
+        self.answered.add(reply.metadata.src_node_id)
+        self.surplus_nodes.append(reply.metadata.src_node_id)
+        if not reply.has_error():
+            self.strategy.record_latency(reply.metadata.src_node_id, time.time() - self.start_time)
+
+    @property
+    def enough(self):
+        return self.aggregator.num_results >= self.sample_size
+
+    @property
+    def done(self):
+        """Primi k risultati arrivati, nessuna risposta attesa o deadline scaduta"""
+        expired = self.deadline is not None and time.time() - self.start_time > self.deadline
+        return self.enough or not self.pending or expired
+
+    def finish(self):
+        """
+        Chiude il round
+
+        Returns:
+            tuple: (parameters aggregati o None, metriche aggregate, statistiche del round)
+        """
+        # Nodi senza risposta: in eccesso se bastavano già k risultati, altrimenti in ritardo
+        missing = [node_id for node_id in self.selected if node_id not in self.answered]
+        enough = self.enough
+        # Per chi non ha risposto il tempo trascorso è un limite inferiore della latenza
+        for node_id in missing:
+            self.strategy.record_latency(node_id, time.time() - self.start_time)
+
+        aggregate_start = time.time()
+        aggregated = self.aggregator.result()
+        aggregate_end = time.time()
+
+        if self.strategy.fused_evaluation:
+            self.strategy.aggregate_fused_evaluation(self.server_round, self.fit_metrics)
+        self.strategy.record_client_timings(self.server_round, "fit", [
+            (node_id, metrics, round_trip)
+            for (_, metrics), (node_id, round_trip) in zip(self.fit_metrics, self.round_trips)
+        ])
+        self.strategy.record_client_metrics(self.server_round, "fit", self.fit_metrics)
+
+        metrics_aggregated = {}
+        if self.strategy.fit_metrics_aggregation_fn is not None and self.fit_metrics:
+            metrics_aggregated = self.strategy.fit_metrics_aggregation_fn(self.fit_metrics)
+
+        round_start = self.start_time
+        first, last = self.first_result_time, self.last_result_time
+        stats = {
+            "selected": len(self.selected),
+            "target": self.sample_size,
+            "results": self.aggregator.num_results,
+            "surplus_nodes": self.surplus_nodes + (missing if enough else []),
+            "late_nodes": [] if enough else missing,
+            "dropped_nodes": self.dropped_nodes,
+            "first_result_seconds": round(first - round_start, 3) if first else None,
+            "last_result_seconds": round(last - round_start, 3) if last else None,
+            # Coda di aggregazione: solo la divisione finale
+            "aggregation_tail_seconds": round(aggregate_end - aggregate_start, 4),
+            # Attesa dopo l'ultimo risultato (deadline per i nodi in ritardo)
+            "wait_after_last_result_seconds": round(aggregate_start - (last or aggregate_start), 3),
+        }
+
+        self.strategy.record_phase(
+            self.server_round,
+            first_fit_result_seconds=stats["first_result_seconds"],
+            last_fit_result_seconds=stats["last_result_seconds"],
+        )
+        if aggregated is None:
+            return None, metrics_aggregated, stats
+        # Passo dell'ottimizzatore lato server (FedAvgM/FedAdam/FedYogi) sulla media
+        parameters = self.strategy.apply_server_update(
+            self.server_round, aggregated, self.aggregator.total_examples
+        )
+        self.strategy.mark_round_end(self.server_round)
+        # In streaming la somma avviene all'arrivo: resta la divisione più il passo del server
+        self.strategy.record_phase(self.server_round, aggregate_fit_seconds=time.time() - aggregate_start)
+        return parameters, metrics_aggregated, stats
+
+
+class EvaluationRound:
+    """Valutazione federata di un modello; riusa aggregate_evaluate della strategia"""
+
+    def __init__(self, driver, strategy, parameters, server_round, node_ids):
+        self.driver = driver
+        self.strategy = strategy
+        self.parameters = parameters
+        self.server_round = server_round
+        sample_size, _ = strategy.num_evaluation_clients(len(node_ids))
+        self.selected = sample_nodes(node_ids, sample_size)
+        self.deadline = strategy.round_deadline or None
+        self.pending = set()
+        # Gli EvaluateRes contengono solo scalari: tenerli tutti è O(N), non O(N·modello)
+        self.results = []
+        self.failures = []
+        self.start_time = None
+        self.end_time = None
+        self.first_result_time = None
+        self.last_result_time = None
+        self.round_trips = []
+
+    def dispatch(self):
+        """Invia gli EvaluateIns ai nodi selezionati"""
+        configure_start = time.time()
+        config = {}
+        if self.strategy.on_evaluate_config_fn is not None:
+            config = self.strategy.on_evaluate_config_fn(self.server_round)
+
+        def build(config):
+            return compat.evaluateins_to_recordset(EvaluateIns(self.parameters, config), keep_input=True)
+
+        content = build(config)
+        node_contents = experiment_contents(self.strategy, self.selected, config, build)
+
+        self.start_time = time.time()
+        self.message_ids = push_instructions(
+            self.driver, self.selected, content, MessageType.EVALUATE, self.server_round, ttl=self.deadline,
+            node_contents=node_contents,
+        )
+        self.pending = set(self.message_ids)
+        self.strategy.record_phase(self.server_round, configure_evaluate_seconds=time.time() - configure_start)
+        return self.message_ids
+
+    def handle(self, reply):
+        """Raccoglie una risposta di valutazione"""
+        self.pending.discard(reply.metadata.reply_to_message)
+        if reply.has_error():
+            self.failures.append(reply.error)
+            return
+        evaluate_res = compat.recordset_to_evaluateres(reply.content)
+        if evaluate_res.status.code != Code.OK:
+            self.failures.append(evaluate_res)
+            return
+        self.results.append((None, evaluate_res))
+        self.last_result_time = time.time()
+        self.round_trips.append((reply.metadata.src_node_id, self.last_result_time - self.start_time))
+        if self.first_result_time is None:
+            self.first_result_time = self.last_result_time
+
+    @property
+    def done(self):
+        expired = self.deadline is not None and time.time() - self.start_time > self.deadline
+        return not self.pending or expired
+
+    def finish(self):
+        """Aggrega i risultati con la strategia"""
+        self.end_time = time.time()
+        first, last = self.first_result_time, self.last_result_time
+        self.strategy.record_phase(
+            self.server_round,
+            first_evaluate_result_seconds=first - self.start_time if first else None,
+            last_evaluate_result_seconds=last - self.start_time if last else None,
+        )
+        self.strategy.record_client_timings(self.server_round, "evaluate", [
+            (node_id, evaluate_res.metrics, round_trip)
+            for (_, evaluate_res), (node_id, round_trip) in zip(self.results, self.round_trips)
+        ])
+        # aggregate_evaluate della strategia registra la propria durata
+        return self.strategy.aggregate_evaluate(self.server_round, self.results, self.failures)
+
+
+def fit_round_streaming(driver, strategy, parameters, server_round, node_ids, aggregator):
+    """
+    Esegue un round di fit piegando ogni risultato nella somma pesata appena arriva
+
+    Returns:
+        tuple: (parameters aggregati o None, metriche aggregate, statistiche del round)
+    """
+    fit_round = FitRound(driver, strategy, aggregator, parameters, server_round, node_ids)
+    message_ids = fit_round.dispatch()
+    for reply in stream_replies(driver, message_ids, timeout=fit_round.deadline):
+        fit_round.handle(reply)
+        if fit_round.enough:
+            break
+    return fit_round.finish()
+
+
+def evaluate_round(driver, strategy, parameters, server_round, node_ids):
+    """Valutazione federata sincrona"""
+    if not strategy.federated_evaluation_round(server_round):
+        return None
+
+    evaluation = EvaluationRound(driver, strategy, parameters, server_round, node_ids)
+    message_ids = evaluation.dispatch()
+    for reply in stream_replies(driver, message_ids, timeout=evaluation.deadline):
+        evaluation.handle(reply)
+    return evaluation.finish()
+
+
+def run_streaming(driver, strategy, num_rounds):
+    """
+    Loop di training con aggregazione in streaming, alternativo a start_driver
+
+    Args:
+        driver: Driver del ServerApp
+        strategy: Strategia (TimedFedAvg) usata per configurazione, valutazione e timing
+        num_rounds: Numero di round del server
+    """
+    parameters = strategy.initialize_parameters(client_manager=None)
+    aggregator = StreamingAggregator(kernel=strategy.kernel)
+
+    for server_round in range(1, num_rounds + 1):
+        if strategy.stop_reason is not None:
+            break
+        node_ids = wait_for_nodes(driver, strategy.min_available_clients)
+        sync_clocks(driver, strategy, node_ids)
+        warm_up_nodes(driver, strategy, node_ids)
+        print(f"🔁 Round {server_round} (streaming) - nodi disponibili: {len(node_ids)}")
+
+        aggregated, _, stats = fit_round_streaming(
+            driver, strategy, parameters, server_round, node_ids, aggregator
+        )
+        if aggregated is None:
+            print(f"⚠️  Round {server_round}: nessun risultato di fit, mantengo il modello corrente")
+        else:
+            parameters = aggregated
+        strategy.record_round_timing(server_round, **stats)
+        print(
+            f"📥 Round {server_round}: {stats['results']}/{stats['selected']} risultati, "
+            f"coda aggregazione {stats['aggregation_tail_seconds']}s"
+        )
+        if stats["late_nodes"] or stats["dropped_nodes"]:
+            print(
+                f"⚠️  Round {server_round}: in ritardo {stats['late_nodes']}, "
+                f"falliti {stats['dropped_nodes']}"
+            )
+
+        evaluate_round(driver, strategy, parameters, server_round, node_ids)
+        strategy.evaluate(server_round, parameters)
+
+
+def run_pipelined(driver, strategy, num_rounds):
+    """
+    Loop semi-sincrono: il fit del round r+1 parte appena il round r è aggregato
+
+    La valutazione federata del round r viene inviata insieme al fit del
+    round r+1, preferibilmente ai nodi non selezionati per il fit, e la
+    valutazione lato server gira in un thread dedicato, un round alla volta
+    (il modello di evaluate è condiviso). Fit e valutazione condividono
+    lo stesso loop di polling, quindi i client non restano fermi mentre il
+    server valuta.
+
+    Args:
+        driver: Driver del ServerApp
+        strategy: Strategia (TimedFedAvg)
+        num_rounds: Numero di round del server
+    """
+    parameters = strategy.initialize_parameters(client_manager=None)
+    aggregator = StreamingAggregator(kernel=strategy.kernel)
+    origin = strategy.start_time or time.time()
+    evaluations = {}
+    windows = {"fit": {}, "evaluate": {}}
+
+    def relative(timestamp):
+        # strategy.start_time riparte dopo il warm-up dei client
+        return round(timestamp - (strategy.start_time or origin), 3)
+
+    def dispatch_evaluation(eval_parameters, eval_round, node_ids, busy_nodes):
+        if not strategy.federated_evaluation_round(eval_round):
+            return
+        # Preferisce i nodi liberi; altrimenti la valutazione si accoda al fit sugli stessi nodi
+        free_nodes = [node_id for node_id in node_ids if node_id not in busy_nodes]
+        evaluation = EvaluationRound(driver, strategy, eval_parameters, eval_round, free_nodes or node_ids)
+        for message_id in evaluation.dispatch():
+            evaluations[message_id] = evaluation
+
+    def close_evaluation(evaluation):
+        for message_id in list(evaluation.pending):
+            evaluations.pop(message_id, None)
+        evaluation.finish()
+        windows["evaluate"][evaluation.server_round] = (evaluation.start_time, evaluation.end_time)
+
+    def poll(fit_round=None):
+        """Un giro di polling condiviso tra il fit in corso e le valutazioni pendenti"""
+        message_ids = list(evaluations)
+        if fit_round is not None:
+            message_ids += list(fit_round.pending)
+        received = 0
+        for reply in pull_replies(driver, message_ids):
+            received += 1
+            message_id = reply.metadata.reply_to_message
+            if fit_round is not None and message_id in fit_round.pending:
+                # Più risposte nello stesso pull: oltre i primi k sono in eccesso
+                if fit_round.enough:
+                    fit_round.discard(reply)
+                else:
+                    fit_round.handle(reply)
+            elif message_id in evaluations:
+                evaluation = evaluations.pop(message_id)
+                evaluation.handle(reply)
+                if evaluation.done:
+                    close_evaluation(evaluation)
+        # Valutazioni con deadline scaduta
+        for evaluation in {e for e in evaluations.values() if e.done}:
+            close_evaluation(evaluation)
+        if not received:
+            time.sleep(POLL_INTERVAL)
+
+    # Un solo worker: le valutazioni lato server non si sovrappongono
+    server_evaluator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="server-evaluate")
+    server_evaluations = {}
+    last_round = 0
+    for server_round in range(1, num_rounds + 1):
+        # Early stop: la valutazione in corso del round precedente viene comunque completata
+        if strategy.stop_reason is not None:
+            break
+        last_round = server_round
+        node_ids = wait_for_nodes(driver, strategy.min_available_clients)
+        sync_clocks(driver, strategy, node_ids)
+        warm_up_nodes(driver, strategy, node_ids)
+        fit_round = FitRound(driver, strategy, aggregator, parameters, server_round, node_ids)
+        fit_round.dispatch()
+        print(f"🔁 Round {server_round} (pipelined) - fit su {len(fit_round.selected)} nodi")
+
+        if server_round > 1:
+            # Il modello del round precedente viene valutato mentre i client addestrano
+            dispatch_evaluation(parameters, server_round - 1, node_ids, set(fit_round.selected))
+            server_evaluations[server_round - 1] = server_evaluator.submit(
+                strategy.evaluate, server_round - 1, parameters
+            )
+
+        while not fit_round.done:
+            poll(fit_round)
+
+        aggregated, _, stats = fit_round.finish()
+        windows["fit"][server_round] = (fit_round.start_time, time.time())
+        if aggregated is None:
+            print(f"⚠️  Round {server_round}: nessun risultato di fit, mantengo il modello corrente")
+        else:
+            parameters = aggregated
+        strategy.record_round_timing(server_round, phase="fit", **stats)
+        print(
+            f"📥 Round {server_round}: {stats['results']}/{stats['selected']} risultati, "
+            f"{len(set(evaluations.values()))} valutazioni ancora in corso"
+        )
+
+    # L'ultimo modello non ha un fit successivo con cui sovrapporsi
+    dispatch_evaluation(parameters, last_round, wait_for_nodes(driver, 1), set())
+    while evaluations:
+        poll()
+    server_evaluator.shutdown(wait=True)
+    for eval_round, future in server_evaluations.items():
+        if future.exception() is not None:
+            print(f"⚠️  Round {eval_round}: valutazione lato server fallita: {future.exception()}")
+
+    # Sovrapposizione tra la valutazione del round r e il fit del round r+1
+    total_overlap = 0.0
+    for eval_round, (eval_start, eval_end) in sorted(windows["evaluate"].items()):
+        fit_window = windows["fit"].get(eval_round + 1)
+        overlap = 0.0
+        if fit_window is not None:
+            overlap = max(0.0, min(eval_end, fit_window[1]) - max(eval_start, fit_window[0]))
+        total_overlap += overlap
+        strategy.record_round_timing(
+            eval_round,
+            phase="evaluate",
+            start_seconds=relative(eval_start),
+            end_seconds=relative(eval_end),
+            overlap_with_next_fit_seconds=round(overlap, 3),
+        )
+    for fit_round_number, (fit_start, fit_end) in sorted(windows["fit"].items()):
+        strategy.record_round_timing(
+            fit_round_number,
+            phase="fit_window",
+            start_seconds=relative(fit_start),
+            end_seconds=relative(fit_end),
+        )
+    strategy.record_round_timing(last_round, phase="summary", pipeline_overlap_seconds=round(total_overlap, 3))
+    print(f"⏩ Pipelining: {total_overlap:.1f}s di valutazione sovrapposti al training")
+
+    # Valutazione lato server dell'ultimo modello
+    strategy.evaluate(last_round, parameters)
+
+
+def run_async(driver, strategy, num_updates):
+    """
+    Loop asincrono in stile FedBuff, senza barriera di round
+
+    Ogni nodo ha sempre un'istruzione di fit in corso: appena risponde riceve
+    il modello più recente. Gli aggiornamenti (delta rispetto al modello da
+    cui il client è partito) vengono pesati per staleness e accumulati; ogni
+    strategy.buffer_size risultati il server applica un aggiornamento.
+
+    Ogni NODE_REFRESH_INTERVAL secondi l'elenco dei nodi viene aggiornato: i
+    nuovi nodi ricevono un fit, i messaggi verso nodi disconnessi o senza
+    risposta entro la deadline (round-deadline, altrimenti il TTL di Flower)
+    vengono scartati e il loro nodo torna disponibile.
+
+    Args:
+        driver: Driver del ServerApp
+        strategy: TimedFedBuff
+        num_updates: Numero di aggiornamenti del modello globale
+    """
+    parameters = strategy.initialize_parameters(client_manager=None)
+    start_time = time.time()
+
+    version = 0
+    # Modelli ancora referenziati da fit in corso, per calcolare i delta
+    models = {version: parameters_to_ndarrays(parameters)}
+    contents = {}
+    aggregator = StreamingAggregator(kernel=strategy.kernel)
+    buffered = []
+    in_flight = {}
+    evaluations = {}
+    last_update_time = start_time
+    # Il TTL fa scartare alla SuperLink le istruzioni senza risposta entro la deadline
+    ttl = strategy.round_deadline or None
+    deadline = strategy.round_deadline or DEFAULT_TTL
+    expired_messages = 0
+
+    def fit_config(model_version):
+        config = {}
+        if strategy.on_fit_config_fn is not None:
+            config = strategy.on_fit_config_fn(model_version + 1)
+        return config
+
+    def build_fit(model_version, config):
+        fit_ins = FitIns(ndarrays_to_parameters(models[model_version]), config)
+        return compat.fitins_to_recordset(fit_ins, keep_input=True)
+
+    def fit_content(model_version):
+        if model_version not in contents:
+            contents.clear()
+            contents[model_version] = build_fit(model_version, fit_config(model_version))
+        return contents[model_version]
+
+    def dispatch_fit(node_ids):
+        if not node_ids:
+            return
+        node_contents = experiment_contents(
+            strategy, node_ids, fit_config(version), lambda config: build_fit(version, config)
+        )
+        message_ids = push_instructions(
+            driver, node_ids, fit_content(version), MessageType.TRAIN, version + 1, ttl=ttl,
+            node_contents=node_contents,
+        )
+        for node_id, message_id in zip(node_ids, message_ids):
+            in_flight[message_id] = ("fit", node_id, version, time.time())
+
+    def dispatch_evaluate(node_ids):
+        config = {}
+        if strategy.on_evaluate_config_fn is not None:
+            config = strategy.on_evaluate_config_fn(version)
+        parameters = ndarrays_to_parameters(models[version])
+
+        def build(config):
+            return compat.evaluateins_to_recordset(EvaluateIns(parameters, config), keep_input=True)
+
+        content = build(config)
+        node_contents = experiment_contents(strategy, node_ids, config, build)
+        message_ids = push_instructions(
+            driver, node_ids, content, MessageType.EVALUATE, version, ttl=ttl, node_contents=node_contents
+        )
+        evaluations[version] = {"pending": len(message_ids), "results": [], "failures": []}
+        for node_id, message_id in zip(node_ids, message_ids):
+            in_flight[message_id] = ("evaluate", node_id, version, time.time())
+
+    def evaluation_done(eval_version):
+        evaluation = evaluations[eval_version]
+        evaluation["pending"] -= 1
+        if evaluation["pending"] == 0:
+            evaluations.pop(eval_version)
+            strategy.aggregate_evaluate(eval_version, evaluation["results"], evaluation["failures"])
+
+    def drop_in_flight(message_ids, reason):
+        """Scarta messaggi senza risposta: i loro nodi tornano disponibili per un nuovo fit"""
+        for message_id in message_ids:
+            kind, node_id, base_version, _ = in_flight.pop(message_id)
+            if kind == "evaluate":
+                evaluations[base_version]["failures"].append(TimeoutError(reason))
+                evaluation_done(base_version)
+        if message_ids:
+            print(f"⚠️  FedBuff: {len(message_ids)} messaggi scartati ({reason})")
+        return len(message_ids)
+
+    def fill_concurrency(node_ids):
+        """Porta i fit in corso a max(fraction-fit, buffer_size) usando i nodi liberi"""
+        if version >= num_updates:
+            return
+        busy = {node_id for kind, node_id, _, _ in in_flight.values() if kind == "fit"}
+        sample_size, _ = strategy.num_fit_clients(len(node_ids))
+        missing = max(sample_size, strategy.buffer_size) - len(busy)
+        idle = [node_id for node_id in node_ids if node_id not in busy]
+        if missing > 0 and idle:
+            dispatch_fit(sample_nodes(idle, missing))
+
+    node_ids = wait_for_nodes(driver, strategy.min_available_clients)
+    sync_clocks(driver, strategy, node_ids)
+    warm_up_nodes(driver, strategy, node_ids)
+    # Gli intervalli tra aggiornamenti non includono sincronizzazione e warm-up
+    start_time = last_update_time = last_refresh = time.time()
+    sample_size, _ = strategy.num_fit_clients(len(node_ids))
+    concurrency = max(sample_size, strategy.buffer_size)
+    dispatch_fit(sample_nodes(node_ids, concurrency))
+    print(f"⚡ FedBuff: {concurrency} client concorrenti, aggiornamento ogni {strategy.buffer_size} risultati")
+
+    while version < num_updates or any(kind == "evaluate" for kind, *_ in in_flight.values()):
+        if strategy.stop_reason is not None and version < num_updates:
+            # Early stop: il modello corrente diventa quello finale
+            num_updates = version
+
+        now = time.time()
+        if now - last_refresh >= NODE_REFRESH_INTERVAL:
+            last_refresh = now
+            connected = list(driver.get_node_ids())
+            new_nodes = [node_id for node_id in connected if node_id not in node_ids]
+            if new_nodes:
+                print(f"➕ FedBuff: {len(new_nodes)} nuovi nodi connessi")
+                sync_clocks(driver, strategy, new_nodes)
+                warm_up_nodes(driver, strategy, new_nodes)
+            node_ids = connected
+            expired_messages += drop_in_flight(
+                [m for m, (_, node_id, _, _) in in_flight.items() if node_id not in connected], "nodo disconnesso"
+            )
+        expired_messages += drop_in_flight(
+            [m for m, (*_, sent_at) in in_flight.items() if now - sent_at > deadline],
+            f"nessuna risposta entro {deadline:g}s",
+        )
+        fill_concurrency(node_ids)
+
+        idle_nodes = []
+        received = 0
+        for reply in pull_replies(driver, in_flight):
+            received += 1
+            message_id = reply.metadata.reply_to_message
+            if message_id not in in_flight:
+                continue
+            kind, node_id, base_version, sent_at = in_flight.pop(message_id)
+
+            if kind == "evaluate":
+                evaluation = evaluations[base_version]
+                if reply.has_error():
+                    evaluation["failures"].append(reply.error)
+                else:
+                    evaluation["results"].append((None, compat.recordset_to_evaluateres(reply.content)))
+                evaluation_done(base_version)
+                continue
+
+            if version < num_updates:
+                idle_nodes.append(node_id)
+            if reply.has_error():
+                continue
+            fit_res = compat.recordset_to_fitres(reply.content, keep_input=False)
+            if fit_res.status.code != Code.OK or fit_res.num_examples <= 0 or version >= num_updates:
+                continue
+
+            # Delta rispetto al modello da cui il client è partito, smorzato per staleness
+            staleness = version - base_version
+            strategy.add_buffered_update(
+                aggregator, parameters_to_ndarrays(fit_res.parameters), models[base_version],
+                fit_res.num_examples, staleness,
+            )
+            buffered.append({
+                "staleness": staleness,
+                "latency": round(time.time() - sent_at, 3),
+                "node": node_id,
+                "examples": fit_res.num_examples,
+                "metrics": fit_res.metrics,
+            })
+
+            if aggregator.num_results >= strategy.buffer_size:
+                apply_start = time.time()
+                new_model = strategy.apply_buffered_update(models[version], aggregator.result())
+                aggregator.reset()
+                version += 1
+                models[version] = new_model
+                strategy.mark_round_end(version)
+                strategy.record_client_timings(version, "fit", [
+                    (b["node"], b["metrics"], b["latency"]) for b in buffered
+                ])
+                strategy.record_client_metrics(version, "fit", [(b["examples"], b["metrics"]) for b in buffered])
+                now = time.time()
+
+                strategy.record_round_timing(
+                    version,
+                    elapsed_seconds=round(now - start_time, 3),
+                    update_interval_seconds=round(now - last_update_time, 3),
+                    apply_seconds=round(now - apply_start, 4),
+                    results=len(buffered),
+                    mean_staleness=round(sum(b["staleness"] for b in buffered) / len(buffered), 3),
+                    max_staleness=max(b["staleness"] for b in buffered),
+                    mean_client_latency=round(sum(b["latency"] for b in buffered) / len(buffered), 3),
+                    expired_messages=expired_messages,
+                )
+                print(
+                    f"🔄 Aggiornamento {version}/{num_updates} dopo {now - start_time:.1f}s "
+                    f"(staleness max {max(b['staleness'] for b in buffered)})"
+                )
+                buffered = []
+                expired_messages = 0
+                last_update_time = now
+
+                # Stesso calendario delle valutazioni dei loop sincroni (eval-schedule)
+                if strategy.should_evaluate(version):
+                    eval_size, _ = strategy.num_evaluation_clients(len(node_ids))
+                    if strategy.fraction_evaluate > 0.0:
+                        dispatch_evaluate(sample_nodes(node_ids, eval_size))
+                    if version < num_updates:
+                        strategy.evaluate(version, ndarrays_to_parameters(models[version]))
+
+        # I nodi che hanno risposto ripartono subito dal modello più recente
+        if idle_nodes and version < num_updates:
+            dispatch_fit(idle_nodes)
+
+        # Libera i modelli non più referenziati da fit in corso
+        referenced = {base for kind, _, base, _ in in_flight.values()} | {version}
+        for old_version in [v for v in models if v not in referenced]:
+            del models[old_version]
+
+        if not received:
+            time.sleep(POLL_INTERVAL)
+
+    # Valutazione lato server del modello finale
+    strategy.evaluate(num_updates, ndarrays_to_parameters(models[version]))
@@ -0,0 +1,371 @@
+"""pytorchtest: livello di aggregazione intermedio (edge) tra supernode e superlink."""
+
+import argparse
+import json
+import selectors
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from aggregation import PARTIAL_SUM_KEY, StreamingAggregator
+
+# Frame: lunghezza header (8 byte) + header JSON + lunghezza payload (8 byte) + payload
+_LENGTH = struct.Struct("!Q")
+
+
+def _recv_exact(sock, size):
+    """Legge esattamente size byte dal socket"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        chunk = sock.recv_into(view[received:], size - received)
+        if chunk == 0:
+            raise ConnectionError("Connessione chiusa dal peer")
+        received += chunk
+    return buffer
+
+
+def send_message(sock, kind, ndarrays=None, **fields):
+    """
+    Invia un messaggio con eventuali pesi del modello
+
+    Returns:
+        int: Byte inviati sul socket
+    """
+    ndarrays = ndarrays or []
+    header = dict(fields)
+    header["type"] = kind
+    header["layers"] = [{"shape": list(layer.shape), "dtype": layer.dtype.str} for layer in ndarrays]
+    header_bytes = json.dumps(header).encode()
+    payload_size = sum(layer.nbytes for layer in ndarrays)
+
+    sock.sendall(_LENGTH.pack(len(header_bytes)) + header_bytes + _LENGTH.pack(payload_size))
+    for layer in ndarrays:
+        sock.sendall(memoryview(np.ascontiguousarray(layer)).cast("B"))
+    return 2 * _LENGTH.size + len(header_bytes) + payload_size
+
+
+def recv_message(sock):
+    """
+    Riceve un messaggio inviato con send_message
+
+    Returns:
+        tuple: (header, ndarrays, byte ricevuti)
+    """
+    header_size = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))[0]
+    header = json.loads(bytes(_recv_exact(sock, header_size)))
+    payload_size = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))[0]
+    payload = _recv_exact(sock, payload_size)
+
+    ndarrays = []
+    offset = 0
+    for layer in header.pop("layers"):
+        dtype = np.dtype(layer["dtype"])
+        count = int(np.prod(layer["shape"], dtype=np.int64))
+        ndarrays.append(
+            np.frombuffer(payload, dtype=dtype, count=count, offset=offset).reshape(layer["shape"])
+        )
+        offset += count * dtype.itemsize
+    return header, ndarrays, 2 * _LENGTH.size + header_size + payload_size
+
+
+class EdgeAggregator:
+    """
+    Aggregatore intermedio per un gruppo di supernode (es. un rack o un gruppo di VM)
+
+    I membri del gruppo si connettono via TCP; ad ogni round l'edge inoltra
+    il modello globale, piega gli aggiornamenti nella somma pesata appena
+    arrivano e restituisce una sola somma parziale con il totale degli esempi.
+    Verso il server quindi viaggia un modello per gruppo invece di uno per nodo.
+
+    Un membro che si disconnette o non risponde entro round_timeout secondi
+    viene rimosso dal gruppo e il round si chiude con chi ha risposto; per
+    rientrare il nodo deve riconnettersi.
+    """
+
+    def __init__(self, host="0.0.0.0", port=9095, group_size=1, kernel=None, round_timeout=None):
+        self.host = host
+        self.port = port
+        self.group_size = group_size
+        self.round_timeout = round_timeout or None
+        self.aggregator = StreamingAggregator(kernel=kernel)
+        self.members = []
+        self.addresses = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._server = None
+        self._lock = threading.Lock()
+        self._accept_thread = None
+        self._group_ready = False
+
+    def start(self):
+        """Apre il socket e accetta i membri del gruppo in background"""
+        self._server = socket.create_server((self.host, self.port))
+        self.port = self._server.getsockname()[1]
+        self._accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._accept_thread.start()
+        print(f"🛰️  Edge in ascolto su {self.host}:{self.port} (gruppo da {self.group_size} nodi)")
+        return self
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, address = self._server.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self.members.append(conn)
+                self.addresses[conn] = f"{address[0]}:{address[1]}"
+            print(f"🔗 Membro connesso da {address[0]}:{address[1]}")
+
+    def wait_for_members(self, timeout=600):
+        """Attende che tutto il gruppo sia connesso"""
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            with self._lock:
+                if len(self.members) >= self.group_size:
+                    return True
+            time.sleep(0.5)
+        print(f"⚠️  Edge: connessi {len(self.members)}/{self.group_size} membri dopo {timeout}s")
+        return False
+
+    def _ensure_group(self):
+        """Il gruppo completo si attende solo al primo round: i membri persi non bloccano i successivi"""
+        if not self._group_ready:
+            self.wait_for_members()
+            self._group_ready = True
+
+    def _drop_member(self, conn, reason):
+        """Rimuove dal gruppo un membro disconnesso o in ritardo"""
+        with self._lock:
+            if conn in self.members:
+                self.members.remove(conn)
+            address = self.addresses.pop(conn, "?")
+            remaining = len(self.members)
+        conn.close()
+        print(f"⚠️  Edge: membro {address} rimosso ({reason}), restano {remaining}/{self.group_size}")
+
+    def _broadcast(self, kind, ndarrays, config):
+        with self._lock:
+            members = list(self.members)
+        reached = []
+        for conn in members:
+            try:
+                self.bytes_sent += send_message(conn, kind, ndarrays, config=config)
+            except OSError as e:
+                self._drop_member(conn, e)
+                continue
+            reached.append(conn)
+        return reached
+
+    def _gather(self, members, handle):
+        """
+        Riceve le risposte dei membri nell'ordine in cui arrivano
+
+        I membri che si disconnettono o non rispondono entro round_timeout
+        vengono rimossi; il round si chiude con le risposte ricevute.
+
+        Returns:
+            int: Membri che hanno risposto
+        """
+        selector = selectors.DefaultSelector()
+        for conn in members:
+            selector.register(conn, selectors.EVENT_READ)
+        pending = set(members)
+        deadline = time.time() + self.round_timeout if self.round_timeout else None
+        replied = 0
+        try:
+            while pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                for key, _ in selector.select(remaining):
+                    conn = key.fileobj
+                    selector.unregister(conn)
+                    pending.discard(conn)
+                    # Anche un messaggio iniziato ma incompleto rispetta la deadline
+                    conn.settimeout(None if deadline is None else max(deadline - time.time(), 1e-3))
+                    try:
+                        header, ndarrays, size = recv_message(conn)
+                    except (OSError, ValueError) as e:
+                        self._drop_member(conn, e)
+                        continue
+                    conn.settimeout(None)
+                    self.bytes_received += size
+                    replied += 1
+                    handle(header, ndarrays)
+        finally:
+            selector.close()
+        for conn in pending:
+            self._drop_member(conn, f"nessuna risposta entro {self.round_timeout}s")
+        return replied
+
+    def fit_round(self, ndarrays, config=None):
+        """
+        Esegue un round di fit sul gruppo
+
+        Returns:
+            tuple: (somma parziale Σ n_i·w_i, esempi totali, metriche per il livello superiore)
+
+        Raises:
+            ConnectionError: Nessun membro ha inviato un aggiornamento
+        """
+        self._ensure_group()
+        members = self._broadcast("fit", ndarrays, config or {})
+        self.aggregator.reset()
+
+        def handle(header, update):
+            self.aggregator.add(update, header["num_examples"], partial=header.get("partial", False))
+
+        self._gather(members, handle)
+        if self.aggregator.num_results == 0:
+            raise ConnectionError(f"Edge: nessun aggiornamento dai {len(members)} membri contattati")
+        metrics = {
+            PARTIAL_SUM_KEY: 1,
+            "edge-clients": self.aggregator.num_results,
+        }
+        return self.aggregator.partial_sum(), self.aggregator.total_examples, metrics
+
+    def evaluate_round(self, ndarrays, config=None):
+        """
+        Valutazione federata sul gruppo
+
+        Returns:
+            tuple: (loss media pesata, esempi totali, metriche pesate)
+
+        Raises:
+            ConnectionError: Nessun membro ha risposto
+        """
+        self._ensure_group()
+        members = self._broadcast("evaluate", ndarrays, config or {})
+        totals = {"loss": 0.0, "accuracy": 0.0, "num_examples": 0}
+
+        def handle(header, _):
+            num_examples = header["num_examples"]
+            totals["loss"] += header["loss"] * num_examples
+            totals["accuracy"] += header.get("metrics", {}).get("accuracy", 0.0) * num_examples
+            totals["num_examples"] += num_examples
+
+        replied = self._gather(members, handle)
+        if replied == 0:
+            raise ConnectionError(f"Edge: nessuna valutazione dai {len(members)} membri contattati")
+        num_examples = max(totals["num_examples"], 1)
+        return (
+            totals["loss"] / num_examples,
+            totals["num_examples"],
+            {"accuracy": totals["accuracy"] / num_examples, "edge-clients": replied},
+        )
+
+    def close(self):
+        """Chiude le connessioni e ferma i membri del gruppo"""
+        with self._lock:
+            members, self.members = self.members, []
+            self.addresses.clear()
+        for conn in members:
+            try:
+                send_message(conn, "stop")
+            except OSError:
+                pass
+            conn.close()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+
+def serve_member(address, fit_fn, evaluate_fn=None, retries=30):
+    """
+    Loop di un membro del gruppo: riceve il modello dall'edge e risponde
+
+    Args:
+        address: "host:porta" dell'edge
+        fit_fn: Funzione (ndarrays, config) -> (ndarrays, num_examples, metrics)
+        evaluate_fn: Funzione (ndarrays, config) -> (loss, num_examples, metrics)
+        retries: Tentativi di connessione (uno al secondo)
+    """
+    host, port = address.rsplit(":", 1)
+    for attempt in range(retries):
+        try:
+            sock = socket.create_connection((host, int(port)))
+            break
+        except OSError:
+            if attempt == retries - 1:
+                raise
+            time.sleep(1)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    with sock:
+        while True:
+            header, ndarrays, _ = recv_message(sock)
+            if header["type"] == "stop":
+                return
+            if header["type"] == "fit":
+                update, num_examples, metrics = fit_fn(ndarrays, header.get("config", {}))
+                send_message(
+                    sock,
+                    "update",
+                    update,
+                    num_examples=num_examples,
+                    metrics=metrics,
+                    partial=bool(metrics.get(PARTIAL_SUM_KEY, 0)),
+                )
+            elif header["type"] == "evaluate" and evaluate_fn is not None:
+                loss, num_examples, metrics = evaluate_fn(ndarrays, header.get("config", {}))
+                send_message(sock, "result", loss=loss, num_examples=num_examples, metrics=metrics)
+
+
+def run_leaf(edge_address, partition_id, num_partitions, local_epochs,
+             scaling_mode="strong", samples_per_client=5000, dataset_cache=""):
+    """Supernode foglia: addestra la propria partizione e risponde all'edge"""
+    import torch
+
+    from task import Net, get_weights, load_data, set_weights, test, train
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    net = Net().to(device)
+    trainloader, valloader = load_data(
+        partition_id,
+        num_partitions,
+        scaling_mode=scaling_mode,
+        samples_per_client=samples_per_client,
+        dataset_cache=dataset_cache,
+    )
+    print(f"🍃 Foglia {partition_id}/{num_partitions} → edge {edge_address}")
+
+    def fit_fn(ndarrays, config):
+        set_weights(net, ndarrays)
+        train_loss = train(net, trainloader, local_epochs, device)
+        return get_weights(net), len(trainloader.dataset), {"train_loss": train_loss}
+
+    def evaluate_fn(ndarrays, config):
+        set_weights(net, ndarrays)
+        loss, accuracy = test(net, valloader, device)
+        return loss, len(valloader.dataset), {"accuracy": accuracy}
+
+    serve_member(edge_address, fit_fn, evaluate_fn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nodo foglia collegato a un aggregatore edge")
+    parser.add_argument("--edge", required=True, help="Indirizzo dell'edge (host:porta)")
+    parser.add_argument("--partition-id", type=int, required=True)
+    parser.add_argument("--num-partitions", type=int, required=True)
+    parser.add_argument("--local-epochs", type=int, default=1)
+    parser.add_argument("--scaling-mode", default="strong", choices=["strong", "weak"])
+    parser.add_argument("--samples-per-client", type=int, default=5000)
+    parser.add_argument("--dataset-cache", default="", help="Cache locale del dataset (vuota = download)")
+    args = parser.parse_args()
+
+    run_leaf(
+        args.edge,
+        args.partition_id,
+        args.num_partitions,
+        args.local_epochs,
+        scaling_mode=args.scaling_mode,
+        samples_per_client=args.samples_per_client,
+        dataset_cache=args.dataset_cache,
+    )
@@ -0,0 +1,260 @@
+"""pytorchtest: invio delle metriche dei client in background, a blocchi, con spool locale."""
+
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Record che chiude la coda del thread di invio
+_CLOSE = object()
+
+# Tipo dei valori istogramma nei record (serializzabili nello spool, convertiti per wandb)
+HISTOGRAM = "histogram"
+
+
+def histogram(values, bins=10):
+    """Istogramma di una serie di valori come dict JSON (counts, edges)"""
+    counts, edges = np.histogram(np.asarray(values, dtype=float), bins=bins)
+    return {"_type": HISTOGRAM, "counts": counts.tolist(), "edges": [round(float(e), 6) for e in edges]}
+
+
+class NoopBackend:
+    """Scarta le metriche (misura l'overhead del client senza tracking)"""
+
+    name = "noop"
+
+    def write(self, records):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileBackend:
+    """Metriche in un file JSONL locale, un record per riga"""
+
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def write(self, records):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "a")
+        for record in records:
+            self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class WandbBackend:
+    """
+    Run wandb creata dal thread di invio alla prima scrittura
+
+    init è la funzione che chiama wandb.init (es. setup_wandb_tracking): se
+    il server wandb è lento o irraggiungibile l'attesa resta fuori da fit ed
+    evaluate e i record finiscono nello spool.
+    """
+
+    name = "wandb"
+
+    def __init__(self, init):
+        self.init = init
+        self.run = None
+
+    def write(self, records):
+        if self.run is None:
+            self.run = self.init()
+        for record in records:
+            if record["kind"] == "config":
+                self.run.config.update(record["data"], allow_val_change=True)
+            else:
+                self.run.log(self.to_wandb(record["data"]), commit=record["commit"])
+
+    @staticmethod
+    def to_wandb(data):
+        """Converte gli istogrammi dei record in wandb.Histogram"""
+        if not any(isinstance(value, dict) and value.get("_type") == HISTOGRAM for value in data.values()):
+            return data
+        import wandb
+
+        return {
+            name: wandb.Histogram(np_histogram=(value["counts"], value["edges"]))
+            if isinstance(value, dict) and value.get("_type") == HISTOGRAM else value
+            for name, value in data.items()
+        }
+
+    def close(self):
+        if self.run is not None:
+            self.run.finish()
+            self.run = None
+
+
+class MetricsSink:
+    """
+    Coda limitata di metriche svuotata da un thread in background
+
+    - log() e update_config() non bloccano: il record va in una queue.Queue
+      di queue_size elementi; a coda piena il record viene scartato e contato
+    - Il thread invia al backend blocchi di batch_size record, o quanto
+      accumulato ogni flush_interval secondi
+    - Se il backend fallisce i blocchi vanno nello spool JSONL; dopo
+      retry_interval secondi lo spool viene reinviato e svuotato
+    """
+
+    def __init__(self, backend, spool_path, queue_size=1024, batch_size=32, flush_interval=2.0,
+                 retry_interval=30.0):
+        self.backend = backend
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.sent = 0
+        self.spooled = 0
+        self.backend_down_until = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"metrics-{backend.name}", daemon=True)
+        self._thread.start()
+
+    def log(self, data, commit=True):
+        self._put({"kind": "log", "data": data, "commit": commit, "timestamp": time.time()})
+
+    def update_config(self, data):
+        self._put({"kind": "config", "data": data, "commit": False, "timestamp": time.time()})
+
+    def _put(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        batch = []
+        closing = False
+        while not closing:
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if record is _CLOSE:
+                    closing = True
+                    break
+                batch.append(record)
+            if batch:
+                self._deliver(batch)
+                batch = []
+        self._close_backend()
+
+    def _deliver(self, batch):
+        """Invia il blocco (dopo l'eventuale spool arretrato) o lo accoda allo spool"""
+        if time.time() < self.backend_down_until or not self._replay_spool():
+            self._spool(batch)
+            return
+        try:
+            self.backend.write(batch)
+        except Exception as e:
+            self._backend_failed(e)
+            self._spool(batch)
+            return
+        self.sent += len(batch)
+
+    def _backend_failed(self, error):
+        if self.backend_down_until == 0.0:
+            print(f"⚠️  Metriche: backend {self.backend.name} non disponibile ({error}), uso lo spool {self.spool_path}")
+        self.backend_down_until = time.time() + self.retry_interval
+
+    def _spool(self, batch):
+        directory = os.path.dirname(self.spool_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.spool_path, "a") as f:
+            for record in batch:
+                f.write(json.dumps(record) + "\n")
+        self.spooled += len(batch)
+
+    def _replay_spool(self):
+        """
+        Reinvia lo spool al backend; False se il backend è ancora irraggiungibile
+
+        Se l'invio si interrompe a metà, lo spool viene riscritto con i soli
+        blocchi non ancora consegnati, così al tentativo successivo non si
+        duplicano i record già inviati.
+        """
+        if not os.path.exists(self.spool_path):
+            return True
+        with open(self.spool_path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        delivered = 0
+        try:
+            for start in range(0, len(records), self.batch_size):
+                self.backend.write(records[start:start + self.batch_size])
+                delivered = min(start + self.batch_size, len(records))
+        except Exception as e:
+            self._backend_failed(e)
+            if delivered:
+                self._rewrite_spool(records[delivered:])
+                self.sent += delivered
+            return False
+        os.remove(self.spool_path)
+        self.sent += len(records)
+        if self.backend_down_until:
+            print(f"✅ Metriche: backend {self.backend.name} di nuovo disponibile, {len(records)} record reinviati")
+        self.backend_down_until = 0.0
+        return True
+
+    def _rewrite_spool(self, records):
+        """Sostituisce atomicamente lo spool con i record indicati"""
+        with open(self.spool_path + ".tmp", "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(self.spool_path + ".tmp", self.spool_path)
+
+    def _close_backend(self):
+        try:
+            self.backend.close()
+        except Exception as e:
+            print(f"⚠️  Metriche: chiusura del backend {self.backend.name} fallita ({e})")
+
+    def close(self, timeout=30.0):
+        """Invia i record in coda e chiude il backend (attende al più timeout secondi)"""
+        if not self._thread.is_alive():
+            return
+        self.queue.put(_CLOSE)
+        self._thread.join(timeout)
+        if self.dropped:
+            print(f"⚠️  Metriche: {self.dropped} record scartati con la coda piena")
+
+    def stats(self):
+        return {"sent": self.sent, "spooled": self.spooled, "dropped": self.dropped, "queued": self.queue.qsize()}
+
+
+def make_metrics_sink(backend, spool_path, wandb_init=None, file_path=None, **options):
+    """
+    Crea il sink indicato da metrics-backend in pyproject.toml
+
+    Args:
+        backend: "wandb", "file" o "noop"
+        wandb_init: Funzione che crea la run wandb (solo per "wandb")
+        file_path: File JSONL delle metriche (solo per "file")
+    """
+    if backend == "wandb":
+        return MetricsSink(WandbBackend(wandb_init), spool_path, **options)
+    if backend == "file":
+        return MetricsSink(FileBackend(file_path), spool_path, **options)
+    if backend != "noop":
+        print(f"⚠️  Backend delle metriche {backend} sconosciuto, uso noop")
+    return MetricsSink(NoopBackend(), spool_path, **options)
@@ -0,0 +1,192 @@
+"""pytorchtest: campionamento delle risorse del processo client da /proc durante fit ed evaluate."""
+
+import os
+import threading
+import time
+
+# Utilizzo medio della CPU (frazione dei core disponibili) oltre il quale un nodo è saturo
+SATURATION_THRESHOLD = 0.9
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def available_cores():
+    """Core utilizzabili dal processo (affinità o limite del container, se disponibili)"""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def read_cpu_seconds():
+    """Tempo CPU del processo (utente + sistema, tutti i thread) da /proc/self/stat"""
+    with open("/proc/self/stat") as f:
+        # Il nome del comando può contenere spazi: i campi numerici iniziano dopo ')'
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+
+def read_memory_mb():
+    """(RSS, picco di RSS) del processo in MB da /proc/self/status"""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                name, value = line.split(":", 1)
+                values[name] = int(value.split()[0]) / 1024
+    return values.get("VmRSS", 0.0), values.get("VmHWM", 0.0)
+
+
+def read_io_bytes():
+    """
+    Byte letti dal processo da /proc/self/io
+
+    read_bytes conta le letture dal disco (0 se già in page cache), rchar
+    tutte le letture; se io non è leggibile (container senza permessi) None.
+    """
+    try:
+        with open("/proc/self/io") as f:
+            values = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    return {"read_bytes": int(values.get("read_bytes", 0)), "rchar": int(values.get("rchar", 0))}
+
+
+def proc_available():
+    return os.path.exists("/proc/self/stat") and os.path.exists("/proc/self/status")
+
+
+class ResourceSampler:
+    """
+    Campionatore in background delle risorse del processo
+
+    Ogni interval secondi legge tempo CPU e RSS; a fine chiamata metrics()
+    restituisce le statistiche riassuntive come metriche Flower resource_*:
+    - resource_cpu_seconds: tempo CPU del processo durante la chiamata
+    - resource_cpu_util_mean / _max: utilizzo come frazione dei core disponibili
+      (1.0 = tutti i core occupati)
+    - resource_rss_mb_mean / _max e resource_peak_rss_mb (picco dall'avvio del processo)
+    - resource_read_mb (disco) e resource_rchar_mb (tutte le letture)
+
+    Senza /proc (non Linux) il campionatore è disattivato e metrics() è vuoto.
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.enabled = interval > 0 and proc_available()
+        self.cores = available_cores()
+        self.utilizations = []
+        self.rss = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+        self._end = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _snapshot(self):
+        rss, peak = read_memory_mb()
+        return {"wall": time.perf_counter(), "cpu": read_cpu_seconds(), "rss": rss, "peak": peak,
+                "io": read_io_bytes()}
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._start = self._snapshot()
+        self.rss.append(self._start["rss"])
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        previous = self._start
+        while not self._stop.wait(self.interval):
+            try:
+                current = self._snapshot()
+            except OSError:
+                return
+            self._add_sample(previous, current)
+            previous = current
+
+    def _add_sample(self, previous, current):
+        wall = current["wall"] - previous["wall"]
+        if wall > 0:
+            # I tick di /proc hanno risoluzione 1/SC_CLK_TCK: su intervalli brevi si supera 1
+            self.utilizations.append(min(1.0, (current["cpu"] - previous["cpu"]) / wall / self.cores))
+        self.rss.append(current["rss"])
+
+    def stop(self):
+        if not self.enabled or self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._end = self._snapshot()
+        self.rss.append(self._end["rss"])
+
+    def metrics(self):
+        """Statistiche riassuntive come metriche Flower (vuote se il campionatore è disattivato)"""
+        if self._start is None or self._end is None:
+            return {}
+        start, end = self._start, self._end
+        wall = max(end["wall"] - start["wall"], 1e-9)
+        cpu_seconds = end["cpu"] - start["cpu"]
+        utilization = min(1.0, cpu_seconds / wall / self.cores)
+        # Chiamate più brevi di un intervallo: nessun campione, vale la media dell'intera chiamata
+        utilizations = self.utilizations or [utilization]
+        metrics = {
+            "resource_cpu_seconds": round(cpu_seconds, 4),
+            "resource_cpu_util_mean": round(utilization, 4),
+            "resource_cpu_util_max": round(max(utilizations), 4),
+            "resource_cpu_cores": self.cores,
+            "resource_rss_mb_mean": round(sum(self.rss) / len(self.rss), 2),
+            "resource_rss_mb_max": round(max(self.rss), 2),
+            "resource_peak_rss_mb": round(end["peak"], 2),
+            "resource_samples": len(self.utilizations),
+        }
+        if start["io"] is not None and end["io"] is not None:
+            metrics["resource_read_mb"] = round((end["io"]["read_bytes"] - start["io"]["read_bytes"]) / 2**20, 3)
+            metrics["resource_rchar_mb"] = round((end["io"]["rchar"] - start["io"]["rchar"]) / 2**20, 3)
+        return metrics
+
+
+def summarize_resource_usage(samples):
+    """
+    Aggregati del cluster per il round dalle metriche resource_* dei client
+
+    Args:
+        samples: Lista di (nodo, metriche del client)
+
+    Returns:
+        dict: Somme, medie e massimi tra i nodi (vuoto se nessun client ha campionato)
+    """
+    reports = [(node_id, m) for node_id, m in samples if "resource_cpu_seconds" in m]
+    if not reports:
+        return {}
+
+    def values(name):
+        return [float(m[name]) for _, m in reports if name in m]
+
+    utilization = values("resource_cpu_util_mean")
+    summary = {
+        "nodes": len(reports),
+        "cpu_seconds_total": round(sum(values("resource_cpu_seconds")), 3),
+        "cpu_util_mean": round(sum(utilization) / len(utilization), 4),
+        "cpu_util_min": round(min(utilization), 4),
+        "cpu_util_max": round(max(values("resource_cpu_util_max")), 4),
+        # Nodi con la CPU satura per quasi tutta la chiamata (compute-bound)
+        "saturated_nodes": [
+            str(node_id) for node_id, m in reports
+            if float(m["resource_cpu_util_mean"]) >= SATURATION_THRESHOLD
+        ],
+        "rss_mb_mean": round(sum(values("resource_rss_mb_mean")) / len(reports), 2),
+        "rss_mb_max": round(max(values("resource_rss_mb_max")), 2),
+        "peak_rss_mb_max": round(max(values("resource_peak_rss_mb")), 2),
+    }
+    if values("resource_read_mb"):
+        summary["read_mb_total"] = round(sum(values("resource_read_mb")), 3)
+        summary["rchar_mb_total"] = round(sum(values("resource_rchar_mb")), 3)
+    return summary
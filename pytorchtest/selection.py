@@ -0,0 +1,156 @@
+"""pytorchtest: politiche di selezione dei client basate sulla latenza dei round."""
+
+import random
+from collections import deque
+
+
+class LatencyHistory:
+    """
+    Storico delle latenze di fit per nodo (ultimi window round)
+
+    Le chiavi sono sempre stringhe: il ClientManager di Flower usa il cid
+    (str del node_id), driver_loop.py usa direttamente i node_id.
+    """
+
+    def __init__(self, window=5):
+        self.window = window
+        self.latencies = {}
+        self.last_selected = {}
+        self.times_selected = {}
+
+    def record(self, node_id, seconds):
+        """Aggiunge una latenza (per i nodi in ritardo è un limite inferiore)"""
+        key = str(node_id)
+        if key not in self.latencies:
+            self.latencies[key] = deque(maxlen=self.window)
+        self.latencies[key].append(seconds)
+
+    def estimate(self, node_id):
+        """Latenza media recente del nodo (None se mai misurata)"""
+        samples = self.latencies.get(str(node_id))
+        if not samples:
+            return None
+        return sum(samples) / len(samples)
+
+    def mark_selected(self, node_ids, server_round):
+        for node_id in node_ids:
+            key = str(node_id)
+            self.last_selected[key] = server_round
+            self.times_selected[key] = self.times_selected.get(key, 0) + 1
+
+    def rounds_skipped(self, node_id, server_round):
+        """Round trascorsi dall'ultima selezione del nodo"""
+        return server_round - self.last_selected.get(str(node_id), 0) - 1
+
+
+class UniformSelection:
+    """Campionamento uniforme, come il ClientManager di Flower"""
+
+    name = "uniform"
+
+    def __init__(self, history):
+        self.history = history
+
+    def rank(self, node_ids):
+        """Nodi dal più veloce al più lento; quelli mai misurati vanno per primi"""
+        def key(node_id):
+            estimate = self.history.estimate(node_id)
+            return (estimate is not None, estimate or 0.0, random.random())
+        return sorted(node_ids, key=key)
+
+    def choose(self, node_ids, num_nodes, server_round):
+        return random.sample(node_ids, num_nodes), {}
+
+    def select(self, node_ids, num_nodes, server_round):
+        """
+        Seleziona num_nodes nodi e registra la decisione
+
+        Returns:
+            tuple: (nodi selezionati, decisione del round per il log)
+        """
+        node_ids = list(node_ids)
+        num_nodes = min(num_nodes, len(node_ids))
+        selected, details = self.choose(node_ids, num_nodes, server_round)
+        self.history.mark_selected(selected, server_round)
+
+        estimates = {str(node_id): self.history.estimate(node_id) for node_id in node_ids}
+        decision = {
+            "policy": self.name,
+            "candidates": len(node_ids),
+            "selected": [str(node_id) for node_id in selected],
+            "estimates": {k: round(v, 3) for k, v in estimates.items() if v is not None},
+            **details,
+        }
+        return selected, decision
+
+
+class FastestSelection(UniformSelection):
+    """Fastest-k: i k nodi con latenza stimata più bassa"""
+
+    name = "fastest"
+
+    def choose(self, node_ids, num_nodes, server_round):
+        return self.rank(node_ids)[:num_nodes], {}
+
+
+class PowerOfChoicesSelection(UniformSelection):
+    """Power-of-d-choices: campiona d·k nodi a caso e tiene i k più veloci"""
+
+    name = "power-of-choices"
+
+    def __init__(self, history, d=2):
+        super().__init__(history)
+        self.d = max(1, d)
+
+    def choose(self, node_ids, num_nodes, server_round):
+        candidates = random.sample(node_ids, min(len(node_ids), self.d * num_nodes))
+        return self.rank(candidates)[:num_nodes], {"sampled": [str(node_id) for node_id in candidates]}
+
+
+class FairSelection(UniformSelection):
+    """
+    Fastest-k con vincolo di equità
+
+    Un nodo non può restare escluso per più di max_skip round consecutivi:
+    i nodi al limite vengono selezionati per primi, i posti rimasti vanno ai
+    più veloci. Così la latenza del round scende senza escludere partizioni.
+    """
+
+    name = "fair"
+
+    def __init__(self, history, max_skip=3):
+        super().__init__(history)
+        self.max_skip = max_skip
+
+    def choose(self, node_ids, num_nodes, server_round):
+        starving = [
+            node_id for node_id in node_ids
+            if self.history.rounds_skipped(node_id, server_round) >= self.max_skip
+        ]
+        # Se i nodi al limite sono più dei posti, prima quelli esclusi da più tempo
+        starving.sort(key=lambda node_id: -self.history.rounds_skipped(node_id, server_round))
+        forced = starving[:num_nodes]
+        fastest = [node_id for node_id in self.rank(node_ids) if node_id not in forced]
+        selected = forced + fastest[:num_nodes - len(forced)]
+        return selected, {"forced": [str(node_id) for node_id in forced]}
+
+
+SELECTION_POLICIES = {
+    "uniform": UniformSelection,
+    "fastest": FastestSelection,
+    "power-of-choices": PowerOfChoicesSelection,
+    "fair": FairSelection,
+}
+
+
+def make_selection_policy(name, window=5, d=2, max_skip=3):
+    """Crea la politica di selezione indicata in pyproject.toml"""
+    history = LatencyHistory(window=window)
+    if name == "power-of-choices":
+        return PowerOfChoicesSelection(history, d=d)
+    if name == "fair":
+        return FairSelection(history, max_skip=max_skip)
+    if name not in SELECTION_POLICIES:
+        print(f"⚠️  Politica di selezione {name} sconosciuta, uso uniform")
+        name = "uniform"
+    return SELECTION_POLICIES[name](history)
@@ -1,31 +1,719 @@
 """pytorchtest: A Flower / PyTorch app."""
 
-from flwr.common import Context, ndarrays_to_parameters
-from flwr.server import ServerApp, ServerAppComponents, ServerConfig
-from flwr.server.strategy import FedAvg
+import hashlib
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
 
-class TimedFedAvg(FedAvg):
-    """FedAvg con tracking del tempo di esecuzione e metriche avanzate"""
+import numpy as np
+import torch
+import wandb
+
+from flwr.common import (
+    Code,
+    Context,
+    FitIns,
+    FitRes,
+    Status,
+    ndarrays_to_parameters,
+    parameters_to_ndarrays,
+)
+from flwr.server import Driver, ServerApp, ServerAppComponents, ServerConfig
+from flwr.server.compat import start_driver
+from flwr.server.strategy import FedAdam, FedAvg, FedAvgM, FedYogi
+
+from aggregation import PARTIAL_SUM_KEY, AggregationKernel
+from client_proxy import TimedClientProxy
+from driver_loop import run_async, run_pipelined, run_streaming
+from metrics_sink import histogram, make_metrics_sink
+from resources import summarize_resource_usage
+from selection import make_selection_policy
+from store import get_store
+from task import Net, accuracy_confidence_interval, get_weights, load_test_data, set_weights, test
+from timeline import ClockOffsets, Timeline, sync_proxy_clocks
+from warmup import warm_up_proxies
+
+@dataclass
+class RoundPolicy:
+    """Deadline per round (0 = nessuna), client extra oltre a fraction-fit e politica di selezione"""
+    deadline: float = 0.0
+    over_selection: int = 0
+    selection_policy: object = None
+
+
+@dataclass
+class EvalSchedule:
+    """
+    Calendario delle valutazioni (federata e lato server)
+
+    mode "every" valuta ogni interval round, "geometric" ai round 1, ⌈r⌉, ⌈r²⌉, ...
+    con r = ratio; final aggiunge sempre l'ultimo round. fused fa valutare ai
+    client il modello ricevuto all'inizio del fit.
+    """
+    mode: str = "every"
+    interval: int = 1
+    ratio: float = 2.0
+    final: bool = True
+    fused: bool = False
+
+
+@dataclass
+class EarlyStop:
+    """Accuratezza obiettivo (0 = disattivata), soglie del tempo all'obiettivo e criteri di early stop"""
+    target_accuracy: float = 0.0
+    thresholds: list = field(default_factory=list)
+    at_target: bool = False
+    patience: int = 0
+    min_delta: float = 0.0
+
+
+@dataclass
+class Profiling:
+    """Round di warm-up riportati a parte, ping per gli orologi e warm-up dei client"""
+    warmup_rounds: int = 1
+    clock_sync_samples: int = 3
+    client_warmup: bool = True
+    client_warmup_steps: int = 2
+    client_warmup_timeout: float = 600
+
+
+@dataclass
+class MetricsConfig:
+    """Sink delle metriche per round ed eventuali istogrammi delle metriche dei client"""
+    sink: object = None
+    histograms: bool = True
+    histogram_bins: int = 10
+
+
+class TimedStrategyMixin:
+    """
+    Tracking del tempo di esecuzione e dell'esperimento per qualsiasi strategia di Flower
+    
+    Va messo prima della strategia nelle basi (es. class X(TimedStrategyMixin, FedAdam)):
+    la media pesata usa il kernel multi-thread, poi l'eventuale ottimizzatore
+    lato server della strategia viene applicato da apply_server_update().
+    Le opzioni sono raggruppate in RoundPolicy, EvalSchedule, EarlyStop,
+    Profiling e MetricsConfig (None = valori di default).
+    """
+    
+    # Nome dell'ottimizzatore lato server (None = media pesata semplice)
+    server_optimizer = None
+    # Deadline ricavata con over-selection: margine sulla latenza stimata del k-esimo nodo più veloce
+    over_selection_slack = 1.5
     
-    def __init__(self, experiment_id, group_name, nodes, rounds, epochs, *args, **kwargs):
+    def __init__(self, experiment_id, group_name, nodes, rounds, epochs, *args,
+                 aggregation_mode="batch", aggregation_threads=0, round_policy=None,
+                 eval_schedule=None, early_stop=None, profiling=None, metrics=None, **kwargs):
         super().__init__(*args, **kwargs)
+        round_policy = round_policy or RoundPolicy()
+        eval_schedule = eval_schedule or EvalSchedule()
+        early_stop = early_stop or EarlyStop()
+        profiling = profiling or Profiling()
+        metrics = metrics or MetricsConfig()
         self.experiment_id = experiment_id
         self.group_name = group_name
         self.nodes = nodes
         self.rounds = rounds
         self.epochs = epochs
+        # Numero assegnato a ogni nodo e nodi che hanno già ricevuto i metadati dell'esperimento
+        self.client_numbers = {}
+        self.announced_nodes = set()
+        self.aggregation_mode = aggregation_mode
+        self.kernel = AggregationKernel(num_threads=aggregation_threads or None)
+        # Deadline per round (0 = nessuna) e client extra selezionati oltre a fraction-fit
+        self.round_deadline = round_policy.deadline
+        self.over_selection = round_policy.over_selection
         self.start_time = None
         self.end_time = None
+        self.round_timings = []
+        self.fit_targets = {}
+        self.fit_events = {}
+        # Fasi del ciclo di vita di ogni round lato server; i primi warmup_rounds
+        # (connessione dei client, caricamento dati) sono riportati a parte
+        self.phase_timings = {}
+        self.dispatch_times = {}
+        self.eval_events = {}
+        self.warmup_rounds = profiling.warmup_rounds
+        # Tempi per fase riportati dai client nelle metriche di fit/evaluate
+        self.client_timings = {}
+        # Aggregati del cluster delle risorse campionate dai client (CPU, memoria, I/O)
+        self.resource_usage = {}
+        # Timeline per client in tempo del server (offset degli orologi stimati con ping)
+        self.clock = ClockOffsets()
+        self.timeline = Timeline(self.clock)
+        self.clock_sync_samples = profiling.clock_sync_samples
+        # Warm-up dei client (dati, modello, passi fittizi) prima del loro primo round
+        self.client_warmup = profiling.client_warmup
+        self.client_warmup_steps = profiling.client_warmup_steps
+        self.client_warmup_timeout = profiling.client_warmup_timeout
+        self.warmup_nodes = {}
+        self.warmup_seconds = 0.0
+        # Accuratezza obiettivo (0 = disattivata) e storico per round
+        self.target_accuracy = early_stop.target_accuracy
+        self.accuracy_history = []
+        self.target_reached = None
+        # Soglie per il tempo all'obiettivo (include target_accuracy) e istante di fine di ogni round
+        self.target_thresholds = sorted(set([t for t in early_stop.thresholds if t > 0] +
+                                            ([self.target_accuracy] if self.target_accuracy else [])))
+        self.time_to_targets = {}
+        self.round_timestamps = {}
+        # Early stop all'obiettivo o su plateau (patience valutazioni senza miglioramento)
+        self.early_stop_target = early_stop.at_target
+        self.early_stop_patience = early_stop.patience
+        self.early_stop_min_delta = early_stop.min_delta
+        self.best_accuracy = None
+        self.evaluations_without_improvement = 0
+        self.stop_reason = None
+        self.stopped_at_round = None
+        # Calendario delle valutazioni: ogni k round o a distanza geometrica, più l'ultimo round
+        self.eval_mode = eval_schedule.mode
+        self.eval_interval = max(1, eval_schedule.interval)
+        self.eval_ratio = eval_schedule.ratio
+        self.eval_final = eval_schedule.final
+        # Fit+evaluate: i client valutano il modello ricevuto all'inizio del fit
+        self.fused_evaluation = eval_schedule.fused
+        # Politica di selezione dei client con storico delle latenze per nodo
+        self.selection_policy = round_policy.selection_policy or make_selection_policy("uniform")
+        # Metriche dei client aggregate per round (media pesata ed eventuali istogrammi),
+        # inviate dal server con un solo log per round; pending = non ancora inviate
+        self.metrics_sink = metrics.sink
+        self.metric_histograms = metrics.histograms
+        self.metric_histogram_bins = metrics.histogram_bins
+        self.round_metrics = {}
+        self.pending_metrics = {}
+        # In modalità pipelined la valutazione lato server gira in un thread
+        self.metrics_lock = threading.Lock()
+    
+    def record_round_timing(self, server_round, **values):
+        """Registra statistiche di timing di un singolo round"""
+        self.round_timings.append({"round": server_round, **values})
+    
+    def record_phase(self, server_round, **seconds):
+        """Registra la durata (in secondi) di una o più fasi del round"""
+        phases = self.phase_timings.setdefault(server_round, {})
+        phases.update({name: round(value, 4) for name, value in seconds.items() if value is not None})
+    
+    def record_result_times(self, server_round, kind, events):
+        """Tempo al primo e all'ultimo risultato, misurato dalla fine della configurazione"""
+        dispatched = self.dispatch_times.pop((kind, server_round), None)
+        received = [event["received"] for event in events.values() if event["status"] == "ok"]
+        if dispatched is None or not received:
+            return
+        self.record_phase(server_round, **{
+            f"first_{kind}_result_seconds": min(received) - dispatched,
+            f"last_{kind}_result_seconds": max(received) - dispatched,
+        })
+    
+    def phase_summary(self):
+        """Media di ogni fase separando i round di warm-up dallo stato stazionario"""
+        summary = {}
+        for label, selected in (
+            ("warmup", lambda r: r <= self.warmup_rounds),
+            ("steady_state", lambda r: r > self.warmup_rounds),
+        ):
+            rounds = [phases for r, phases in self.phase_timings.items() if selected(r)]
+            if not rounds:
+                continue
+            names = sorted({name for phases in rounds for name in phases})
+            summary[label] = {"rounds": len(rounds)}
+            for name in names:
+                values = [phases[name] for phases in rounds if name in phases]
+                summary[label][name] = round(sum(values) / len(values), 4)
+        return summary
+    
+    def record_client_timings(self, server_round, kind, samples):
+        """
+        Aggrega i tempi per fase dei client (mean, p50, p95, max) per il round
+        
+        Gli intervalli start_timestamp/end_timestamp dei client finiscono
+        nella timeline, corretti con l'offset dell'orologio di ogni nodo.
+        
+        Args:
+            kind: "fit" o "evaluate"
+            samples: Lista di (nodo, metriche del client, round trip misurato dal server o None)
+        """
+        for node_id, metrics, _ in samples:
+            self.timeline.add_client(server_round, node_id, kind, metrics)
+            # Una risposta valida conferma che il nodo ha ricevuto i metadati dell'esperimento
+            self.announced_nodes.add(str(node_id))
+        summary = summarize_client_timings(
+            [(metrics, round_trip) for _, metrics, round_trip in samples], total_key=f"time_{kind}"
+        )
+        if summary:
+            self.client_timings.setdefault(server_round, {})[kind] = summary
+        self.record_resource_usage(server_round, kind, [(node_id, metrics) for node_id, metrics, _ in samples])
+        return summary
+    
+    def record_resource_usage(self, server_round, kind, samples):
+        """
+        Aggregati del cluster delle metriche resource_* dei client per il round
+        
+        Un utilizzo medio vicino a 1 indica nodi compute-bound; un utilizzo
+        basso con round lenti indica attesa (dati, comunicazione, memoria).
+        """
+        usage = summarize_resource_usage(samples)
+        if not usage:
+            return None
+        self.resource_usage.setdefault(server_round, {})[kind] = usage
+        self.record_round_metrics(server_round, {
+            f"{kind}/resources/{name}": len(value) if isinstance(value, list) else value
+            for name, value in usage.items()
+        })
+        if kind == "fit":
+            saturated = f", saturi {usage['saturated_nodes']}" if usage["saturated_nodes"] else ""
+            print(
+                f"🖥️  Round {server_round}: CPU {usage['cpu_util_mean']:.0%} "
+                f"(max {usage['cpu_util_max']:.0%}), RSS max {usage['rss_mb_max']:.0f} MB{saturated}"
+            )
+        return usage
+    
+    def record_round_metrics(self, server_round, values):
+        """Aggiunge valori al log del round (inviato quando il round successivo termina)"""
+        with self.metrics_lock:
+            self.round_metrics.setdefault(server_round, {}).update(values)
+            self.pending_metrics.setdefault(server_round, {}).update(values)
+    
+    def record_client_metrics(self, server_round, kind, metrics):
+        """
+        Media pesata per numero di esempi delle metriche dei client del round
+        
+        Args:
+            kind: "fit" o "evaluate" (prefisso delle metriche nel log)
+            metrics: Lista di (num_examples, metriche del client)
+        """
+        if not metrics:
+            return
+        values = {f"{kind}/{name}": value for name, value in weighted_metrics(metrics).items()}
+        values[f"{kind}/clients"] = len(metrics)
+        # Client logici: un supernode virtuale ne serve virtual_clients
+        values[f"{kind}/logical_clients"] = sum(int(m.get("virtual_clients", 1)) for _, m in metrics)
+        values[f"{kind}/examples"] = sum(num_examples for num_examples, _ in metrics)
+        if self.metric_histograms:
+            for name, counts in client_metric_histograms(metrics, self.metric_histogram_bins).items():
+                values[f"{kind}/{name}_histogram"] = counts
+        self.record_round_metrics(server_round, values)
+    
+    def flush_round_metrics(self, upto=None):
+        """Un log per round, in ordine, dei round fino a upto (tutti se None)"""
+        with self.metrics_lock:
+            rounds = [r for r in sorted(self.pending_metrics) if upto is None or r <= upto]
+            pending = [(r, self.pending_metrics.pop(r)) for r in rounds]
+        for server_round, values in pending:
+            timestamps = self.round_timestamps.get(server_round, {})
+            for name in ("elapsed_seconds", "round_seconds"):
+                if name in timestamps:
+                    values.setdefault(f"server/{name}", timestamps[name])
+            if self.metrics_sink is not None:
+                self.metrics_sink.log({"round": server_round, **values})
+    
+    def warmup_missing(self, node_ids):
+        """Nodi a cui non è ancora stato chiesto il warm-up"""
+        if not self.client_warmup:
+            return []
+        return [node_id for node_id in node_ids if str(node_id) not in self.warmup_nodes]
+    
+    def record_warmup(self, reports, seconds):
+        """
+        Registra il warm-up dei client (report per nodo, None se fallito)
+        
+        Se nessun round è ancora terminato il tempo di esecuzione riparte da
+        qui: execution_time_seconds e i tempi all'obiettivo misurano solo il
+        training, il warm-up è riportato a parte.
+        """
+        for node_id, report in reports.items():
+            self.warmup_nodes[str(node_id)] = report
+        self.warmup_seconds += seconds
+        if not self.round_timestamps:
+            self.start_time = time.time()
+        ready = sum(1 for report in reports.values() if report is not None)
+        print(f"🔥 Warm-up di {ready}/{len(reports)} client in {seconds:.1f}s")
+    
+    def warm_up(self, proxies):
+        """
+        Warm-up dei ClientProxy non ancora preparati (modalità batch)
+        
+        Returns:
+            float: Secondi impiegati (0 se non c'era nulla da fare)
+        """
+        missing = set(self.warmup_missing([proxy.cid for proxy in proxies]))
+        if not missing:
+            return 0.0
+        warmup_start = time.time()
+        reports = warm_up_proxies(
+            [proxy for proxy in proxies if proxy.cid in missing],
+            steps=self.client_warmup_steps,
+            timeout=self.client_warmup_timeout,
+        )
+        seconds = time.time() - warmup_start
+        self.record_warmup(reports, seconds)
+        return seconds
+    
+    def experiment_config(self, node_id):
+        """
+        Metadati dell'esperimento da aggiungere al config di fit/evaluate del nodo
+        
+        Inviati finché il nodo non risponde con successo la prima volta (di
+        solito solo il primo fit o evaluate): il client inizializza il tracking
+        senza leggere file condivisi. Il numero del client è assegnato al primo
+        contatto e registrato nell'archivio.
+        """
+        key = str(node_id)
+        if key in self.announced_nodes:
+            return {}
+        if key not in self.client_numbers:
+            _, self.client_numbers[key], _ = get_store().register_client(self.group_name, key)
+        return {
+            "experiment-id": self.experiment_id,
+            "experiment-group": self.group_name,
+            "experiment-nodes": str(self.nodes),
+            "experiment-rounds": str(self.rounds),
+            "experiment-epochs": str(self.epochs),
+            "client-number": self.client_numbers[key],
+        }
+    
+    def sync_clocks(self, proxies):
+        """Stima l'offset dell'orologio dei client non ancora misurati (modalità batch)"""
+        if self.clock_sync_samples <= 0:
+            return
+        missing = set(self.clock.missing([proxy.cid for proxy in proxies]))
+        sync_proxy_clocks(
+            self.clock, [proxy for proxy in proxies if proxy.cid in missing], samples=self.clock_sync_samples
+        )
+    
+    def mark_round_end(self, server_round):
+        """Registra l'istante in cui il modello del round è stato aggregato"""
+        now = time.time()
+        previous = self.round_timestamps.get(server_round - 1, {}).get("timestamp", self.start_time)
+        self.timeline.add(server_round, "server", "round", previous, now)
+        self.round_timestamps[server_round] = {
+            "timestamp": now,
+            "elapsed_seconds": round(now - self.start_time, 3),
+            "round_seconds": round(now - previous, 3),
+        }
+        # Avanzamento visibile dall'archivio durante il training (scritto a blocchi)
+        get_store().add_round(self.experiment_id, server_round, self.round_timestamps[server_round])
+        # Il round precedente è completo (fit, valutazione federata e lato server)
+        self.flush_round_metrics(upto=server_round - 1)
+    
+    def record_accuracy(self, server_round, accuracy, source="federated"):
+        """Registra l'accuratezza del round e verifica obiettivi ed early stop"""
+        if accuracy is None or self.start_time is None:
+            return
+        elapsed = round(time.time() - self.start_time, 2)
+        self.accuracy_history.append(
+            {"round": server_round, "accuracy": accuracy, "elapsed_seconds": elapsed, "source": source}
+        )
+        
+        # Con la valutazione lato server l'obiettivo si misura sul test set centralizzato
+        target_source = "server" if self.evaluate_fn is not None else "federated"
+        if source != target_source:
+            return
+        
+        # Il tempo all'obiettivo è quello in cui il modello è stato prodotto, non valutato
+        model_elapsed = self.round_timestamps.get(server_round, {}).get("elapsed_seconds", elapsed)
+        for threshold in self.target_thresholds:
+            key = str(threshold)
+            if key not in self.time_to_targets and accuracy >= threshold:
+                self.time_to_targets[key] = {"round": server_round, "seconds": model_elapsed}
+                print(f"🎯 Target {threshold:.2%} raggiunto al round {server_round} dopo {model_elapsed:.1f}s")
+        if self.target_accuracy and self.target_reached is None and accuracy >= self.target_accuracy:
+            self.target_reached = self.time_to_targets[str(self.target_accuracy)]
+            if self.early_stop_target:
+                self.request_stop(server_round, "target")
+        
+        # Plateau: nessun miglioramento di almeno min_delta per patience valutazioni
+        if self.best_accuracy is None or accuracy > self.best_accuracy + self.early_stop_min_delta:
+            self.best_accuracy = accuracy
+            self.evaluations_without_improvement = 0
+        else:
+            self.evaluations_without_improvement += 1
+            if self.early_stop_patience and self.evaluations_without_improvement >= self.early_stop_patience:
+                self.request_stop(server_round, "plateau")
+    
+    def request_stop(self, server_round, reason):
+        """Termina il training dopo il round corrente"""
+        if self.stop_reason is not None:
+            return
+        self.stop_reason = reason
+        self.stopped_at_round = max([server_round] + list(self.round_timestamps))
+        print(f"🛑 Early stop ({reason}) dopo il round {self.stopped_at_round}")
+    
+    def should_evaluate(self, server_round):
+        """True se il round è nel calendario delle valutazioni (federata e lato server)"""
+        if self.eval_final and server_round >= int(self.rounds):
+            return True
+        if self.eval_mode == "geometric":
+            # Round 1, ⌈r⌉, ⌈r²⌉, ... (con r = 2: 1, 2, 4, 8, 16, ...)
+            point = 1.0
+            while math.ceil(point) <= server_round:
+                if math.ceil(point) == server_round:
+                    return True
+                point *= max(self.eval_ratio, 1.01)
+            return False
+        return server_round % self.eval_interval == 0
+    
+    def federated_evaluation_round(self, server_round):
+        """
+        True se il round richiede una valutazione federata separata
+        
+        Con fused_evaluation il modello del round r viene valutato dai client
+        all'inizio del fit del round r+1: resta separata solo l'ultima valutazione.
+        """
+        if self.fraction_evaluate == 0.0 or not self.should_evaluate(server_round):
+            return False
+        return not self.fused_evaluation or server_round >= int(self.rounds)
+    
+    def fit_config(self, server_round):
+        """Config dei FitIns, con la richiesta di valutazione fusa del modello ricevuto"""
+        config = {}
+        if self.on_fit_config_fn is not None:
+            config = dict(self.on_fit_config_fn(server_round))
+        if self.fused_evaluation and server_round > 1 and self.should_evaluate(server_round - 1):
+            config["fused-eval"] = True
+        return config
+    
+    def aggregate_fused_evaluation(self, server_round, fit_metrics):
+        """
+        Aggrega le metriche di valutazione arrivate con i risultati di fit
+        
+        I client hanno valutato il modello globale ricevuto, cioè quello
+        prodotto dal round precedente: le metriche vengono registrate come
+        valutazione del round server_round - 1.
+        """
+        evaluations = [
+            (int(m["eval_examples"]), {"accuracy": m["eval_accuracy"], "loss": m["eval_loss"]})
+            for _, m in fit_metrics if "eval_examples" in m
+        ]
+        total_examples = sum(num_examples for num_examples, _ in evaluations)
+        if total_examples == 0:
+            return None
+        
+        eval_round = server_round - 1
+        loss = sum(n * m["loss"] for n, m in evaluations) / total_examples
+        metrics = weighted_average(evaluations)
+        print(
+            f"📊 Round {eval_round} (fit+eval) - Loss: {loss:.4f}, Accuracy: {metrics['accuracy']:.4f} "
+            f"(IC 95% {metrics['accuracy_ci_low']:.4f}-{metrics['accuracy_ci_high']:.4f})"
+        )
+        self.record_accuracy(eval_round, metrics["accuracy"], source="federated")
+        self.record_client_metrics(eval_round, "evaluate", evaluations)
+        self.record_round_timing(
+            eval_round, phase="fused_evaluation", loss=loss, clients=len(evaluations), **metrics
+        )
+        return loss, metrics
+    
+    def select_nodes(self, server_round, node_ids, num_nodes):
+        """Seleziona i nodi del round con la politica configurata e ne registra la decisione"""
+        selected, decision = self.selection_policy.select(node_ids, num_nodes, server_round)
+        self.record_round_timing(server_round, phase="selection", **decision)
+        if decision["policy"] != "uniform":
+            forced = f", forzati {decision['forced']}" if decision.get("forced") else ""
+            print(f"🧭 Round {server_round}: selezione {decision['policy']} → {decision['selected']}{forced}")
+        return selected
+    
+    def fit_deadline(self, server_round, selected, sample_size):
+        """
+        Deadline del round di fit in modalità batch (None = attende tutti i client)
+
+        Il Server di Flower attende ogni client contattato: con over-selection
+        e senza round-deadline la deadline si ricava dalle latenze recenti,
+        così i k + m nodi non tengono aperto il round fino al più lento.
+        Finché meno di k nodi hanno una latenza misurata (primo round) si
+        attendono tutti.
+        """
+        if self.round_deadline or self.over_selection <= 0:
+            return self.round_deadline or None
+        history = self.selection_policy.history
+        estimates = sorted(
+            estimate for estimate in (history.estimate(cid) for cid in selected) if estimate is not None
+        )
+        if len(estimates) < sample_size:
+            return None
+        deadline = self.over_selection_slack * estimates[sample_size - 1]
+        self.record_round_timing(server_round, derived_deadline_seconds=round(deadline, 3))
+        return deadline
+    
+    def record_latency(self, node_id, seconds):
+        """Aggiorna lo storico delle latenze di fit del nodo"""
+        self.selection_policy.history.record(node_id, seconds)
     
     def initialize_parameters(self, client_manager):
         """Chiamato all'inizio del training"""
-        import time
         self.start_time = time.time()
         print(f"⏱️  Inizio training: {self.group_name}")
         return super().initialize_parameters(client_manager)
     
+    def configure_fit(self, server_round, parameters, client_manager):
+        """Seleziona k + over_selection client e ne registra i tempi di risposta"""
+        if self.stop_reason is not None:
+            # Early stop: i round rimanenti di Flower passano senza client
+            return []
+        configure_start = time.time()
+        fit_ins = FitIns(parameters, self.fit_config(server_round))
+        
+        num_available = client_manager.num_available()
+        sample_size, min_num_clients = self.num_fit_clients(num_available)
+        self.fit_targets[server_round] = sample_size
+        client_manager.wait_for(min_num_clients)
+        available = client_manager.all()
+        selected = self.select_nodes(
+            server_round, list(available), min(sample_size + self.over_selection, len(available))
+        )
+        clients = [available[cid] for cid in selected]
+        self.sync_clocks(clients)
+        # Il warm-up non fa parte della configurazione del round
+        configure_start += self.warm_up(clients)
+        
+        events = self.fit_events[server_round] = {}
+        timeout = self.fit_deadline(server_round, selected, sample_size)
+        instructions = [
+            (TimedClientProxy(client, events, timeout), with_experiment_config(fit_ins, self.experiment_config(client.cid)))
+            for client in clients
+        ]
+        self.dispatch_times[("fit", server_round)] = time.time()
+        self.record_phase(server_round, configure_fit_seconds=time.time() - configure_start)
+        return instructions
+    
+    def select_fit_results(self, server_round, results):
+        """
+        Tiene i primi k risultati in ordine di arrivo e classifica gli altri client
+        
+        Returns:
+            tuple: (risultati da aggregare, report del round)
+        """
+        events = self.fit_events.pop(server_round, {})
+        target = self.fit_targets.pop(server_round, len(results))
+        self.record_result_times(server_round, "fit", events)
+        self.record_client_timings(server_round, "fit", [
+            (proxy.cid, fit_res.metrics, round_trip_seconds(events.get(proxy.cid))) for proxy, fit_res in results
+        ])
+        
+        # Latenze per la selezione dei round successivi (per i nodi in ritardo è un limite inferiore)
+        for cid, event in events.items():
+            if event["status"] in ("ok", "late"):
+                self.record_latency(cid, event["received"] - event["sent"])
+        
+        results = sorted(results, key=lambda r: events.get(r[0].cid, {}).get("received", 0.0))
+        kept, surplus = results[:target], results[target:]
+        
+        report = {
+            "selected": len(events) if events else len(results),
+            "target": target,
+            "kept": len(kept),
+            "surplus_nodes": [proxy.cid for proxy, _ in surplus],
+            "late_nodes": [cid for cid, event in events.items() if event["status"] == "late"],
+            "dropped_nodes": [cid for cid, event in events.items() if event["status"] == "failed"],
+        }
+        return kept, report
+    
+    def aggregate_fit(self, server_round, results, failures):
+        """Media pesata con il kernel multi-thread su buffer piatti"""
+        if not results:
+            return None, {}
+        if not self.accept_failures and failures:
+            return None, {}
+        aggregate_start = time.time()
+        
+        # Le valutazioni fuse valgono anche per i client in eccesso
+        if self.fused_evaluation:
+            self.aggregate_fused_evaluation(server_round, [(res.num_examples, res.metrics) for _, res in results])
+        
+        # Over-selection: si aggregano solo i primi k arrivati entro la deadline
+        results, report = self.select_fit_results(server_round, results)
+        self.record_round_timing(server_round, **report)
+        if report["late_nodes"] or report["dropped_nodes"]:
+            print(
+                f"⚠️  Round {server_round}: in ritardo {report['late_nodes']}, "
+                f"falliti {report['dropped_nodes']}"
+            )
+        
+        weights_results = [
+            (parameters_to_ndarrays(fit_res.parameters), fit_res.num_examples)
+            for _, fit_res in results
+        ]
+        # Gli aggregatori edge inviano somme parziali con il totale degli esempi del gruppo
+        partial = [bool(fit_res.metrics.get(PARTIAL_SUM_KEY, 0)) for _, fit_res in results]
+        aggregated = self.kernel.weighted_sum(weights_results, partial=partial)
+        num_examples = sum(fit_res.num_examples for _, fit_res in results)
+        parameters_aggregated = self.apply_server_update(server_round, aggregated, num_examples)
+        self.mark_round_end(server_round)
+        
+        fit_metrics = [(res.num_examples, res.metrics) for _, res in results]
+        self.record_client_metrics(server_round, "fit", fit_metrics)
+        metrics_aggregated = {}
+        if self.fit_metrics_aggregation_fn:
+            metrics_aggregated = self.fit_metrics_aggregation_fn(fit_metrics)
+        
+        self.record_phase(server_round, aggregate_fit_seconds=time.time() - aggregate_start)
+        return parameters_aggregated, metrics_aggregated
+    
+    def apply_server_update(self, server_round, ndarrays, num_examples):
+        """
+        Applica l'ottimizzatore lato server della strategia alla media pesata
+        
+        La media (calcolata dal kernel o in streaming) viene passata alla
+        strategia come unico risultato: la media di un solo risultato è il
+        risultato stesso, quindi resta solo il passo di FedAvgM/FedAdam/FedYogi.
+        """
+        if self.server_optimizer is None:
+            return ndarrays_to_parameters(ndarrays)
+        fit_res = FitRes(
+            status=Status(code=Code.OK, message=""),
+            parameters=ndarrays_to_parameters(ndarrays),
+            num_examples=num_examples,
+            metrics={},
+        )
+        parameters_aggregated, _ = super().aggregate_fit(server_round, [(None, fit_res)], [])
+        return parameters_aggregated
+    
+    def configure_evaluate(self, server_round, parameters, client_manager):
+        """Valutazione federata solo nei round previsti dal calendario"""
+        if self.stop_reason is not None or not self.federated_evaluation_round(server_round):
+            return []
+        configure_start = time.time()
+        events = self.eval_events[server_round] = {}
+        instructions = [
+            (TimedClientProxy(client, events), with_experiment_config(evaluate_ins, self.experiment_config(client.cid)))
+            for client, evaluate_ins in super().configure_evaluate(server_round, parameters, client_manager)
+        ]
+        self.dispatch_times[("evaluate", server_round)] = time.time()
+        self.record_phase(server_round, configure_evaluate_seconds=time.time() - configure_start)
+        return instructions
+    
+    def aggregate_evaluate(self, server_round, results, failures):
+        """Valutazione federata: registra l'accuratezza per il tempo all'obiettivo"""
+        events = self.eval_events.pop(server_round, {})
+        self.record_result_times(server_round, "evaluate", events)
+        if events:
+            # Nei loop di driver_loop.py i tempi dei client li registra EvaluationRound
+            self.record_client_timings(server_round, "evaluate", [
+                (proxy.cid, evaluate_res.metrics, round_trip_seconds(events.get(proxy.cid)))
+                for proxy, evaluate_res in results
+            ])
+        aggregate_start = time.time()
+        loss, metrics = super().aggregate_evaluate(server_round, results, failures)
+        self.record_phase(server_round, aggregate_evaluate_seconds=time.time() - aggregate_start)
+        self.record_client_metrics(server_round, "evaluate", [
+            (evaluate_res.num_examples, {"loss": evaluate_res.loss, **evaluate_res.metrics})
+            for _, evaluate_res in results
+        ])
+        if loss is not None and metrics and "accuracy" in metrics:
+            print(
+                f"📊 Round {server_round} (federata) - Loss: {loss:.4f}, Accuracy: {metrics['accuracy']:.4f} "
+                f"(IC 95% {metrics['accuracy_ci_low']:.4f}-{metrics['accuracy_ci_high']:.4f})"
+            )
+            self.record_accuracy(server_round, metrics["accuracy"], source="federated")
+        return loss, metrics
+    
     def evaluate(self, server_round, parameters):
         """Chiamato alla fine di ogni round"""
+        if self.evaluate_fn is not None and not self.should_evaluate(server_round):
+            return None
+        if self.stop_reason is not None and server_round > self.stopped_at_round:
+            return None
         result = super().evaluate(server_round, parameters)
         
         # Log round metrics if available
@@ -34,75 +722,201 @@ class TimedFedAvg(FedAvg):
             metrics_dict = result[1] if len(result) > 1 else {}
             accuracy = metrics_dict.get("accuracy", 0.0)
             print(f"📊 Round {server_round} - Loss: {loss:.4f}, Accuracy: {accuracy:.4f}")
+            self.record_accuracy(server_round, metrics_dict.get("accuracy"), source="server")
+            self.record_round_metrics(server_round, {
+                f"server/{name}": value for name, value in {"loss": loss, **metrics_dict}.items()
+            })
         
-        # Se è l'ultimo round, calcola il tempo totale
-        if server_round >= int(self.rounds):
-            import time
-            self.end_time = time.time()
-            execution_time = self.end_time - self.start_time
-            
-            # Converte stringhe in numeri
-            def safe_int(value, default=0):
-                try:
-                    return int(value) if value != "unknown" else default
-                except (ValueError, TypeError):
-                    return default
-            
-            # Log del timing
-            timing_data = {
-                "experiment_id": self.experiment_id,
-                "nodes": safe_int(self.nodes),
-                "rounds": safe_int(self.rounds),
-                "epochs": safe_int(self.epochs),
-                "fraction-fit": self.fraction_fit,
-                "execution_time_seconds": round(execution_time, 2),
-                "execution_time_minutes": round(execution_time / 60, 2)
+        return result
+    
+    def round_rows(self):
+        """Tutto ciò che è stato misurato per ogni round, per la tabella rounds dell'archivio"""
+        rows = {}
+        for server_round, values in self.round_timestamps.items():
+            rows.setdefault(server_round, {}).update(values)
+        for server_round, phases in self.phase_timings.items():
+            rows.setdefault(server_round, {})["phases"] = phases
+        for server_round, kinds in self.client_timings.items():
+            rows.setdefault(server_round, {})["client_timings"] = kinds
+        for server_round, kinds in self.resource_usage.items():
+            rows.setdefault(server_round, {})["resource_usage"] = kinds
+        for entry in self.accuracy_history:
+            rows.setdefault(entry["round"], {})["accuracy"] = entry
+        for server_round, values in self.round_metrics.items():
+            rows.setdefault(server_round, {})["metrics"] = values
+        return rows
+    
+    def finish_experiment(self):
+        """
+        Calcola il tempo totale e salva il timing dell'esperimento
+        
+        Chiamato da main() a fine training, dopo l'ultima valutazione federata,
+        così il tempo all'obiettivo include anche l'ultimo round.
+        """
+        self.end_time = time.time()
+        execution_time = self.end_time - self.start_time
+        
+        # Converte stringhe in numeri
+        def safe_int(value, default=0):
+            try:
+                return int(value) if value != "unknown" else default
+            except (ValueError, TypeError):
+                return default
+        
+        # Log del timing
+        timing_data = {
+            "experiment_id": self.experiment_id,
+            "group_name": self.group_name,
+            "nodes": safe_int(self.nodes),
+            "rounds": safe_int(self.rounds),
+            "epochs": safe_int(self.epochs),
+            "fraction-fit": self.fraction_fit,
+            "aggregation_mode": self.aggregation_mode,
+            "strategy": self.server_optimizer or "fedavg",
+            "execution_time_seconds": round(execution_time, 2),
+            "execution_time_minutes": round(execution_time / 60, 2)
+        }
+        if self.target_accuracy:
+            reached = self.target_reached or {}
+            timing_data["target_accuracy"] = self.target_accuracy
+            timing_data["rounds_to_target"] = reached.get("round")
+            timing_data["seconds_to_target"] = reached.get("seconds")
+        if self.target_thresholds:
+            timing_data["time_to_targets"] = {
+                str(t): self.time_to_targets.get(str(t)) for t in self.target_thresholds
             }
-            
-            # Salva timing
-            timing_file = "pytorchtest/experiment_timings.json"
-            timings = load_json_safe(timing_file, {"timings": []})
-            timings["timings"].append(timing_data)
-            save_json_safe(timing_file, timings)
-            
-            print(f"⏱️  Training completato in: {execution_time:.1f}s ({execution_time/60:.1f} min)")
-            print(f"✅ Esperimento {self.group_name} completato!")
+        if self.stop_reason is not None:
+            timing_data["early_stop"] = {
+                "reason": self.stop_reason,
+                "round": self.stopped_at_round,
+                "rounds_completed": len(self.round_timestamps),
+            }
+        if self.phase_timings:
+            timing_data["phase_timings"] = [
+                {"round": r, **phases} for r, phases in sorted(self.phase_timings.items())
+            ]
+            timing_data["phase_summary"] = self.phase_summary()
+        if self.client_timings:
+            timing_data["client_timings"] = [
+                {"round": r, **kinds} for r, kinds in sorted(self.client_timings.items())
+            ]
+        if self.resource_usage:
+            timing_data["resource_usage"] = [
+                {"round": r, **kinds} for r, kinds in sorted(self.resource_usage.items())
+            ]
+        if self.timeline.client_spans():
+            timing_data["utilization"] = {
+                "nodes": self.timeline.node_stats(),
+                "rounds": self.timeline.round_stats(),
+                "clock_offsets": self.clock.summary(),
+            }
+            timing_data["chrome_trace"] = self.timeline.save_chrome_trace(
+                f"pytorchtest/traces/{self.group_name}.json"
+            )
+        if self.warmup_nodes:
+            timing_data["warmup"] = {
+                "seconds": round(self.warmup_seconds, 3),
+                "nodes": self.warmup_nodes,
+            }
+        if self.round_timestamps:
+            timing_data["round_timestamps"] = [
+                {"round": r, **values} for r, values in sorted(self.round_timestamps.items())
+            ]
+        if self.accuracy_history:
+            timing_data["accuracy_history"] = self.accuracy_history
+        if self.round_timings:
+            timing_data["rounds_detail"] = self.round_timings
         
-        return result
+        # Salva timing e righe per round nell'archivio (tabelle timings e rounds)
+        store = get_store()
+        for server_round, values in self.round_rows().items():
+            store.add_round(self.experiment_id, server_round, values)
+        store.record_timing(timing_data)
+        
+        # Ultimo round e chiusura del sink (invia i record in coda)
+        self.flush_round_metrics()
+        if self.metrics_sink is not None:
+            self.metrics_sink.close()
+            if os.path.exists(self.metrics_sink.spool_path):
+                print(f"⚠️  Metriche del server non inviate, restano nello spool {self.metrics_sink.spool_path}")
+        
+        print(f"⏱️  Training completato in: {execution_time:.1f}s ({execution_time/60:.1f} min)")
+        if self.warmup_nodes:
+            print(f"   🔥 Warm-up dei client (escluso): {self.warmup_seconds:.1f}s")
+        for label, phases in timing_data.get("phase_summary", {}).items():
+            details = ", ".join(
+                f"{name.replace('_seconds', '')} {value:.2f}s" for name, value in phases.items() if name != "rounds"
+            )
+            print(f"   ⏱️  {label} ({phases['rounds']} round): {details}")
+        if self.target_accuracy and self.target_reached is None:
+            print(f"⚠️  Target {self.target_accuracy:.2%} non raggiunto")
+        print(f"✅ Esperimento {self.group_name} completato!")
 
 
-from task import Net, get_weights
-import os
-import json
-from datetime import datetime
+class TimedFedAvg(TimedStrategyMixin, FedAvg):
+    """FedAvg con tracking del tempo di esecuzione e metriche avanzate"""
+
 
-# Percorsi ai file di configurazione
-GROUP_PATH = "pytorchtest/group_id.json"
-CURRENT_PATH = "pytorchtest/current_id.json"
-CLIENT_PATH = "pytorchtest/client_id.json"
+class TimedFedAvgM(TimedStrategyMixin, FedAvgM):
+    """FedAvg con momentum lato server"""
+    
+    server_optimizer = "fedavgm"
 
 
-def load_json_safe(path, default=None):
-    """Carica un file JSON in modo sicuro, gestendo file mancanti o corrotti"""
-    if not os.path.exists(path):
-        return default if default is not None else {}
-    try:
-        with open(path, "r") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
-        print(f"⚠️  Warning: File {path} corrotto o non leggibile, uso default")
-        return default if default is not None else {}
+class TimedFedAdam(TimedStrategyMixin, FedAdam):
+    """FedAdam: ottimizzatore adattivo lato server"""
+    
+    server_optimizer = "fedadam"
 
 
-def save_json_safe(path, data):
-    """Salva un file JSON in modo sicuro"""
-    try:
-        with open(path, "w") as f:
-            json.dump(data, f, indent=4)
-        return True
-    except IOError as e:
-        print(f"❌ Errore nel salvare {path}: {e}")
-        return False
+class TimedFedYogi(TimedStrategyMixin, FedYogi):
+    """FedYogi: come FedAdam ma con aggiornamento additivo del secondo momento"""
+    
+    server_optimizer = "fedyogi"
+
+
+# Strategie selezionabili con server-strategy in pyproject.toml
+TIMED_STRATEGIES = {
+    "fedavg": TimedFedAvg,
+    "fedavgm": TimedFedAvgM,
+    "fedadam": TimedFedAdam,
+    "fedyogi": TimedFedYogi,
+}
+
+
+class TimedFedBuff(TimedFedAvg):
+    """FedBuff asincrono: il modello viene aggiornato ogni K risultati, pesati per staleness"""
+    
+    def __init__(self, *args, buffer_size=2, staleness_exponent=0.5, server_learning_rate=1.0, **kwargs):
+        kwargs.setdefault("aggregation_mode", "async")
+        super().__init__(*args, **kwargs)
+        self.buffer_size = buffer_size
+        self.staleness_exponent = staleness_exponent
+        self.server_learning_rate = server_learning_rate
+    
+    def staleness_weight(self, staleness):
+        """Peso polinomiale 1/(1+τ)^a per aggiornamenti calcolati su un modello vecchio"""
+        return 1.0 / (1.0 + staleness) ** self.staleness_exponent
+    
+    def add_buffered_update(self, aggregator, ndarrays, base_ndarrays, num_examples, staleness):
+        """
+        Aggiunge al buffer il delta di un client, smorzato per staleness
+
+        Il delta viene scalato per s(τ) e sommato con peso n_i: la media del
+        buffer è Σ n_i·s(τ_i)·Δ_i / Σ n_i, quindi un buffer di soli aggiornamenti
+        vecchi produce un passo più piccolo (con peso n_i·s(τ_i) il fattore si
+        semplificherebbe nella normalizzazione).
+        """
+        factor = self.staleness_weight(staleness)
+        delta = [(new - base) * factor for new, base in zip(ndarrays, base_ndarrays)]
+        aggregator.add(delta, num_examples)
+    
+    def apply_buffered_update(self, ndarrays, mean_delta):
+        """w ← w + η · Δ medio del buffer"""
+        return [
+            (layer + self.server_learning_rate * delta).astype(layer.dtype, copy=False)
+            for layer, delta in zip(ndarrays, mean_delta)
+        ]
 
 
 def get_experiment_metadata():
@@ -148,29 +962,6 @@ def get_experiment_metadata():
     return metadata
 
 
-def load_last_experiment_id():
-    """Carica l'ultimo ID esperimento usato"""
-    data = load_json_safe(GROUP_PATH, {"last_experiment_id": 0})
-    return data.get("last_experiment_id", 0)
-
-
-def save_last_experiment_id(experiment_id):
-    """Salva l'ultimo ID esperimento"""
-    data = load_json_safe(GROUP_PATH, {})
-    data["last_experiment_id"] = experiment_id
-    return save_json_safe(GROUP_PATH, data)
-
-
-def save_current_experiment_info(experiment_info):
-    """Salva le informazioni dell'esperimento corrente"""
-    return save_json_safe(CURRENT_PATH, experiment_info)
-
-
-def clear_client_registry():
-    """Pulisce il registro dei client per un nuovo esperimento"""
-    return save_json_safe(CLIENT_PATH, {})
-
-
 def generate_experiment_group_name(nodes, rounds, epochs, scaling_mode="strong", samples=None):
     """
     Genera un nome di gruppo comprensibile e strutturato per l'esperimento
@@ -185,31 +976,30 @@ def generate_experiment_group_name(nodes, rounds, epochs, scaling_mode="strong",
     Returns:
         tuple: (experiment_id, group_name, experiment_info)
     """
-    # Incrementa l'ID esperimento
-    last_id = load_last_experiment_id()
-    experiment_id = last_id + 1
-    save_last_experiment_id(experiment_id)
-    
     # Genera un nome di gruppo descrittivo
     # Formato: EXP_{ID:03d}_N{nodes}_R{rounds}_E{epochs}_S{scaling}
     scaling_suffix = f"_{scaling_mode.upper()}"
     if scaling_mode == "weak" and samples:
         scaling_suffix += f"{samples}"
     
-    group_name = f"EXP_{experiment_id:03d}_N{nodes}_R{rounds}_E{epochs}{scaling_suffix}"
-    
-    # Informazioni complete dell'esperimento
-    experiment_info = {
-        "experiment_id": experiment_id,
-        "group_name": group_name,
-        "nodes": nodes,
-        "rounds": rounds,
-        "epochs": epochs,
-        "scaling_mode": scaling_mode,
-        "samples_per_client": samples if samples else "N/A",
-        "timestamp": datetime.now().isoformat(),
-        "description": f"Federated Learning: {nodes} nodi, {rounds} round, {epochs} epoche, {scaling_mode} scaling"
-    }
+    def build_info(experiment_id):
+        # Informazioni complete dell'esperimento
+        return {
+            "experiment_id": experiment_id,
+            "group_name": f"EXP_{experiment_id:03d}_N{nodes}_R{rounds}_E{epochs}{scaling_suffix}",
+            "nodes": nodes,
+            "rounds": rounds,
+            "epochs": epochs,
+            "scaling_mode": scaling_mode,
+            "samples_per_client": samples if samples else "N/A",
+            "timestamp": datetime.now().isoformat(),
+            "description": f"Federated Learning: {nodes} nodi, {rounds} round, {epochs} epoche, {scaling_mode} scaling"
+        }
+    
+    # L'archivio alloca l'ID e salva l'esperimento in un'unica transazione:
+    # diventa anche l'esperimento corrente letto dai client
+    experiment_info = get_store().allocate_experiment(build_info)
+    experiment_id, group_name = experiment_info["experiment_id"], experiment_info["group_name"]
     
     print(f"🚀 Nuovo esperimento: {group_name}")
     print(f"   📊 Configurazione: {nodes} nodi, {rounds} round, {epochs} epoche")
@@ -220,6 +1010,194 @@ def generate_experiment_group_name(nodes, rounds, epochs, scaling_mode="strong",
     return experiment_id, group_name, experiment_info
 
 
+def weighted_average(metrics):
+    """
+    Accuratezza media dei client pesata per numero di esempi
+    
+    L'intervallo di confidenza è calcolato sull'insieme dei campioni valutati
+    da tutti i client (sottoinsiemi indipendenti di partizioni diverse).
+    """
+    total_examples = sum(num_examples for num_examples, _ in metrics)
+    if total_examples == 0:
+        return {}
+    accuracy = sum(num_examples * m.get("accuracy", 0.0) for num_examples, m in metrics) / total_examples
+    ci_low, ci_high = accuracy_confidence_interval(accuracy, total_examples)
+    return {"accuracy": accuracy, "accuracy_ci_low": ci_low, "accuracy_ci_high": ci_high}
+
+
+def aggregated_metric_names(metrics):
+    """
+    Metriche dei client da aggregare: numeriche, esclusi tempi per fase
+    (riassunti da summarize_client_timings), risorse (summarize_resource_usage),
+    istanti assoluti e conteggi di esempi
+    """
+    names = set()
+    for _, m in metrics:
+        for name, value in m.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if name == PARTIAL_SUM_KEY or name.startswith(("time_", "resource_")):
+                continue
+            if name.endswith(("_timestamp", "_examples")):
+                continue
+            names.add(name)
+    return sorted(names)
+
+
+def weighted_metrics(metrics):
+    """
+    Media pesata per numero di esempi di ogni metrica numerica dei client
+    
+    Usata come fit_metrics_aggregation_fn: ogni metrica è mediata sui soli
+    client che l'hanno riportata.
+    """
+    aggregated = {}
+    for name in aggregated_metric_names(metrics):
+        weighted = [(num_examples, float(m[name])) for num_examples, m in metrics if name in m]
+        total_examples = sum(num_examples for num_examples, _ in weighted)
+        if total_examples > 0:
+            aggregated[name] = sum(n * value for n, value in weighted) / total_examples
+    return aggregated
+
+
+def evaluate_metrics_average(metrics):
+    """evaluate_metrics_aggregation_fn: medie pesate più l'intervallo di confidenza dell'accuratezza"""
+    return {**weighted_metrics(metrics), **weighted_average(metrics)}
+
+
+def client_metric_histograms(metrics, bins=10):
+    """Distribuzione tra i client (non pesata) di ogni metrica aggregata"""
+    return {
+        name: histogram([float(m[name]) for _, m in metrics if name in m], bins=bins)
+        for name in aggregated_metric_names(metrics)
+    }
+
+
+def setup_server_tracking(experiment_info):
+    """
+    Run wandb del server: un solo log per round con le metriche aggregate
+    
+    Le metriche usano "round" come asse x, così i log arrivati in ritardo
+    (valutazione sovrapposta al fit del round successivo) restano allineati.
+    """
+    group_name = experiment_info["group_name"]
+    run = wandb.init(
+        project="CNN_Stage",
+        entity="damiano-cannizzaro-universit-di-torino",
+        group=group_name,
+        name=f"{group_name}_SERVER",
+        id=hashlib.md5(f"{group_name}_SERVER".encode()).hexdigest(),
+        config={
+            "experiment_id": experiment_info["experiment_id"],
+            "nodes": experiment_info["nodes"],
+            "server_rounds": experiment_info["rounds"],
+            "local_epochs": experiment_info["epochs"],
+            "scaling_mode": experiment_info["scaling_mode"],
+        },
+        tags=["federated_learning", "pytorch", "server"],
+        reinit=False,
+        resume="allow",
+    )
+    run.define_metric("round")
+    run.define_metric("*", step_metric="round")
+    return run
+
+
+def make_server_metrics_sink(context: Context, experiment_info):
+    """Sink delle metriche aggregate dal server (server-metrics-backend in pyproject.toml)"""
+    group_name = experiment_info["group_name"]
+    return make_metrics_sink(
+        context.run_config.get("server-metrics-backend", "wandb"),
+        spool_path=f"pytorchtest/metrics_spool/{group_name}_SERVER.jsonl",
+        wandb_init=lambda: setup_server_tracking(experiment_info),
+        file_path=f"pytorchtest/metrics/{group_name}_SERVER.jsonl",
+        queue_size=context.run_config.get("metrics-queue-size", 1024),
+        batch_size=context.run_config.get("metrics-batch-size", 32),
+        flush_interval=float(context.run_config.get("metrics-flush-interval", 2.0)),
+    )
+
+
+def with_experiment_config(ins, extra):
+    """FitIns/EvaluateIns con i metadati dell'esperimento nel config (stessi parametri, nessuna copia)"""
+    if not extra:
+        return ins
+    return type(ins)(ins.parameters, {**ins.config, **extra})
+
+
+def round_trip_seconds(event):
+    """Round trip di un client dagli eventi di TimedClientProxy (None se non disponibile)"""
+    if not event or event["status"] != "ok":
+        return None
+    return event["received"] - event["sent"]
+
+
+def summarize_client_timings(samples, total_key="time_fit"):
+    """
+    Statistiche (mean, p50, p95, max) dei tempi riportati dai client
+    
+    Si considerano le metriche time_* e samples_per_second. Se il server ha
+    misurato il round trip, overhead_seconds = round trip - total_key è il
+    tempo fuori dal client (comunicazione, serializzazione, code della SuperLink).
+    
+    Args:
+        samples: Lista di (metriche del client, round trip in secondi o None)
+        total_key: Metrica con la durata totale della chiamata sul client
+    """
+    values = {}
+    for metrics, round_trip in samples:
+        for name, value in metrics.items():
+            if name.startswith("time_") or name == "samples_per_second":
+                values.setdefault(name, []).append(float(value))
+        if round_trip is not None and total_key in metrics:
+            values.setdefault("overhead_seconds", []).append(max(0.0, round_trip - float(metrics[total_key])))
+    
+    summary = {}
+    for name, series in sorted(values.items()):
+        series = np.asarray(series)
+        summary[name] = {
+            "mean": round(float(series.mean()), 4),
+            "p50": round(float(np.percentile(series, 50)), 4),
+            "p95": round(float(np.percentile(series, 95)), 4),
+            "max": round(float(series.max()), 4),
+            "clients": int(series.size),
+        }
+    return summary
+
+
+def get_evaluate_fn(batch_size=1024, dataset_cache=""):
+    """
+    evaluate_fn lato server: task.test sul test set CIFAR-10 già decodificato
+    
+    Il test set viene caricato una volta sola (e salvato in cache su disco),
+    il modello viene riusato tra i round.
+    """
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    testloader = load_test_data(batch_size=batch_size, dataset_cache=dataset_cache)
+    net = Net().to(device)
+    
+    def evaluate(server_round, parameters_ndarrays, config):
+        set_weights(net, parameters_ndarrays)
+        loss, accuracy = test(net, testloader, device)
+        return loss, {"accuracy": accuracy}
+    
+    return evaluate
+
+
+def server_strategy_kwargs(context: Context, server_strategy):
+    """Iperparametri dell'ottimizzatore lato server letti da pyproject.toml"""
+    server_lr = float(context.run_config.get("server-lr", 0))
+    server_momentum = float(context.run_config.get("server-momentum", 0.9))
+    if server_strategy == "fedavgm":
+        return {"server_learning_rate": server_lr or 1.0, "server_momentum": server_momentum}
+    if server_strategy in ("fedadam", "fedyogi"):
+        # 0 = learning rate di default di Flower (FedAdam 0.1, FedYogi 0.01)
+        kwargs = {"beta_1": server_momentum}
+        if server_lr:
+            kwargs["eta"] = server_lr
+        return kwargs
+    return {}
+
+
 def server_fn(context: Context):
     """Funzione principale del server con gestione migliorata degli esperimenti"""
     
@@ -227,6 +1205,46 @@ def server_fn(context: Context):
     num_rounds = context.run_config["num-server-rounds"]
     fraction_fit = context.run_config["fraction-fit"]
     local_epochs = context.run_config["local-epochs"]
+    fraction_evaluate = float(context.run_config.get("fraction-evaluate", 1.0))
+    server_evaluation = context.run_config.get("server-evaluation", False)
+    aggregation_mode = context.run_config.get("aggregation-mode", "batch")
+    aggregation_threads = context.run_config.get("aggregation-threads", 0)
+    round_deadline = float(context.run_config.get("round-deadline", 0))
+    over_selection = context.run_config.get("over-selection", 0)
+    server_strategy = context.run_config.get("server-strategy", "fedavg")
+    target_accuracy = float(context.run_config.get("target-accuracy", 0))
+    eval_schedule = EvalSchedule(
+        mode=context.run_config.get("eval-schedule", "every"),
+        interval=context.run_config.get("eval-every", 1),
+        ratio=float(context.run_config.get("eval-geometric-ratio", 2.0)),
+        final=context.run_config.get("eval-final", True),
+        fused=context.run_config.get("fused-evaluation", False),
+    )
+    early_stop = EarlyStop(
+        target_accuracy=target_accuracy,
+        thresholds=[
+            float(t) for t in str(context.run_config.get("target-thresholds", "")).split(",") if t.strip()
+        ],
+        at_target=context.run_config.get("early-stop-target", False),
+        patience=context.run_config.get("early-stop-patience", 0),
+        min_delta=float(context.run_config.get("early-stop-min-delta", 0.0)),
+    )
+    profiling = Profiling(
+        warmup_rounds=context.run_config.get("warmup-rounds", 1),
+        clock_sync_samples=context.run_config.get("clock-sync-samples", 3),
+        client_warmup=context.run_config.get("client-warmup", True),
+        client_warmup_steps=context.run_config.get("client-warmup-steps", 2),
+        client_warmup_timeout=context.run_config.get("client-warmup-timeout", 600),
+    )
+    selection_policy = make_selection_policy(
+        context.run_config.get("selection-policy", "uniform"),
+        window=context.run_config.get("selection-window", 5),
+        d=context.run_config.get("selection-d", 2),
+        max_skip=context.run_config.get("selection-max-skip", 3),
+    )
+    if server_strategy not in TIMED_STRATEGIES:
+        print(f"⚠️  Strategia {server_strategy} sconosciuta, uso fedavg")
+        server_strategy = "fedavg"
     
     # Estrazione metadati dell'esperimento
     metadata = get_experiment_metadata()
@@ -242,12 +1260,23 @@ def server_fn(context: Context):
     print(f"⚡ Scaling mode: {scaling_mode}")
     if scaling_mode == "weak":
         print(f"📦 Samples per client: {samples_per_client}")
+    print(f"🧮 Aggregation mode: {aggregation_mode}")
+    print(f"🧭 Server strategy: {server_strategy}, selezione client: {selection_policy.name}")
     
     # Inizializzazione modello
     print("🧠 Inizializzazione del modello...")
     ndarrays = get_weights(Net())
     parameters = ndarrays_to_parameters(ndarrays)
     
+    # Valutazione centralizzata: la federata diventa opzionale (fraction-evaluate = 0) o campionata
+    evaluate_fn = None
+    if server_evaluation:
+        evaluate_fn = get_evaluate_fn(
+            context.run_config.get("server-eval-batch-size", 1024),
+            dataset_cache=context.run_config.get("dataset-cache", ""),
+        )
+        print(f"🧪 Valutazione lato server attiva, fraction-evaluate federata: {fraction_evaluate}")
+    
     # Generazione e gestione del gruppo esperimento
     experiment_id, group_name, experiment_info = generate_experiment_group_name(
         nodes, rounds, epochs, scaling_mode, 
@@ -255,26 +1284,52 @@ def server_fn(context: Context):
     )
     
     # Strategia federata con timing
-    strategy = TimedFedAvg(
+    strategy_kwargs = dict(
         experiment_id=experiment_id,
         group_name=group_name,
         nodes=nodes,
         rounds=rounds,
         epochs=epochs,
         fraction_fit=fraction_fit,
-        fraction_evaluate=1.0,
+        fraction_evaluate=fraction_evaluate,
+        min_evaluate_clients=1 if fraction_evaluate < 1.0 else 2,
         min_available_clients=2,
+        evaluate_fn=evaluate_fn,
         initial_parameters=parameters,
+        fit_metrics_aggregation_fn=weighted_metrics,
+        evaluate_metrics_aggregation_fn=evaluate_metrics_average,
+        aggregation_mode=aggregation_mode,
+        aggregation_threads=aggregation_threads,
+        round_policy=RoundPolicy(
+            deadline=round_deadline,
+            over_selection=over_selection,
+            selection_policy=selection_policy,
+        ),
+        eval_schedule=eval_schedule,
+        early_stop=early_stop,
+        profiling=profiling,
+        metrics=MetricsConfig(
+            sink=make_server_metrics_sink(context, experiment_info),
+            histograms=context.run_config.get("metric-histograms", True),
+            histogram_bins=context.run_config.get("metric-histogram-bins", 10),
+        ),
     )
-    config = ServerConfig(num_rounds=num_rounds)
-    
-    # Salvataggio delle informazioni dell'esperimento corrente
-    if not save_current_experiment_info(experiment_info):
-        print("⚠️  Warning: Impossibile salvare le informazioni dell'esperimento corrente")
-    
-    # Pulizia del registro client per il nuovo esperimento
-    if not clear_client_registry():
-        print("⚠️  Warning: Impossibile pulire il registro dei client")
+    if aggregation_mode == "async":
+        if server_strategy != "fedavg":
+            print(f"⚠️  {server_strategy} non supportata in modalità async, uso FedBuff")
+        # In modalità asincrona num-server-rounds conta gli aggiornamenti del modello
+        strategy = TimedFedBuff(
+            buffer_size=context.run_config.get("async-buffer-size", 2),
+            staleness_exponent=context.run_config.get("async-staleness-exponent", 0.5),
+            server_learning_rate=context.run_config.get("async-server-lr", 1.0),
+            **strategy_kwargs,
+        )
+    else:
+        strategy = TIMED_STRATEGIES[server_strategy](
+            **strategy_kwargs, **server_strategy_kwargs(context, server_strategy)
+        )
+    # Con una deadline il Server di Flower aggrega ciò che è arrivato entro round_timeout
+    config = ServerConfig(num_rounds=num_rounds, round_timeout=round_deadline or None)
     
     print(f"✅ Server pronto per: {group_name}")
     
@@ -282,4 +1337,31 @@ def server_fn(context: Context):
 
 
 # Istanza dell'app
-app = ServerApp(server_fn=server_fn)
\ No newline at end of file
+app = ServerApp()
+
+
+@app.main()
+def main(driver: Driver, context: Context):
+    """Sceglie il loop di training in base a aggregation-mode"""
+    components = server_fn(context)
+    
+    aggregation_mode = context.run_config.get("aggregation-mode", "batch")
+    if aggregation_mode == "streaming":
+        # Aggregazione incrementale: ogni risultato viene sommato appena arriva
+        run_streaming(driver, components.strategy, components.config.num_rounds)
+    elif aggregation_mode == "pipelined":
+        # Semi-sincrono: la valutazione del round r si sovrappone al fit del round r+1
+        run_pipelined(driver, components.strategy, components.config.num_rounds)
+    elif aggregation_mode == "async":
+        # FedBuff: nessuna barriera di round, i client restano sempre occupati
+        run_async(driver, components.strategy, components.config.num_rounds)
+    else:
+        # Loop standard di Flower con aggregate_fit a batch
+        start_driver(
+            driver=driver,
+            strategy=components.strategy,
+            config=components.config,
+        )
+    
+    # Il timing viene salvato dopo l'ultima valutazione federata
+    components.strategy.finish_experiment()
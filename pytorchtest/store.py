@@ -0,0 +1,209 @@
+"""pytorchtest: archivio SQLite (WAL) di esperimenti, client e timing."""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# Database del server, letto anche da run_experiments.py
+DB_PATH = "pytorchtest/experiments.db"
+# File JSON usato prima dell'archivio: l'ultimo ID prosegue la numerazione
+LEGACY_GROUP_PATH = "pytorchtest/group_id.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    experiment_id INTEGER PRIMARY KEY,
+    group_name TEXT NOT NULL UNIQUE,
+    info TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clients (
+    group_name TEXT NOT NULL,
+    node_id TEXT NOT NULL,
+    client_name TEXT NOT NULL,
+    client_number INTEGER NOT NULL,
+    registered_at TEXT NOT NULL,
+    PRIMARY KEY (group_name, node_id)
+);
+CREATE TABLE IF NOT EXISTS rounds (
+    experiment_id INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (experiment_id, round)
+);
+CREATE TABLE IF NOT EXISTS timings (
+    experiment_id INTEGER PRIMARY KEY,
+    group_name TEXT NOT NULL,
+    strategy TEXT,
+    nodes INTEGER,
+    rounds INTEGER,
+    epochs INTEGER,
+    execution_time REAL,
+    rounds_to_target INTEGER,
+    seconds_to_target REAL,
+    finished_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS timings_by_config ON timings (strategy, nodes, rounds, epochs);
+CREATE INDEX IF NOT EXISTS timings_by_finish ON timings (finished_at);
+"""
+
+
+_store = None
+
+
+def get_store(path=DB_PATH):
+    """Archivio condiviso dal processo, aperto alla prima richiesta"""
+    global _store
+    if _store is None:
+        _store = ExperimentStore(path)
+    return _store
+
+
+def _legacy_last_id():
+    try:
+        with open(LEGACY_GROUP_PATH, "r") as f:
+            return int(json.load(f).get("last_experiment_id", 0))
+    except (OSError, ValueError, TypeError):
+        return 0
+
+
+class ExperimentStore:
+    """
+    Archivio transazionale al posto dei file JSON condivisi
+
+    - WAL: i lettori (run_experiments.py) non bloccano lo scrittore
+    - Allocazione dell'ID e registrazione dei client in transazioni
+      BEGIN IMMEDIATE: niente read-modify-write concorrenti
+    - Le righe per round vengono accumulate e scritte a blocchi (executemany
+      in una sola transazione), non una scrittura per riga
+    """
+
+    def __init__(self, path=DB_PATH, batch_size=64, timeout=30.0):
+        self.path = path
+        self.batch_size = batch_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # isolation_level=None: le transazioni sono gestite esplicitamente
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._pending_rounds = []
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def _transaction(self, work):
+        """Esegue work(conn) in una transazione BEGIN IMMEDIATE (lock di scrittura subito)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def allocate_experiment(self, build_info):
+        """
+        Alloca atomicamente il prossimo experiment_id e salva l'esperimento
+
+        Args:
+            build_info: Funzione experiment_id -> dict con almeno group_name
+
+        Returns:
+            dict: Informazioni dell'esperimento
+        """
+        def work(conn):
+            last_id = conn.execute("SELECT MAX(experiment_id) FROM experiments").fetchone()[0]
+            experiment_id = (last_id if last_id is not None else _legacy_last_id()) + 1
+            info = build_info(experiment_id)
+            conn.execute(
+                "INSERT INTO experiments (experiment_id, group_name, info, created_at) VALUES (?, ?, ?, ?)",
+                (experiment_id, info["group_name"], json.dumps(info), datetime.now().isoformat()),
+            )
+            return info
+
+        return self._transaction(work)
+
+    def register_client(self, group_name, node_id):
+        """
+        Registra il nodo nell'esperimento (idempotente)
+
+        Returns:
+            tuple: (client_name, client_number, True se appena registrato)
+        """
+        def work(conn):
+            row = conn.execute(
+                "SELECT client_name, client_number FROM clients WHERE group_name = ? AND node_id = ?",
+                (group_name, str(node_id)),
+            ).fetchone()
+            if row:
+                return row["client_name"], row["client_number"], False
+            client_number = conn.execute(
+                "SELECT COUNT(*) FROM clients WHERE group_name = ?", (group_name,)
+            ).fetchone()[0] + 1
+            client_name = f"{group_name}_CLIENT_{client_number:02d}"
+            conn.execute(
+                "INSERT INTO clients (group_name, node_id, client_name, client_number, registered_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (group_name, str(node_id), client_name, client_number, datetime.now().isoformat()),
+            )
+            return client_name, client_number, True
+
+        return self._transaction(work)
+
+    def add_round(self, experiment_id, server_round, data):
+        """Accoda la riga di un round; scritta con le altre ogni batch_size righe"""
+        self._pending_rounds.append((experiment_id, server_round, json.dumps(data)))
+        if len(self._pending_rounds) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Scrive le righe accodate in una sola transazione"""
+        with self._lock:
+            rows, self._pending_rounds = self._pending_rounds, []
+        if not rows:
+            return
+        self._transaction(lambda conn: conn.executemany(
+            "INSERT OR REPLACE INTO rounds (experiment_id, round, data) VALUES (?, ?, ?)", rows
+        ))
+
+    def record_timing(self, timing):
+        """Salva il riepilogo dell'esperimento (e le righe per round ancora accodate)"""
+        self.flush()
+        self._transaction(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO timings (experiment_id, group_name, strategy, nodes, rounds, epochs, "
+            "execution_time, rounds_to_target, seconds_to_target, finished_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                timing["experiment_id"],
+                timing["group_name"],
+                timing.get("strategy"),
+                timing.get("nodes"),
+                timing.get("rounds"),
+                timing.get("epochs"),
+                timing.get("execution_time_seconds"),
+                timing.get("rounds_to_target"),
+                timing.get("seconds_to_target"),
+                datetime.now().isoformat(),
+                json.dumps(timing),
+            ),
+        ))
+
+    def last_timing(self):
+        """Timing dell'ultimo esperimento terminato (None se non ce ne sono)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM timings ORDER BY experiment_id DESC LIMIT 1"
+            ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
@@ -1,11 +1,11 @@
 """pytorchtest: A Flower / PyTorch app with Strong/Weak Scaling support."""
 
 from collections import OrderedDict
+from contextlib import contextmanager
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from flwr_datasets import FederatedDataset
 from flwr_datasets.partitioner import IidPartitioner
 from torch.utils.data import DataLoader, Subset
 from torchvision.transforms import Compose, Normalize, ToTensor
@@ -14,6 +14,8 @@ import time
 import os
 import numpy as np
 
+from dataset_cache import open_federated_dataset
+
 os.environ["WANDB_API_KEY"] ="c9ecc4c3eeac8445768b6c97a55298ddd835562d"
 os.environ["WANDB_SILENT"] = "true"
 
@@ -43,7 +45,7 @@ fds = None  # Cache FederatedDataset
 
 
 def load_data(partition_id: int, num_partitions: int, scaling_mode: str = "strong", 
-              samples_per_client: int = 5000, run_config: dict = None):
+              samples_per_client: int = 5000, run_config: dict = None, dataset_cache: str = ""):
     """Load partition CIFAR10 data with Strong or Weak Scaling.
     
     Args:
@@ -53,6 +55,8 @@ def load_data(partition_id: int, num_partitions: int, scaling_mode: str = "stron
             - strong: Fixed total dataset size, divided by num_partitions
             - weak: Fixed samples per client, total dataset grows with num_partitions
         samples_per_client: Number of samples per client (only used in weak scaling)
+        dataset_cache: Directory della cache locale (build_dataset_cache.py): se indicata
+            il dataset viene letto da lì, senza rete, dopo la verifica dei checksum
     """
     global fds
     
@@ -61,10 +65,7 @@ def load_data(partition_id: int, num_partitions: int, scaling_mode: str = "stron
         # Più worker = meno dati per worker
         if fds is None:
             partitioner = IidPartitioner(num_partitions=num_partitions)
-            fds = FederatedDataset(
-                dataset="uoft-cs/cifar10",
-                partitioners={"train": partitioner},
-            )
+            fds = open_federated_dataset({"train": partitioner}, dataset_cache)
             fds_mode = "strong"
         partition = fds.load_partition(partition_id)
         print(f"[STRONG SCALING] Client {partition_id}: ~{len(partition)} samples total")
@@ -75,7 +76,7 @@ def load_data(partition_id: int, num_partitions: int, scaling_mode: str = "stron
         if fds is None:
             partitioner = IidPartitioner(num_partitions=1)
             # Carica dataset completo senza partizionamento
-            fds = FederatedDataset(dataset="uoft-cs/cifar10", partitioners={"train":partitioner})
+            fds = open_federated_dataset({"train": partitioner}, dataset_cache)
         
         fds_mode = "weak"
         # Carica l'intero dataset
@@ -114,39 +115,229 @@ def load_data(partition_id: int, num_partitions: int, scaling_mode: str = "stron
     return trainloader, testloader
 
 
-def train(net, trainloader, epochs, device):
-    """Train the model on the training set."""
+def subsample_loader(loader, num_samples: int, seed: int = 42):
+    """Deterministic fixed-size subsample of a DataLoader.
+
+    Gli indici dipendono solo dal seed: ad ogni round il client valuta sugli
+    stessi campioni, così le accuratezze dei round sono confrontabili.
+
+    Args:
+        loader: DataLoader da campionare (es. valloader)
+        num_samples: Campioni da tenere (0 o >= dataset = loader originale)
+        seed: Seed del campionamento
+    """
+    total = len(loader.dataset)
+    if num_samples <= 0 or num_samples >= total:
+        return loader
+    rng = np.random.RandomState(seed)
+    indices = np.sort(rng.choice(total, size=num_samples, replace=False))
+    return DataLoader(Subset(loader.dataset, indices.tolist()), batch_size=loader.batch_size)
+
+
+def accuracy_confidence_interval(accuracy: float, num_samples: int, z: float = 1.96):
+    """Wilson score interval for an accuracy measured on num_samples samples.
+
+    Returns:
+        tuple: (limite inferiore, limite superiore), al 95% con z = 1.96
+    """
+    if num_samples <= 0:
+        return 0.0, 1.0
+    denominator = 1 + z ** 2 / num_samples
+    center = (accuracy + z ** 2 / (2 * num_samples)) / denominator
+    margin = z * np.sqrt(accuracy * (1 - accuracy) / num_samples + z ** 2 / (4 * num_samples ** 2)) / denominator
+    return float(max(0.0, center - margin)), float(min(1.0, center + margin))
+
+
+class PreloadedLoader:
+    """DataLoader minimale su tensori già decodificati: niente transform né collate per batch"""
+
+    def __init__(self, images, labels, batch_size):
+        self.images = images
+        self.labels = labels
+        self.batch_size = batch_size
+        self.dataset = labels  # len(loader.dataset) = numero di campioni, come test() si aspetta
+
+    def __len__(self):
+        return (len(self.labels) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        for start in range(0, len(self.labels), self.batch_size):
+            end = start + self.batch_size
+            yield {"img": self.images[start:end], "label": self.labels[start:end]}
+
+
+test_data = None  # Cache in memoria del test set decodificato
+
+
+def load_test_data(batch_size: int = 1024, cache_path: str = "pytorchtest/cifar10_test.pt",
+                   dataset_cache: str = ""):
+    """Load the CIFAR10 test split for server-side evaluation.
+
+    Le immagini vengono decodificate e normalizzate una sola volta e salvate
+    in cache_path come tensori: le valutazioni successive (anche in altri
+    esperimenti) leggono direttamente il file, senza PIL né transform.
+
+    Args:
+        batch_size: Batch di valutazione (grande: sul server non serve backprop)
+        cache_path: File .pt con immagini e label già decodificate
+        dataset_cache: Directory della cache locale del dataset (vuota = download)
+    """
+    global test_data
+
+    if test_data is None:
+        if os.path.exists(cache_path):
+            test_data = torch.load(cache_path)
+            print(f"[SERVER EVAL] Test set caricato da cache: {len(test_data['label'])} samples")
+        else:
+            start_time = time.time()
+            test_fds = open_federated_dataset({"train": IidPartitioner(num_partitions=1)}, dataset_cache)
+            split = test_fds.load_split("test")
+            pytorch_transforms = Compose(
+                [ToTensor(), Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))]
+            )
+            test_data = {
+                "img": torch.stack([pytorch_transforms(img) for img in split["img"]]),
+                "label": torch.tensor(split["label"]),
+            }
+            torch.save(test_data, cache_path)
+            print(f"[SERVER EVAL] Test set decodificato in {time.time() - start_time:.1f}s → {cache_path}")
+
+    return PreloadedLoader(test_data["img"], test_data["label"], batch_size)
+
+
+class PhaseTimer:
+    """Cronometro cumulativo per le fasi del client (set_weights, dati, forward/backward, ...)
+
+    Ogni fase somma la propria durata su tutti i batch; samples conta i
+    campioni processati, per il throughput del round.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.samples = 0
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def metrics(self):
+        """Durate come metriche Flower: time_<fase> in secondi"""
+        return {f"time_{name}": round(seconds, 6) for name, seconds in self.seconds.items()}
+
+
+def _timed_batches(loader, device, timer):
+    """Batch già spostati sul device; caricamento e copia contano come data_loading"""
+    batches = iter(loader)
+    while True:
+        with timer.phase("data_loading"):
+            batch = next(batches, None)
+            if batch is None:
+                return
+            images = batch["img"].to(device)
+            labels = batch["label"].to(device)
+        timer.samples += len(labels)
+        yield images, labels
+
+
+def get_optimizer_state(optimizer):
+    """Stato dell'ottimizzatore come array numpy piatti {"<param>.<nome>": array}"""
+    return {
+        f"{index}.{name}": value.detach().cpu().numpy() if torch.is_tensor(value) else np.asarray(value)
+        for index, values in optimizer.state_dict()["state"].items()
+        for name, value in values.items()
+    }
+
+
+def set_optimizer_state(optimizer, arrays):
+    """Ripristina lo stato salvato con get_optimizer_state (param_groups restano quelli correnti)"""
+    state = {}
+    for key, array in arrays.items():
+        index, name = key.split(".", 1)
+        state.setdefault(int(index), {})[name] = torch.from_numpy(np.array(array))
+    optimizer.load_state_dict({"state": state, "param_groups": optimizer.state_dict()["param_groups"]})
+
+
+def train(net, trainloader, epochs, device, timer=None, optimizer_state=None):
+    """Train the model on the training set.
+
+    Con timer (PhaseTimer) misura data_loading, forward_backward e
+    optimizer_step; loss.item() sta in forward_backward, così su GPU la
+    sincronizzazione viene attribuita al calcolo che la causa.
+
+    Con optimizer_state (dict, anche vuoto) lo stato di Adam viene ripreso
+    da lì e, a fine training, sostituito con quello aggiornato.
+    """
+    timer = timer if timer is not None else PhaseTimer()
     net.to(device)  # move model to GPU if available
     criterion = torch.nn.CrossEntropyLoss().to(device)
     optimizer = torch.optim.Adam(net.parameters(), lr=0.01)
+    if optimizer_state:
+        set_optimizer_state(optimizer, optimizer_state)
     net.train()
     running_loss = 0.0
     for _ in range(epochs):
-        for batch in trainloader:
-            images = batch["img"]
-            labels = batch["label"]
-            optimizer.zero_grad()
-            loss = criterion(net(images.to(device)), labels.to(device))
-            loss.backward()
-            optimizer.step()
-            running_loss += loss.item()
+        for images, labels in _timed_batches(trainloader, device, timer):
+            with timer.phase("forward_backward"):
+                optimizer.zero_grad()
+                loss = criterion(net(images), labels)
+                loss.backward()
+                running_loss += loss.item()
+            with timer.phase("optimizer_step"):
+                optimizer.step()
           
+    if optimizer_state is not None:
+        optimizer_state.clear()
+        optimizer_state.update(get_optimizer_state(optimizer))
     avg_trainloss = running_loss / len(trainloader)
     return avg_trainloss
 
 
-def test(net, testloader, device):
+def warm_up(net, trainloader, device, steps=2, timer=None):
+    """Dummy training steps to warm up the data pipeline and the device.
+
+    Il primo batch paga l'avvio dei worker del DataLoader e delle trasformazioni,
+    i primi passi l'allocatore e la scelta dei kernel (cuDNN): qui vengono pagati
+    prima del round 1. I pesi vengono ripristinati e l'ottimizzatore scartato,
+    quindi il training successivo non cambia.
+    """
+    timer = timer if timer is not None else PhaseTimer()
+    initial_state = {name: tensor.detach().clone() for name, tensor in net.state_dict().items()}
+    net.to(device)
+    criterion = torch.nn.CrossEntropyLoss().to(device)
+    optimizer = torch.optim.Adam(net.parameters(), lr=0.01)
+    net.train()
+    done = 0
+    for images, labels in _timed_batches(trainloader, device, timer):
+        with timer.phase("forward_backward"):
+            optimizer.zero_grad()
+            loss = criterion(net(images), labels)
+            loss.backward()
+            loss.item()
+        with timer.phase("optimizer_step"):
+            optimizer.step()
+        done += 1
+        if done >= steps:
+            break
+    net.load_state_dict(initial_state)
+    return done
+
+
+def test(net, testloader, device, timer=None):
     """Validate the model on the test set."""
+    timer = timer if timer is not None else PhaseTimer()
     net.to(device)
     criterion = torch.nn.CrossEntropyLoss()
     correct, loss = 0, 0.0
     with torch.no_grad():
-        for batch in testloader:
-            images = batch["img"].to(device)
-            labels = batch["label"].to(device)
-            outputs = net(images)
-            loss += criterion(outputs, labels).item()
-            correct += (torch.max(outputs.data, 1)[1] == labels).sum().item()
+        for images, labels in _timed_batches(testloader, device, timer):
+            with timer.phase("forward"):
+                outputs = net(images)
+                loss += criterion(outputs, labels).item()
+                correct += (torch.max(outputs.data, 1)[1] == labels).sum().item()
     accuracy = correct / len(testloader.dataset)
     loss = loss / len(testloader)
     return loss, accuracy
@@ -0,0 +1,231 @@
+"""pytorchtest: timeline dei client per round, offset degli orologi e trace Chrome."""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flwr.common import Code, GetPropertiesIns, GetPropertiesRes, MessageTypeLegacy, Status
+from flwr.common import recordset_compat as compat
+
+# Richiesta get_properties con cui il server misura l'orologio dei client
+CLOCK_SYNC_KEY = "clock-sync"
+
+
+class ClockOffsets:
+    """
+    Offset dell'orologio di ogni client rispetto al server (stile NTP)
+
+    Per ogni ping il server registra invio (t_send) e arrivo (t_recv) e il
+    client risponde con il proprio time.time() (t_client): l'offset stimato è
+    t_client - (t_send + t_recv) / 2, con errore massimo pari a metà del round
+    trip. Di ogni nodo si tiene il campione con il round trip più basso.
+    """
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, node_id, t_send, t_client, t_recv):
+        round_trip = t_recv - t_send
+        key = str(node_id)
+        best = self.samples.get(key)
+        if best is None or round_trip < best["round_trip"]:
+            self.samples[key] = {
+                "offset": t_client - (t_send + t_recv) / 2,
+                "round_trip": round_trip,
+            }
+
+    def offset(self, node_id):
+        """Secondi di anticipo del client sul server (0 se mai misurato)"""
+        sample = self.samples.get(str(node_id))
+        return sample["offset"] if sample else 0.0
+
+    def to_server_time(self, node_id, timestamp):
+        return timestamp - self.offset(node_id)
+
+    def missing(self, node_ids):
+        """Nodi ancora senza una stima dell'offset"""
+        return [node_id for node_id in node_ids if str(node_id) not in self.samples]
+
+    def summary(self):
+        return {
+            node_id: {name: round(value, 6) for name, value in sample.items()}
+            for node_id, sample in sorted(self.samples.items())
+        }
+
+
+def clock_sync_mod(msg, context, call_next):
+    """
+    Mod del ClientApp: risponde ai ping di sincronizzazione con l'orologio locale
+
+    Il ping non passa da client_fn, quindi non costruisce modello, dati e run
+    wandb: la risposta parte subito e il round trip resta minimo.
+    """
+    client_time = time.time()
+    if msg.metadata.message_type == MessageTypeLegacy.GET_PROPERTIES:
+        ins = compat.recordset_to_getpropertiesins(msg.content)
+        if ins.config.get(CLOCK_SYNC_KEY, False):
+            res = GetPropertiesRes(status=Status(code=Code.OK, message=""), properties={"client_time": client_time})
+            return msg.create_reply(compat.getpropertiesres_to_recordset(res))
+    return call_next(msg, context)
+
+
+def sync_proxy_clocks(clock, proxies, samples=3, timeout=30):
+    """
+    Ping get_properties in parallelo verso i ClientProxy (modalità batch)
+
+    I client che non rispondono o non riportano client_time restano senza
+    offset (timestamp non corretti).
+    """
+    ins = GetPropertiesIns(config={CLOCK_SYNC_KEY: True})
+
+    def ping(proxy):
+        for _ in range(samples):
+            t_send = time.time()
+            try:
+                res = proxy.get_properties(ins, timeout, None)
+            except Exception:
+                return
+            t_recv = time.time()
+            if "client_time" not in res.properties:
+                return
+            clock.record(proxy.cid, t_send, float(res.properties["client_time"]), t_recv)
+
+    if not proxies:
+        return
+    with ThreadPoolExecutor(max_workers=len(proxies)) as pool:
+        list(pool.map(ping, proxies))
+
+
+class Timeline:
+    """
+    Intervalli [inizio, fine] di ogni client e del server, in tempo del server
+
+    I client riportano start_timestamp/end_timestamp di fit ed evaluate; qui
+    vengono corretti con ClockOffsets e raggruppati per round. Da questi si
+    ricavano utilizzo, tempo inattivo per nodo e straggler di ogni round, e
+    l'esportazione in formato Chrome trace (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else ClockOffsets()
+        self.spans = []
+
+    def add(self, server_round, node_id, kind, start, end):
+        """Intervallo già in tempo del server (es. le fasi del server)"""
+        if start is None or end is None or end < start:
+            return
+        self.spans.append({
+            "round": server_round,
+            "node": str(node_id),
+            "kind": kind,
+            "start": start,
+            "end": end,
+        })
+
+    def add_client(self, server_round, node_id, kind, metrics):
+        """Intervallo riportato da un client nelle metriche di fit/evaluate"""
+        if "start_timestamp" not in metrics or "end_timestamp" not in metrics:
+            return
+        self.add(
+            server_round,
+            node_id,
+            kind,
+            self.clock.to_server_time(node_id, float(metrics["start_timestamp"])),
+            self.clock.to_server_time(node_id, float(metrics["end_timestamp"])),
+        )
+
+    def client_spans(self):
+        return [span for span in self.spans if span["node"] != "server"]
+
+    def round_stats(self):
+        """
+        Utilizzo e straggler di ogni round
+
+        La finestra del round va dal primo inizio all'ultima fine tra i client;
+        idle_fraction di un nodo è la parte della finestra in cui non era in
+        fit/evaluate. Il critical path è il client del fit che finisce per ultimo.
+        """
+        by_round = {}
+        for span in self.client_spans():
+            by_round.setdefault(span["round"], []).append(span)
+
+        stats = []
+        for server_round, spans in sorted(by_round.items()):
+            window_start = min(span["start"] for span in spans)
+            window_end = max(span["end"] for span in spans)
+            window = max(window_end - window_start, 1e-9)
+            busy = {}
+            for span in spans:
+                busy[span["node"]] = busy.get(span["node"], 0.0) + span["end"] - span["start"]
+            entry = {
+                "round": server_round,
+                "window_seconds": round(window, 4),
+                "idle_fraction": {node: round(max(0.0, 1 - seconds / window), 4) for node, seconds in busy.items()},
+                "utilization": round(sum(busy.values()) / (window * len(busy)), 4),
+            }
+            fits = sorted((span for span in spans if span["kind"] == "fit"), key=lambda span: span["end"])
+            if fits:
+                median_end = fits[len(fits) // 2]["end"]
+                entry["critical_path_client"] = fits[-1]["node"]
+                entry["straggler_gap_seconds"] = round(fits[-1]["end"] - median_end, 4)
+            stats.append(entry)
+        return stats
+
+    def node_stats(self):
+        """Frazione di tempo inattivo di ogni nodo sull'intero esperimento"""
+        spans = self.client_spans()
+        if not spans:
+            return {}
+        total = max(max(span["end"] for span in spans) - min(span["start"] for span in spans), 1e-9)
+        busy = {}
+        critical = {}
+        for span in spans:
+            busy[span["node"]] = busy.get(span["node"], 0.0) + span["end"] - span["start"]
+        for entry in self.round_stats():
+            node = entry.get("critical_path_client")
+            if node is not None:
+                critical[node] = critical.get(node, 0) + 1
+        return {
+            node: {
+                "busy_seconds": round(seconds, 3),
+                "idle_fraction": round(max(0.0, 1 - seconds / total), 4),
+                "critical_path_rounds": critical.get(node, 0),
+            }
+            for node, seconds in sorted(busy.items())
+        }
+
+    def chrome_trace(self):
+        """Eventi "complete" (ph = X) in microsecondi: un processo per nodo, un thread per fase"""
+        if not self.spans:
+            return {"traceEvents": []}
+        origin = min(span["start"] for span in self.spans)
+        nodes = sorted({span["node"] for span in self.spans}, key=lambda node: (node != "server", node))
+        pids = {node: pid for pid, node in enumerate(nodes)}
+        kinds = sorted({span["kind"] for span in self.spans})
+        tids = {kind: tid for tid, kind in enumerate(kinds)}
+
+        events = [
+            {"name": "process_name", "ph": "M", "pid": pids[node], "args": {"name": node}}
+            for node in nodes
+        ]
+        for span in self.spans:
+            events.append({
+                "name": f"{span['kind']} r{span['round']}",
+                "cat": span["kind"],
+                "ph": "X",
+                "pid": pids[span["node"]],
+                "tid": tids[span["kind"]],
+                "ts": round((span["start"] - origin) * 1e6),
+                "dur": round((span["end"] - span["start"]) * 1e6),
+                "args": {"round": span["round"]},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        return path
@@ -0,0 +1,43 @@
+"""pytorchtest: warm-up dei supernode prima del primo round."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from flwr.common import GetPropertiesIns
+
+# Richiesta get_properties con cui il server avvia il warm-up dei client
+WARMUP_KEY = "warmup"
+WARMUP_STEPS_KEY = "warmup-steps"
+
+
+def warmup_ins(steps=2):
+    """Istruzione di warm-up: caricamento dati, costruzione del modello e steps passi fittizi"""
+    return GetPropertiesIns(config={WARMUP_KEY: True, WARMUP_STEPS_KEY: steps})
+
+
+def warmup_report(properties):
+    """Tempi di warm-up riportati da un client (None se il warm-up è fallito)"""
+    if properties is None or "warmup_seconds" not in properties:
+        return None
+    return {name: round(float(value), 4) for name, value in properties.items()}
+
+
+def warm_up_proxies(proxies, steps=2, timeout=600):
+    """
+    Warm-up in parallelo dei ClientProxy (modalità batch)
+
+    Returns:
+        dict: cid -> tempi riportati dal client (None se non ha risposto)
+    """
+    ins = warmup_ins(steps)
+
+    def warm_up(proxy):
+        try:
+            res = proxy.get_properties(ins, timeout, None)
+        except Exception:
+            return proxy.cid, None
+        return proxy.cid, warmup_report(res.properties)
+
+    if not proxies:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(proxies)) as pool:
+        return dict(pool.map(warm_up, proxies))
@@ -4,13 +4,14 @@ import subprocess
 import time
 import os
 import argparse
-import json
 from datetime import datetime
-from pathlib import Path
 
-# Percorso al file pyproject.toml e al file dei timings
+from pytorchtest.store import get_store
+
+# Percorso al file pyproject.toml (i timings sono nell'archivio pytorchtest/experiments.db)
 TOML_PATH = os.path.join("pytorchtest", "pyproject.toml")
-TIMINGS_FILE = Path("pytorchtest/experiment_timings.json")
+# Strategie lato server disponibili (server-strategy in pyproject.toml)
+STRATEGIES = ["fedavg", "fedavgm", "fedadam", "fedyogi"]
 
 def print_separator(char="=", length=80):
     print(char * length)
@@ -38,9 +39,10 @@ def run_command(cmd):
     print(f"✅ Comando completato con successo")
     return True
 
-def update_toml(num_rounds, local_epochs, nodes, fraction, scaling_mode, samples_per_client):
+def update_toml(num_rounds, local_epochs, nodes, fraction, scaling_mode, samples_per_client,
+                aggregation_mode="batch", server_strategy="fedavg"):
     print_step(f"Aggiorno pyproject.toml: nodes={nodes}, rounds={num_rounds}, epochs={local_epochs}, fraction-fit={fraction}")
-    print_step(f"  Scaling: {scaling_mode}, samples={samples_per_client}")
+    print_step(f"  Scaling: {scaling_mode}, samples={samples_per_client}, aggregation={aggregation_mode}, strategy={server_strategy}")
     try:
         with open(TOML_PATH, "r") as f:
             lines = f.readlines()
@@ -65,6 +67,10 @@ def update_toml(num_rounds, local_epochs, nodes, fraction, scaling_mode, samples
             elif stripped.startswith("samples-per-client"):
                 new_lines.append(f"samples-per-client = {samples_per_client}\n")
                 samples_found = True
+            elif stripped.startswith("aggregation-mode"):
+                new_lines.append(f'aggregation-mode = "{aggregation_mode}"\n')
+            elif stripped.startswith("server-strategy"):
+                new_lines.append(f'server-strategy = "{server_strategy}"\n')
             else:
                 new_lines.append(line)
         
@@ -83,7 +89,6 @@ def update_toml(num_rounds, local_epochs, nodes, fraction, scaling_mode, samples
             f.writelines(new_lines)
         
         print("✅ File TOML aggiornato")
-        print("[DEBUG] timing_file path:", TIMINGS_FILE.resolve())
         return True
     except Exception as e:
         print(f"❌ Errore aggiornando pyproject.toml: {e}")
@@ -91,19 +96,14 @@ def update_toml(num_rounds, local_epochs, nodes, fraction, scaling_mode, samples
     
 def load_last_experiment():
     try:
-        with TIMINGS_FILE.open("r") as f:
-            data = json.load(f)
-          
-            # Cerca la lista dei timings
-            if 'timings' in data:
-                timings = data['timings']
-                if timings:
-                    last_id = timings[-1]['experiment_id']
-                    print(f"ℹ️ Ultimo experiment_id trovato: {last_id}")
-                    return last_id
-            
-            print("⚠️ Nessun timing trovato")
-            return -1
+        timing = get_store().last_timing()
+        if timing:
+            last_id = timing['experiment_id']
+            print(f"ℹ️ Ultimo experiment_id trovato: {last_id}")
+            return last_id
+        
+        print("⚠️ Nessun timing trovato")
+        return -1
                 
     except Exception as e:
         print(f"❌ Errore: {e}")
@@ -111,23 +111,38 @@ def load_last_experiment():
     
 
 def wait_for_new_experiment(last_id: int, timeout: int = 7200, check_interval: int = 5):
-    """Aspetta che venga scritto un nuovo timing nel JSON"""
+    """Aspetta che il server registri un nuovo timing nell'archivio"""
     start = time.time()
     while time.time() - start < timeout:
         try:
-            with TIMINGS_FILE.open("r") as f:
-                data = json.load(f)
-            if 'timings' in data:
-                timings = data['timings']
-                if timings:
-                    current_id = timings[-1]['experiment_id']
-                    if current_id > last_id:
-                        return True
+            timing = get_store().last_timing()
+            if timing and timing['experiment_id'] > last_id:
+                return True
         except Exception:
             pass
         time.sleep(check_interval)
     return False
 
+def load_last_timing():
+    """Ultimo timing scritto dal server (None se non disponibile)"""
+    try:
+        return get_store().last_timing()
+    except Exception:
+        return None
+
+def print_target_summary(results):
+    """Rounds-to-target e wall-clock-to-target per ogni esperimento eseguito"""
+    print_section("TEMPO ALL'OBIETTIVO")
+    print(f"   {'Strategia':<10} {'Nodi':>5} {'Round':>6} {'Epoche':>7} {'Round→target':>13} {'Secondi→target':>15}")
+    for r in results:
+        rounds_to_target = r.get("rounds_to_target")
+        seconds_to_target = r.get("seconds_to_target")
+        print(
+            f"   {r.get('strategy', 'fedavg'):<10} {r.get('nodes', '?'):>5} {r.get('rounds', '?'):>6} "
+            f"{r.get('epochs', '?'):>7} {rounds_to_target if rounds_to_target is not None else '-':>13} "
+            f"{seconds_to_target if seconds_to_target is not None else '-':>15}"
+        )
+
 def parse_range(range_str):
     if '-' in range_str:
         start, end = map(int, range_str.split('-'))
@@ -147,6 +162,12 @@ def main():
                        help='Modalità di scaling: strong (dataset fisso) o weak (campioni fissi per client)')
     parser.add_argument('--samples', type=int, default=5000,
                        help='Numero di campioni per client (solo per weak scaling)')
+    parser.add_argument('--mode', default='batch', choices=['batch', 'streaming', 'pipelined', 'async'],
+                       help='Modalità di aggregazione: batch (FedAvg), streaming, pipelined o async (FedBuff)')
+    parser.add_argument('--strategy', default='fedavg',
+                       help='Strategie lato server separate da virgola (fedavg,fedavgm,fedadam,fedyogi)')
+    parser.add_argument('--timeout', type=int, default=7200,
+                       help='Secondi massimi di attesa per esperimento (con round-deadline può essere ridotto)')
     parser.add_argument('--dry-run', action='store_true', help='Simula i test senza eseguirli')
     args = parser.parse_args()
     
@@ -156,6 +177,10 @@ def main():
     fraction_fit = float(args.fraction)
     scaling_mode = args.scaling
     samples_per_client = args.samples
+    strategies = [s.strip() for s in args.strategy.split(',')]
+    for strategy in strategies:
+        if strategy not in STRATEGIES:
+            parser.error(f"strategia sconosciuta: {strategy} (valide: {', '.join(STRATEGIES)})")
     
     print_header("CONFIGURAZIONE TEST")
     print(f"📊 Nodi: {nodes_range}")
@@ -165,14 +190,17 @@ def main():
     print(f"⚡ Scaling: {scaling_mode.upper()}")
     if scaling_mode == "weak":
         print(f"📦 Campioni per client: {samples_per_client}")
+    print(f"🧮 Aggregazione: {args.mode}")
+    print(f"🧭 Strategie: {strategies}")
     
-    total_tests = len(nodes_range) * len(epochs_range) * len(rounds_range)
+    total_tests = len(nodes_range) * len(epochs_range) * len(rounds_range) * len(strategies)
     print(f"🎯 Numero totale di test: {total_tests}")
     
     if not args.dry_run:
         input("\n⏸️  Premi INVIO per continuare o CTRL+C per annullare...")
     
     test_counter = 0
+    target_results = []
     
     for nodes in nodes_range:
         print_header(f"TESTING CON {nodes} NODI ({scaling_mode.upper()} SCALING)")
@@ -181,44 +209,55 @@ def main():
             print_section(f"Configurazione: {nodes} nodi, {local_epochs} epoche")
             
             for num_rounds in rounds_range:
-                test_counter += 1
+                for server_strategy in strategies:
+                    test_counter += 1
                 
-                print_step(f"TEST {test_counter}/{total_tests}")
-                print(f"   🖥️  Nodi: {nodes}")
-                print(f"   🔄 Round: {num_rounds}")
-                print(f"   📈 Epoche: {local_epochs}")
-                print(f"   ⚖️  Frazione: {fraction_fit}")
-                print(f"   ⚡ Scaling: {scaling_mode}")
-                if scaling_mode == "weak":
-                    print(f"   📦 Campioni/client: {samples_per_client}")
-
-                if args.dry_run:
-                    print("   🔍 [DRY-RUN] Test simulato completato")
-                    continue
-
-                if not update_toml(num_rounds, local_epochs, nodes, fraction_fit, 
-                                 scaling_mode, samples_per_client):
-                    return
-
-                os.environ["EXPERIMENT_NODES"] = str(nodes)
-
-                # Ricava l'ultimo id
-                last_experiment = load_last_experiment()
+                    print_step(f"TEST {test_counter}/{total_tests}")
+                    print(f"   🖥️  Nodi: {nodes}")
+                    print(f"   🔄 Round: {num_rounds}")
+                    print(f"   📈 Epoche: {local_epochs}")
+                    print(f"   ⚖️  Frazione: {fraction_fit}")
+                    print(f"   🧭 Strategia: {server_strategy}")
+                    print(f"   ⚡ Scaling: {scaling_mode}")
+                    if scaling_mode == "weak":
+                        print(f"   📦 Campioni/client: {samples_per_client}")
+
+                    if args.dry_run:
+                        print("   🔍 [DRY-RUN] Test simulato completato")
+                        continue
+
+                    if not update_toml(num_rounds, local_epochs, nodes, fraction_fit, 
+                                     scaling_mode, samples_per_client, args.mode, server_strategy):
+                        return
+
+                    os.environ["EXPERIMENT_NODES"] = str(nodes)
+
+                    # Ricava l'ultimo id
+                    last_experiment = load_last_experiment()
                 
-                if not run_command(f"make start NODES={nodes}"):
-                    return
+                    if not run_command(f"make start NODES={nodes}"):
+                        return
 
-                print_step("⏳ Aspetto che il nuovo esperimento venga scritto...")
-                if wait_for_new_experiment(last_experiment):
-                    print("✅ Nuovo esperimento trovato, procedo con stop")
-                    time.sleep(10)  # Piccola pausa per sicurezza
-                else:
-                    print("⚠️ Timeout, procedo comunque con stop")
+                    print_step("⏳ Aspetto che il nuovo esperimento venga scritto...")
+                    if wait_for_new_experiment(last_experiment, timeout=args.timeout):
+                        print("✅ Nuovo esperimento trovato, procedo con stop")
+                        timing = load_last_timing()
+                        if timing is not None:
+                            target_results.append(timing)
+                            if timing.get("rounds_to_target") is not None:
+                                print(f"   🎯 Target raggiunto in {timing['rounds_to_target']} round, "
+                                      f"{timing['seconds_to_target']}s")
+                        time.sleep(10)  # Piccola pausa per sicurezza
+                    else:
+                        print("⚠️ Timeout, procedo comunque con stop")
 
-                if not run_command(f"make stop NODES={nodes}"):
-                    return
+                    if not run_command(f"make stop NODES={nodes}"):
+                        return
 
-                print("✅ Test completato\n")
+                    print("✅ Test completato\n")
+    
+    if target_results:
+        print_target_summary(target_results)
     
     print_header("TUTTI I TEST COMPLETATI!")
     print(f"🎉 Eseguiti {total_tests} test con successo")
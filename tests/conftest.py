@@ -0,0 +1,8 @@
+"""Configurazione comune dei test: i moduli di pytorchtest usano import piatti."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "pytorchtest"))
+sys.path.insert(0, ROOT)
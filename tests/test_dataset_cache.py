@@ -0,0 +1,166 @@
+"""Test della cache locale del dataset (dataset_cache.py) senza accesso alla rete."""
+
+import os
+import socket
+
+import numpy as np
+import pytest
+
+datasets = pytest.importorskip("datasets")
+pytest.importorskip("flwr_datasets")
+
+import dataset_cache  # noqa: E402
+from dataset_cache import (  # noqa: E402
+    CachedFederatedDataset,
+    DatasetChecksumError,
+    build_cache,
+    verify_snapshot,
+)
+from flwr_datasets.partitioner import IidPartitioner  # noqa: E402
+
+DATASET = "test/tiny"
+
+
+def tiny_dataset():
+    train = datasets.Dataset.from_dict({"x": list(range(100)), "label": [i % 10 for i in range(100)]})
+    test = datasets.Dataset.from_dict({"x": list(range(20)), "label": [i % 10 for i in range(20)]})
+    return datasets.DatasetDict({"train": train, "test": test})
+
+
+@pytest.fixture(autouse=True)
+def no_network(monkeypatch):
+    """
+    Rete disattivata per ogni test del modulo
+
+    HF_DATASETS_OFFLINE / HF_HUB_OFFLINE vengono letti all'import di datasets
+    e huggingface_hub, già avvenuto: qui si blocca direttamente il socket. I
+    tentativi vengono anche registrati, così un errore intercettato da un
+    retry o da un fallback offline fa comunque fallire il test.
+    """
+    attempts = []
+
+    def blocked(*args, **kwargs):
+        attempts.append(args[1:] if args and isinstance(args[0], socket.socket) else args)
+        raise OSError("accesso alla rete disattivato nei test")
+
+    monkeypatch.setattr(socket.socket, "connect", blocked)
+    monkeypatch.setattr(socket.socket, "connect_ex", blocked)
+    monkeypatch.setattr(socket, "create_connection", blocked)
+    yield
+    assert attempts == [], f"tentativi di connessione: {attempts}"
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    path = build_cache(str(tmp_path), DATASET, source=tiny_dataset())
+    # Ogni test riverifica lo snapshot da zero
+    monkeypatch.setattr(dataset_cache, "_verified", set())
+    return path
+
+
+def load_partition(cache_dir, partition_id):
+    fds = CachedFederatedDataset(cache_dir, {"train": IidPartitioner(num_partitions=4)}, dataset=DATASET)
+    # Stesse operazioni di task.load_data
+    partition = fds.load_partition(partition_id)
+    split = partition.train_test_split(test_size=0.2, seed=42)
+    subset = fds.load_split("train").select(range(10))
+    return partition, split, subset
+
+
+def test_snapshot_address_is_manifest_digest(tmp_path, snapshot):
+    assert os.path.dirname(snapshot) == os.path.join(str(tmp_path), "snapshots")
+    with open(os.path.join(str(tmp_path), "refs", "test--tiny")) as f:
+        assert f.read().strip() == os.path.basename(snapshot)
+    verify_snapshot(snapshot)
+
+
+def test_load_twice_leaves_snapshot_untouched(tmp_path, snapshot):
+    files_before = sorted(os.listdir(os.path.join(snapshot, "train")))
+    first, first_split, _ = load_partition(str(tmp_path), 1)
+    # La seconda apertura riverifica lo snapshot dopo l'uso
+    dataset_cache._verified.clear()
+    second, second_split, _ = load_partition(str(tmp_path), 1)
+
+    assert sorted(os.listdir(os.path.join(snapshot, "train"))) == files_before
+    verify_snapshot(snapshot)
+    assert len(first) == 25
+    assert first["x"] == second["x"]
+    assert first_split["test"]["x"] == second_split["test"]["x"]
+
+
+def test_load_from_read_only_snapshot(tmp_path, snapshot):
+    if os.geteuid() == 0:
+        pytest.skip("root ignora i permessi di sola lettura")
+    for root, dirs, files in os.walk(snapshot):
+        for name in dirs + files:
+            os.chmod(os.path.join(root, name), 0o555 if name in dirs else 0o444)
+    os.chmod(snapshot, 0o555)
+    try:
+        partition, _, _ = load_partition(str(tmp_path), 0)
+        assert len(partition) == 25
+    finally:
+        for root, dirs, _ in os.walk(snapshot):
+            for name in dirs:
+                os.chmod(os.path.join(root, name), 0o755)
+        os.chmod(snapshot, 0o755)
+
+
+def test_tampered_file_fails_verification(tmp_path, snapshot):
+    data_file = next(
+        os.path.join(snapshot, "train", name)
+        for name in os.listdir(os.path.join(snapshot, "train"))
+        if name.endswith(".arrow")
+    )
+    with open(data_file, "ab") as f:
+        f.write(b"\0")
+
+    with pytest.raises(DatasetChecksumError, match="sha256"):
+        verify_snapshot(snapshot)
+    with pytest.raises(DatasetChecksumError):
+        CachedFederatedDataset(str(tmp_path), {"train": IidPartitioner(num_partitions=4)}, dataset=DATASET)
+
+
+def test_extra_file_fails_verification(snapshot):
+    with open(os.path.join(snapshot, "train", "cache-extra.arrow"), "wb") as f:
+        f.write(b"x")
+    with pytest.raises(DatasetChecksumError, match="non presente nel manifest"):
+        verify_snapshot(snapshot)
+
+
+def tiny_image_dataset():
+    """Piccolo dataset con le colonne di CIFAR-10 (img PIL 32x32, label)"""
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    features = datasets.Features({"img": datasets.Image(), "label": datasets.ClassLabel(num_classes=10)})
+
+    def split(size):
+        images = [Image.fromarray(rng.integers(0, 255, (32, 32, 3), dtype="uint8")) for _ in range(size)]
+        return datasets.Dataset.from_dict(
+            {"img": images, "label": [i % 10 for i in range(size)]}, features=features
+        )
+
+    return datasets.DatasetDict({"train": split(100), "test": split(20)})
+
+
+@pytest.mark.parametrize("scaling_mode, expected", [("strong", 25), ("weak", 10)])
+def test_task_load_data_reads_the_snapshot(tmp_path, monkeypatch, scaling_mode, expected):
+    pytest.importorskip("torch")
+    pytest.importorskip("torchvision")
+    import task
+
+    snapshot = build_cache(str(tmp_path), source=tiny_image_dataset())
+    files_before = sorted(os.listdir(os.path.join(snapshot, "train")))
+    monkeypatch.setattr(dataset_cache, "_verified", set())
+    # task tiene il FederatedDataset in una globale di processo
+    monkeypatch.setattr(task, "fds", None)
+
+    trainloader, testloader = task.load_data(
+        1, 4, scaling_mode=scaling_mode, samples_per_client=10, dataset_cache=str(tmp_path)
+    )
+
+    assert len(trainloader.dataset) + len(testloader.dataset) == expected
+    batch = next(iter(trainloader))
+    assert tuple(batch["img"].shape[1:]) == (3, 32, 32)
+    assert sorted(os.listdir(os.path.join(snapshot, "train"))) == files_before
+    verify_snapshot(snapshot)
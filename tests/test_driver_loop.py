@@ -0,0 +1,146 @@
+"""Test dei loop della Driver API (driver_loop.py) con una SuperLink finta in memoria."""
+
+import numpy as np
+import pytest
+
+from flwr.common import (
+    Code,
+    EvaluateRes,
+    FitIns,
+    FitRes,
+    Message,
+    MessageType,
+    Metadata,
+    Status,
+    ndarrays_to_parameters,
+    parameters_to_ndarrays,
+)
+from flwr.common import recordset_compat as compat
+
+import driver_loop
+
+
+class FakeDriver:
+    """
+    SuperLink finta: tutte le risposte sono pronte al primo pull
+
+    Registra quanti ID chiede ogni pull_messages e quante risposte sono state
+    restituite ma non ancora consumate dal chiamante (modelli in memoria).
+    """
+
+    def __init__(self, num_nodes, trainer=None):
+        self.num_nodes = num_nodes
+        self.trainer = trainer or (lambda node_id, ndarrays: ([layer + node_id for layer in ndarrays], 10))
+        self.messages = {}
+        self.counter = 0
+        self.pull_sizes = []
+        self.live_replies = 0
+        self.max_live_replies = 0
+
+    def get_node_ids(self):
+        return list(range(1, self.num_nodes + 1))
+
+    def create_message(self, content, message_type, dst_node_id, group_id, ttl=None):
+        return content, message_type, dst_node_id, group_id
+
+    def push_messages(self, messages):
+        message_ids = []
+        for message in messages:
+            self.counter += 1
+            self.messages[str(self.counter)] = message
+            message_ids.append(str(self.counter))
+        return message_ids
+
+    def reply(self, message_id):
+        content, message_type, node_id, group_id = self.messages.pop(message_id)
+        if message_type == MessageType.TRAIN:
+            ins = compat.recordset_to_fitins(content, keep_input=True)
+            ndarrays, num_examples = self.trainer(node_id, parameters_to_ndarrays(ins.parameters))
+            res = FitRes(Status(Code.OK, ""), ndarrays_to_parameters(ndarrays), num_examples, {})
+            content = compat.fitres_to_recordset(res, keep_input=False)
+        else:
+            res = EvaluateRes(Status(Code.OK, ""), 1.0, 10, {"accuracy": 0.5})
+            content = compat.evaluateres_to_recordset(res)
+        metadata = Metadata(
+            run_id=0, message_id="r" + message_id, src_node_id=node_id, dst_node_id=0,
+            reply_to_message=message_id, group_id=group_id, ttl=60, message_type=message_type,
+        )
+        return Message(metadata, content=content)
+
+    def pull_messages(self, message_ids):
+        # Come GrpcDriver: la lista viene deserializzata per intero prima di tornare
+        self.pull_sizes.append(len(message_ids))
+        replies = [self.reply(m) for m in message_ids if m in self.messages]
+        self.live_replies += len(replies)
+        self.max_live_replies = max(self.max_live_replies, self.live_replies)
+        return self._consume(replies)
+
+    def _consume(self, replies):
+        for reply in replies:
+            yield reply
+            self.live_replies -= 1
+
+
+def push_fit(driver, model, num_nodes):
+    content = compat.fitins_to_recordset(FitIns(ndarrays_to_parameters(model), {}), keep_input=True)
+    return driver.push_messages([(content, MessageType.TRAIN, node_id, "1") for node_id in range(1, num_nodes + 1)])
+
+
+def test_stream_replies_pulls_bounded_batches():
+    driver = FakeDriver(10)
+    message_ids = push_fit(driver, [np.zeros(8, dtype=np.float32)], 10)
+
+    replies = list(driver_loop.stream_replies(driver, message_ids))
+
+    assert sorted(r.metadata.src_node_id for r in replies) == list(range(1, 11))
+    # 10 risposte pronte insieme: nessun pull chiede più di PULL_BATCH_SIZE ID
+    assert driver.pull_sizes == [4, 4, 2]
+    assert driver.max_live_replies <= driver_loop.PULL_BATCH_SIZE
+
+
+def test_run_streaming_holds_at_most_one_batch(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    import store
+    from server_app import Profiling, TimedFedAvg
+
+    monkeypatch.setattr(store, "_store", store.ExperimentStore(str(tmp_path / "experiments.db")))
+    monkeypatch.setattr(driver_loop, "POLL_INTERVAL", 0.0)
+
+    evaluated = []
+    strategy = TimedFedAvg(
+        1, "test-driver-loop", "10", "1", "1", fraction_fit=1.0, fraction_evaluate=0.0,
+        min_fit_clients=10, min_available_clients=10,
+        initial_parameters=ndarrays_to_parameters([np.zeros(8, dtype=np.float32)]),
+        evaluate_fn=lambda server_round, ndarrays, config: evaluated.append(ndarrays),
+        profiling=Profiling(clock_sync_samples=0, client_warmup=False),
+    )
+    driver = FakeDriver(10)
+
+    driver_loop.run_streaming(driver, strategy, 1)
+
+    assert max(driver.pull_sizes) <= driver_loop.PULL_BATCH_SIZE
+    assert driver.max_live_replies <= driver_loop.PULL_BATCH_SIZE
+    # Stessi esempi per nodo: il modello aggregato è la media di 0 + node_id
+    np.testing.assert_allclose(evaluated[-1][0], np.full(8, 5.5))
+
+
+def test_fedbuff_damps_an_all_stale_buffer():
+    pytest.importorskip("torch")
+    from aggregation import StreamingAggregator
+    from server_app import TimedFedBuff
+
+    strategy = TimedFedBuff(1, "test-fedbuff", "4", "1", "1", buffer_size=2, staleness_exponent=0.5)
+    model = [np.zeros(8, dtype=np.float32)]
+    updates = [([np.full(8, 1.0, dtype=np.float32)], 10), ([np.full(8, 3.0, dtype=np.float32)], 30)]
+
+    def step(staleness):
+        aggregator = StreamingAggregator()
+        for ndarrays, num_examples in updates:
+            strategy.add_buffered_update(aggregator, ndarrays, model, num_examples, staleness)
+        new_model = strategy.apply_buffered_update(model, aggregator.result())
+        return np.linalg.norm(new_model[0] - model[0])
+
+    fresh, stale = step(0), step(3)
+    # Stessa staleness per tutto il buffer: il fattore non si semplifica nella media
+    assert stale < fresh
+    np.testing.assert_allclose(stale, fresh * strategy.staleness_weight(3), rtol=1e-6)
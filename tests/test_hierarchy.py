@@ -0,0 +1,207 @@
+"""Test dell'aggregazione gerarchica (edge.py) con processi reali su localhost."""
+
+import multiprocessing as mp
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from aggregation import PARTIAL_SUM_KEY
+from edge import EdgeAggregator, recv_message, send_message, serve_member
+
+NUM_PARAMS = 1000
+LEAF_GROUPS = [[0, 1, 2], [3, 4]]
+
+# fork: i processi figli ereditano sys.path con i moduli di pytorchtest
+_mp = mp.get_context("fork")
+
+
+def leaf_update(leaf_id, ndarrays):
+    """Aggiornamento deterministico di una foglia, senza training reale"""
+    rng = np.random.default_rng(leaf_id)
+    return [layer + rng.standard_normal(layer.shape).astype(np.float32) for layer in ndarrays], 100 + 10 * leaf_id
+
+
+def leaf_process(address, leaf_id):
+    serve_member(address, lambda ndarrays, config: (*leaf_update(leaf_id, ndarrays), {}))
+
+
+def edge_process(root_address, group_size, port_queue):
+    edge = EdgeAggregator(host="127.0.0.1", port=0, group_size=group_size).start()
+    port_queue.put(edge.port)
+    try:
+        serve_member(root_address, lambda ndarrays, config: edge.fit_round(ndarrays, config))
+    finally:
+        edge.close()
+
+
+def root_round(model, hierarchical):
+    """
+    Un round di fit su processi edge e foglia reali
+
+    Con hierarchical la root vede un membro per gruppo (l'edge), altrimenti
+    tutte le foglie. Restituisce le risposte (header, pesi) e i byte ricevuti
+    dalla root.
+    """
+    root = socket.create_server(("127.0.0.1", 0))
+    root.settimeout(60)
+    address = f"127.0.0.1:{root.getsockname()[1]}"
+    port_queue = _mp.Queue()
+    processes = []
+    connections = []
+    bytes_received = 0
+    try:
+        for group in LEAF_GROUPS:
+            leaf_address = address
+            if hierarchical:
+                edge = _mp.Process(target=edge_process, args=(address, len(group), port_queue))
+                edge.start()
+                processes.append(edge)
+                leaf_address = f"127.0.0.1:{port_queue.get(timeout=60)}"
+            for leaf_id in group:
+                leaf = _mp.Process(target=leaf_process, args=(leaf_address, leaf_id))
+                leaf.start()
+                processes.append(leaf)
+        num_members = len(LEAF_GROUPS) if hierarchical else sum(len(group) for group in LEAF_GROUPS)
+        for _ in range(num_members):
+            conn, _ = root.accept()
+            conn.settimeout(60)
+            connections.append(conn)
+        for conn in connections:
+            send_message(conn, "fit", model, config={})
+        replies = []
+        for conn in connections:
+            header, ndarrays, size = recv_message(conn)
+            replies.append((header, ndarrays))
+            bytes_received += size
+        for conn in connections:
+            send_message(conn, "stop")
+    finally:
+        for conn in connections:
+            conn.close()
+        root.close()
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+    return replies, bytes_received
+
+
+def test_edge_partial_sums_match_flat_fedavg(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    from flwr.common import Code, FitRes, Status, ndarrays_to_parameters, parameters_to_ndarrays
+    from flwr.server.strategy import FedAvg
+
+    import store
+    from server_app import TimedFedAvg
+
+    # I round registrati dalla strategia finiscono in un archivio temporaneo
+    monkeypatch.setattr(store, "_store", store.ExperimentStore(str(tmp_path / "experiments.db")))
+
+    rng = np.random.default_rng(42)
+    model = [rng.standard_normal(NUM_PARAMS).astype(np.float32), rng.standard_normal((4, 5)).astype(np.float32)]
+
+    def fit_res(ndarrays, num_examples, metrics):
+        return FitRes(Status(Code.OK, ""), ndarrays_to_parameters(ndarrays), num_examples, metrics)
+
+    # Gerarchia: ogni edge invia Σ n_i·w_i del proprio gruppo con il totale degli esempi
+    replies, edge_bytes = root_round(model, hierarchical=True)
+    assert len(replies) == len(LEAF_GROUPS)
+    for header, _ in replies:
+        assert header["partial"] and header["metrics"][PARTIAL_SUM_KEY] == 1
+    hierarchical = TimedFedAvg(1, "test-hierarchy", "5", "1", "1")
+    hierarchical.initialize_parameters(client_manager=None)
+    aggregated, _ = hierarchical.aggregate_fit(
+        1, [
+            (SimpleNamespace(cid=f"edge-{i}"), fit_res(ndarrays, h["num_examples"], h["metrics"]))
+            for i, (h, ndarrays) in enumerate(replies)
+        ], []
+    )
+
+    # Piatta: FedAvg di Flower sugli aggiornamenti ricevuti dalle singole foglie
+    flat_replies, flat_bytes = root_round(model, hierarchical=False)
+    flat_results = [(None, fit_res(ndarrays, h["num_examples"], {})) for h, ndarrays in flat_replies]
+    expected, _ = FedAvg().aggregate_fit(1, flat_results, [])
+
+    # Ingresso alla root: un modello per edge invece di uno per foglia
+    num_leaves = len(flat_replies)
+    assert edge_bytes < flat_bytes
+    assert edge_bytes <= 1.1 * flat_bytes * len(LEAF_GROUPS) / num_leaves
+
+    assert sum(h["num_examples"] for h, _ in replies) == sum(res.num_examples for _, res in flat_results)
+    for layer, expected_layer in zip(parameters_to_ndarrays(aggregated), parameters_to_ndarrays(expected)):
+        np.testing.assert_allclose(layer, expected_layer, rtol=1e-5, atol=1e-5)
+
+
+def start_member(address, fit_fn):
+    def run():
+        # Un membro che fallisce o perde l'edge termina come un processo caduto
+        try:
+            serve_member(address, fit_fn)
+        except (RuntimeError, OSError):
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_edge_drops_failed_members_and_keeps_aggregating():
+    edge = EdgeAggregator(host="127.0.0.1", port=0, group_size=3, round_timeout=2.0).start()
+    address = f"127.0.0.1:{edge.port}"
+    model = [np.zeros(4, dtype=np.float32)]
+    calls = {"slow": 0}
+
+    def healthy(ndarrays, config):
+        return [ndarrays[0] + 1], 10, {}
+
+    def crashing(ndarrays, config):
+        raise RuntimeError("nodo caduto")
+
+    def slow(ndarrays, config):
+        calls["slow"] += 1
+        time.sleep(5)
+        return [ndarrays[0]], 10, {}
+
+    try:
+        start_member(address, healthy)
+        start_member(address, crashing)
+        start_member(address, slow)
+        assert edge.wait_for_members(timeout=10)
+
+        start = time.time()
+        partial_sum, total_examples, metrics = edge.fit_round(model)
+        # Membro caduto e membro oltre la deadline rimossi, round chiuso con l'unica risposta
+        assert time.time() - start < 4
+        assert metrics["edge-clients"] == 1
+        assert total_examples == 10
+        np.testing.assert_allclose(partial_sum[0], np.full(4, 10.0))
+        assert len(edge.members) == 1
+
+        # I round successivi proseguono con i membri rimasti, senza attendere il gruppo completo
+        start = time.time()
+        partial_sum, total_examples, metrics = edge.fit_round(model)
+        assert time.time() - start < 2
+        assert metrics["edge-clients"] == 1
+        assert calls["slow"] == 1
+    finally:
+        edge.close()
+
+
+def test_edge_without_replies_raises():
+    edge = EdgeAggregator(host="127.0.0.1", port=0, group_size=1, round_timeout=1.0).start()
+
+    def crashing(ndarrays, config):
+        raise RuntimeError("nodo caduto")
+
+    try:
+        start_member(f"127.0.0.1:{edge.port}", crashing)
+        assert edge.wait_for_members(timeout=10)
+        with pytest.raises(ConnectionError):
+            edge.fit_round([np.zeros(4, dtype=np.float32)])
+        assert edge.members == []
+    finally:
+        edge.close()
@@ -0,0 +1,155 @@
+"""Test del sink delle metriche (metrics_sink.py) con un backend finto."""
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from metrics_sink import MetricsSink
+
+
+class FakeBackend:
+    """Backend in memoria: può bloccarsi, fallire o fallire dopo un certo numero di scritture"""
+
+    name = "fake"
+
+    def __init__(self):
+        self.batches = []
+        self.allowed_writes = None
+        self.gate = threading.Event()
+        self.gate.set()
+        self.closed = False
+
+    @property
+    def fail(self):
+        return self.allowed_writes == 0
+
+    @fail.setter
+    def fail(self, value):
+        self.allowed_writes = 0 if value else None
+
+    def write(self, records):
+        self.gate.wait()
+        if self.allowed_writes is not None:
+            if self.allowed_writes == 0:
+                raise ConnectionError("backend offline")
+            self.allowed_writes -= 1
+        self.batches.append([record["data"]["i"] for record in records])
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def received(self):
+        return [i for batch in self.batches for i in batch]
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            pytest.fail("condizione non raggiunta entro il timeout")
+        time.sleep(0.01)
+
+
+def spooled_ids(path):
+    with open(path) as f:
+        return [json.loads(line)["data"]["i"] for line in f if line.strip()]
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return str(tmp_path / "spool" / "client.jsonl")
+
+
+def test_log_never_blocks_and_queue_is_bounded(spool_path):
+    backend = FakeBackend()
+    backend.gate.clear()
+    sink = MetricsSink(backend, spool_path, queue_size=4, batch_size=1, flush_interval=0.01)
+
+    start = time.perf_counter()
+    for i in range(200):
+        sink.log({"i": i})
+    elapsed = time.perf_counter() - start
+
+    # Il thread di invio è fermo nel backend: la coda si riempie e i record in eccesso vengono scartati
+    assert elapsed < 0.5
+    assert sink.queue.qsize() <= 4
+    assert sink.dropped >= 200 - 4 - 1
+    backend.gate.set()
+    sink.close()
+    assert sink.stats()["sent"] + sink.dropped == 200
+
+
+def test_batches_and_flush_on_close(spool_path):
+    backend = FakeBackend()
+    sink = MetricsSink(backend, spool_path, batch_size=10, flush_interval=60.0)
+    for i in range(25):
+        sink.log({"i": i})
+    wait_until(lambda: len(backend.batches) == 2)
+    sink.close()
+
+    assert [len(batch) for batch in backend.batches] == [10, 10, 5]
+    assert backend.received == list(range(25))
+    assert backend.closed
+    assert sink.stats() == {"sent": 25, "spooled": 0, "dropped": 0, "queued": 0}
+    assert not os.path.exists(spool_path)
+
+
+def test_spools_while_backend_fails(spool_path):
+    backend = FakeBackend()
+    backend.fail = True
+    sink = MetricsSink(backend, spool_path, batch_size=2, flush_interval=0.01, retry_interval=60.0)
+    for i in range(5):
+        sink.log({"i": i})
+    sink.close()
+
+    assert backend.batches == []
+    assert spooled_ids(spool_path) == list(range(5))
+    assert sink.stats()["spooled"] == 5
+    assert sink.stats()["sent"] == 0
+
+
+def test_replays_spool_on_reconnect(spool_path):
+    backend = FakeBackend()
+    backend.fail = True
+    sink = MetricsSink(backend, spool_path, batch_size=3, flush_interval=0.01, retry_interval=0.0)
+    for i in range(3):
+        sink.log({"i": i})
+    wait_until(lambda: sink.spooled == 3)
+
+    backend.fail = False
+    for i in range(3, 5):
+        sink.log({"i": i})
+    sink.close()
+
+    # Lo spool arretrato viene reinviato prima dei nuovi record
+    assert backend.received == list(range(5))
+    assert not os.path.exists(spool_path)
+    assert sink.stats()["sent"] == 5
+
+
+def test_partial_replay_keeps_only_unsent_records(spool_path):
+    backend = FakeBackend()
+    backend.fail = True
+    sink = MetricsSink(backend, spool_path, batch_size=2, flush_interval=0.01, retry_interval=0.0)
+    for i in range(6):
+        sink.log({"i": i})
+    wait_until(lambda: sink.spooled == 6)
+
+    # Il backend accetta un solo blocco dello spool e poi cade di nuovo
+    backend.allowed_writes = 1
+    sink.log({"i": 6})
+    wait_until(lambda: sink.spooled == 7)
+    assert backend.received == [0, 1]
+    assert spooled_ids(spool_path) == [2, 3, 4, 5, 6]
+
+    backend.fail = False
+    sink.log({"i": 7})
+    sink.close()
+
+    assert backend.received == list(range(8))
+    assert not os.path.exists(spool_path)
+    assert sink.stats()["sent"] == 8